@@ -0,0 +1,115 @@
+"""
+Cache קצר ב-Redis לפוזיציות ולחשבון ב-Alpaca.
+
+"מה הפוזיציות שלי?" שנשאל שוב ושוב, וסריקת הבוקר שבודקת את התיק,
+קוראים מה-cache במקום לפנות ל-Alpaca בכל פעם. ה-TTL קצר (ACCOUNT_CACHE_TTL),
+וכל פקודת קנייה/מכירה מוחקת אותו (invalidate) כדי שהתשובה הבאה תהיה עדכנית.
+
+refresher אופציונלי (python account_cache.py, ראה k8s/account-refresher.yaml)
+מרענן את ה-cache כל ACCOUNT_REFRESH_INTERVAL שניות בשעות המסחר, כך
+שבזמן הזה קריאה אף פעם לא מגיעה ל-Alpaca.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime, timezone
+
+import alpaca
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL        = int(os.environ.get("ACCOUNT_CACHE_TTL", "15"))
+REFRESH_INTERVAL = float(os.environ.get("ACCOUNT_REFRESH_INTERVAL", "10"))
+
+# שעות המסחר ב-UTC, כמו ב-CronJobs — מכסה 9:30-16:00 בניו יורק גם בשעון קיץ וגם בחורף
+MARKET_OPEN  = (13, 30)
+MARKET_CLOSE = (21, 0)
+
+_redis = None
+
+
+def _client():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis(host="redis-service", port=6379, decode_responses=True)
+    return _redis
+
+
+def cache_key(kind: str, headers: dict) -> str:
+    """מפתח לפי החשבון — hash של ה-key id, לא המפתח עצמו"""
+    account_id = hashlib.sha1(headers["APCA-API-KEY-ID"].encode()).hexdigest()[:12]
+    return f"alpaca:{kind}:{account_id}"
+
+
+def fetch(kind: str, headers: dict, base_url: str):
+    """פונה ל-Alpaca ושומר ב-cache. תשובת שגיאה לא נשמרת"""
+    response = alpaca.get(f"{base_url}/v2/{kind}", headers=headers)
+    data     = response.json()
+    if response.ok:
+        try:
+            _client().setex(cache_key(kind, headers), CACHE_TTL, json.dumps(data))
+        except Exception as e:
+            logger.warning(f"כתיבה ל-cache של {kind} נכשלה: {e}")
+    return data
+
+
+def cached(kind: str, headers: dict, base_url: str):
+    try:
+        raw = _client().get(cache_key(kind, headers))
+    except Exception as e:
+        logger.warning(f"קריאה מה-cache של {kind} נכשלה: {e}")
+        raw = None
+    metrics.inc("account_cache_lookups", kind=kind, result="miss" if raw is None else "hit")
+    if raw is not None:
+        return json.loads(raw)
+    return fetch(kind, headers, base_url)
+
+
+def get_positions(headers: dict, base_url: str) -> list:
+    return cached("positions", headers, base_url)
+
+
+def get_account(headers: dict, base_url: str) -> dict:
+    return cached("account", headers, base_url)
+
+
+def invalidate(headers: dict):
+    """אחרי פקודה — הפוזיציות והמזומן השתנו"""
+    try:
+        _client().delete(cache_key("positions", headers), cache_key("account", headers))
+    except Exception as e:
+        logger.warning(f"מחיקת ה-cache של החשבון נכשלה: {e}")
+
+
+def market_open(now: datetime = None) -> bool:
+    now = now or datetime.now(timezone.utc)
+    return now.weekday() < 5 and MARKET_OPEN <= (now.hour, now.minute) < MARKET_CLOSE
+
+
+def refresh_forever():
+    """מרענן את ה-cache לכל החשבונות של הסריקה, רק בשעות המסחר"""
+    from scanner import load_accounts
+    accounts = load_accounts()
+    logger.info(f"Account refresher פעיל ל-{len(accounts)} חשבונות, כל {REFRESH_INTERVAL} שניות")
+    while True:
+        if market_open():
+            for account in accounts:
+                for kind in ("positions", "account"):
+                    try:
+                        fetch(kind, account["headers"], account["base_url"])
+                    except Exception as e:
+                        logger.warning(f"רענון {kind} ל-{account['name']} נכשל: {e}")
+            # הפוד רץ כל הזמן — שולחים מטריקות ו-spans בכל סבב ולא רק ביציאה
+            metrics.flush()
+            tracing.flush()
+        time.sleep(REFRESH_INTERVAL if market_open() else 60)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    refresh_forever()
@@ -1,10 +1,11 @@
+import tracing  # ראשון — STARTED_AT הוא תחילת ה-imports של הפוד
 import os
 import logging
 import asyncio
-import json
-from groq import Groq
-from telegram import Bot
-import redis
+import time
+import importlib
+import metrics
+import job_status
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,7 +14,6 @@ TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 CHAT_ID        = os.environ.get("CHAT_ID")
 TASK           = os.environ.get("TASK")
 ROLE           = os.environ.get("ROLE")
-GROQ_API_KEY   = os.environ.get("GROQ_API_KEY")
 
 ROLE_PROMPTS = {
     "researcher": "אתה סוכן מחקר מומחה. תחקור את הנושא ותחזיר תשובה מפורטת ומדויקת.",
@@ -21,44 +21,66 @@ ROLE_PROMPTS = {
     "summarizer": "אתה סוכן סיכום מומחה. תסכם את הטקסט בצורה קצרה וברורה."
 }
 
+# כל פוד מריץ משימה אחת — טוענים רק את המודול של ה-ROLE שנבחר.
+# groq / telegram / redis / requests נטענים בתוך המודולים רק כשבאמת צריך אותם.
+ROLE_MODULES = {
+    "analyst":  "analyst",
+    "trader":   "trader",
+    "scanner":  "scanner",
+    "snapshot": "snapshot",
+    "backtest": "backtest",
+    "exits":    "exit_engine",
+    "sweep":    "sweep"
+}
+
+
+def load_role(role: str):
+    """מחזיר את פונקציית ה-run של ה-role. סוכנים רגילים רצים מכאן (run_generic)"""
+    module = ROLE_MODULES.get(role)
+    if module is None:
+        return run_generic
+    return importlib.import_module(module).run
+
+
 async def run():
     logger.info(f"סוכן {ROLE} התעורר למשימה: {TASK}")
+    with tracing.span("import_role"):
+        role_run = load_role(ROLE)
+    imported = time.time()
+    tracing.record("imports", tracing.STARTED_AT, imported)
+    metrics.observe("agent_import_seconds", imported - tracing.STARTED_AT, role=ROLE)
 
-    if ROLE == "analyst":
-        from analyst import run as analyst_run
-        await analyst_run()
-        return
-
-    if ROLE == "trader":
-        from trader import run as trader_run
-        await trader_run()
-        return
+    status = "failed"
+    try:
+        await role_run()
+        status = "done"
+    finally:
+        await job_status.complete(status)
+        metrics.observe("agent_run_seconds", time.time() - imported, role=ROLE)
+        tracing.flush()
+        metrics.flush()
 
-    if ROLE == "scanner":
-        from scanner import run as scanner_run
-        await scanner_run()
-        return
 
-    if ROLE == "backtest":
-        from backtest import run as backtest_run
-        await backtest_run()
-        return
+async def run_generic():
+    import json
+    import redis
+    import llm
 
-    # סוכנים רגילים
     redis_client = redis.Redis(host="redis-service", port=6379, decode_responses=True)
     history      = redis_client.get(f"chat:{CHAT_ID}")
     messages     = json.loads(history) if history else []
 
-    groq_client  = Groq(api_key=GROQ_API_KEY)
     conversation = [{"role": "system", "content": ROLE_PROMPTS.get(ROLE, ROLE_PROMPTS["researcher"])}]
     conversation.extend(messages)
     conversation.append({"role": "user", "content": TASK})
 
-    response = groq_client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=conversation
+    result = await llm.stream_reply(
+        conversation,
+        CHAT_ID,
+        prefix=f"סוכן {ROLE} השלים את המשימה:\n\n",
+        stage=f"groq_{ROLE}",
+        cache_inputs=conversation[1:]
     )
-    result = response.choices[0].message.content
 
     existing          = redis_client.get(f"chat:{CHAT_ID}")
     existing_messages = json.loads(existing) if existing else []
@@ -66,11 +88,5 @@ async def run():
     existing_messages = existing_messages[-10:]
     redis_client.setex(f"chat:{CHAT_ID}", 3600, json.dumps(existing_messages))
 
-    bot = Bot(token=TELEGRAM_TOKEN)
-    await bot.send_message(
-        chat_id=CHAT_ID,
-        text=f"סוכן {ROLE} השלים את המשימה:\n\n{result}"
-    )
-
 if __name__ == "__main__":
     asyncio.run(run())
\ No newline at end of file
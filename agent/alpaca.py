@@ -0,0 +1,50 @@
+"""
+נקודת יציאה אחת לבקשות HTTP ל-Alpaca — מודדת זמן, סטטוס ו-429.
+
+requests נטען רק בבקשה הראשונה — analyst עם snapshot ב-Redis לא פונה
+ל-Alpaca בכלל ולא צריך לשלם על ה-import.
+"""
+import time
+from urllib.parse import urlparse
+
+import metrics
+import tracing
+
+
+def endpoint_of(url: str) -> str:
+    """bars / positions / account / orders — label קצר לפי ה-path"""
+    path = urlparse(url).path.rstrip("/")
+    if path.endswith("/bars"):
+        return "bars"
+    for name in ("positions", "account", "orders"):
+        if f"/v2/{name}" in path:
+            return name
+    return "other"
+
+
+def request(method: str, url: str, **kwargs) -> "requests.Response":
+    import requests
+    endpoint = endpoint_of(url)
+    start    = time.time()
+    try:
+        response = requests.request(method, url, **kwargs)
+    except requests.RequestException:
+        metrics.inc("alpaca_requests", endpoint=endpoint, status="error")
+        raise
+    finally:
+        end = time.time()
+        tracing.record("alpaca", start, end)
+        metrics.observe("alpaca_request_seconds", end - start, endpoint=endpoint)
+
+    metrics.inc("alpaca_requests", endpoint=endpoint, status=str(response.status_code))
+    if response.status_code == 429:
+        metrics.inc("alpaca_rate_limited", endpoint=endpoint)
+    return response
+
+
+def get(url: str, **kwargs) -> "requests.Response":
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> "requests.Response":
+    return request("POST", url, **kwargs)
@@ -0,0 +1,352 @@
+"""
+שרת Alpaca מקומי — מחליף את data.alpaca.markets ואת paper-api לבדיקות עומס.
+
+מצבים:
+  record  — מעביר כל בקשה ל-Alpaca האמיתי ושומר את התשובות לקובץ הקלטה
+  replay  — מגיש תשובות מקובץ ההקלטה בלי רשת, עם השהיה ושגיאות מוזרקות
+
+הרצה:
+  python alpaca_stub.py --mode record --recording session.json
+  python alpaca_stub.py --mode replay --recording session.json --latency-ms 80 --error-rate 0.05
+
+ואז בסוכנים:
+  ALPACA_DATA_URL=http://localhost:8765 ALPACA_BASE_URL=http://localhost:8765
+"""
+import os
+import re
+import json
+import time
+import uuid
+import base64
+import random
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+UPSTREAM_DATA_URL    = os.environ.get("UPSTREAM_DATA_URL", "https://data.alpaca.markets")
+UPSTREAM_TRADING_URL = os.environ.get("UPSTREAM_TRADING_URL", "https://paper-api.alpaca.markets")
+
+SINGLE_BARS_PATH = re.compile(r"^/v2/stocks/([A-Za-z.\-]+)/bars$")
+MULTI_BARS_PATH  = "/v2/stocks/bars"
+LATEST_TRADES    = "/v2/stocks/trades/latest"
+ORDER_PATH       = re.compile(r"^/v2/orders/([A-Za-z0-9\-]+)$")
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT     = 10000
+
+
+def empty_recording() -> dict:
+    return {"bars": {}, "positions": [], "account": {}, "orders": []}
+
+
+def load_recording(path: str) -> dict:
+    if not os.path.exists(path):
+        return empty_recording()
+    with open(path) as f:
+        data = json.load(f)
+    recording = empty_recording()
+    recording.update(data)
+    return recording
+
+
+def save_recording(path: str, recording: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(recording, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def encode_page_token(offset: int) -> str:
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+
+def decode_page_token(token: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(token.encode()).decode())
+    except Exception:
+        return 0
+
+
+def merge_bars(existing: list, new: list) -> list:
+    """ממזג נרות לפי timestamp — בלי כפילויות, ממוין"""
+    by_time = {bar["t"]: bar for bar in existing}
+    for bar in new:
+        by_time[bar["t"]] = bar
+    return [by_time[t] for t in sorted(by_time)]
+
+
+def filter_bars(bars: list, start: str, end: str) -> list:
+    """מסנן נרות לטווח תאריכים — השוואה לפי prefix כמו ב-Alpaca (start/end כוללים)"""
+    result = bars
+    if start:
+        result = [b for b in result if b["t"][:len(start)] >= start]
+    if end:
+        result = [b for b in result if b["t"][:len(end)] <= end]
+    return result
+
+
+class StubState:
+    """מצב השרת — ההקלטה, הגדרות השהיה/שגיאות ונעילה לכתיבה"""
+
+    def __init__(self, mode: str, recording_path: str, latency_ms: float, jitter_ms: float,
+                 error_rate: float, error_status: int):
+        self.mode           = mode
+        self.recording_path = recording_path
+        self.recording      = load_recording(recording_path)
+        self.latency_ms     = latency_ms
+        self.jitter_ms      = jitter_ms
+        self.error_rate     = error_rate
+        self.error_status   = error_status
+        self.lock           = threading.Lock()
+
+    def persist(self):
+        with self.lock:
+            save_recording(self.recording_path, self.recording)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+
+    # --- תשתית ---
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
+
+    def send_json(self, status: int, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def inject_faults(self) -> bool:
+        """מדמה השהיית רשת ושגיאות. מחזיר True אם נשלחה שגיאה"""
+        state = self.state
+        delay = state.latency_ms + random.uniform(-state.jitter_ms, state.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if state.error_rate > 0 and random.random() < state.error_rate:
+            if state.error_status == 429:
+                self.send_json(429, {"code": 42910000, "message": "too many requests."})
+            else:
+                self.send_json(state.error_status, {"code": 50010000, "message": "injected error"})
+            return True
+        return False
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def dispatch(self, method: str):
+        if self.state.mode == "record":
+            self.proxy(method)
+            return
+        if self.inject_faults():
+            return
+
+        parsed = urlparse(self.path)
+        query  = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        path   = parsed.path.rstrip("/")
+
+        single = SINGLE_BARS_PATH.match(path)
+        order  = ORDER_PATH.match(path)
+
+        if method == "GET" and single:
+            self.replay_single_bars(single.group(1).upper(), query)
+        elif method == "GET" and path == MULTI_BARS_PATH:
+            self.replay_multi_bars(query)
+        elif method == "GET" and path == LATEST_TRADES:
+            self.replay_latest_trades(query)
+        elif method == "GET" and path == "/v2/positions":
+            self.send_json(200, self.state.recording["positions"])
+        elif method == "GET" and path == "/v2/account":
+            self.send_json(200, self.state.recording["account"])
+        elif method == "GET" and path == "/v2/orders":
+            self.send_json(200, self.state.recording["orders"])
+        elif method == "GET" and order:
+            self.replay_get_order(order.group(1))
+        elif method == "POST" and path == "/v2/orders":
+            self.replay_submit_order()
+        else:
+            self.send_json(404, {"message": f"not found: {method} {path}"})
+
+    # --- replay ---
+
+    def symbol_bars(self, symbol: str, query: dict) -> list:
+        timeframe = query.get("timeframe", "1Day")
+        bars      = self.state.recording["bars"].get(symbol, {}).get(timeframe, [])
+        return filter_bars(bars, query.get("start"), query.get("end"))
+
+    def page_limit(self, query: dict) -> int:
+        return max(1, min(int(query.get("limit", DEFAULT_LIMIT)), MAX_LIMIT))
+
+    def replay_single_bars(self, symbol: str, query: dict):
+        bars   = self.symbol_bars(symbol, query)
+        limit  = self.page_limit(query)
+        offset = decode_page_token(query["page_token"]) if query.get("page_token") else 0
+        page   = bars[offset:offset + limit]
+        token  = encode_page_token(offset + limit) if offset + limit < len(bars) else None
+        self.send_json(200, {"bars": page, "symbol": symbol, "next_page_token": token})
+
+    def replay_multi_bars(self, query: dict):
+        # ב-Alpaca ה-limit בבקשה מרובת מניות חל על סך כל הנרות, לפי סדר המניות
+        symbols = [s.strip().upper() for s in query.get("symbols", "").split(",") if s.strip()]
+        flat    = [(symbol, bar) for symbol in sorted(symbols) for bar in self.symbol_bars(symbol, query)]
+        limit   = self.page_limit(query)
+        offset  = decode_page_token(query["page_token"]) if query.get("page_token") else 0
+
+        page = {}
+        for symbol, bar in flat[offset:offset + limit]:
+            page.setdefault(symbol, []).append(bar)
+        token = encode_page_token(offset + limit) if offset + limit < len(flat) else None
+        self.send_json(200, {"bars": page, "next_page_token": token})
+
+    def replay_latest_trades(self, query: dict):
+        """העסקה האחרונה = סגירת הנר היומי האחרון שהוקלט"""
+        trades = {}
+        for symbol in (s.strip().upper() for s in query.get("symbols", "").split(",") if s.strip()):
+            bars = self.state.recording["bars"].get(symbol, {}).get("1Day", [])
+            if bars:
+                trades[symbol] = {"t": bars[-1]["t"], "p": bars[-1]["c"], "s": 100}
+        self.send_json(200, {"trades": trades})
+
+    def replay_get_order(self, order_id: str):
+        for order in self.state.recording["orders"]:
+            if order.get("id") == order_id:
+                self.send_json(200, order)
+                return
+        self.send_json(404, {"code": 40410000, "message": "order not found"})
+
+    def replay_submit_order(self):
+        try:
+            body = json.loads(self.read_body() or b"{}")
+        except json.JSONDecodeError:
+            self.send_json(422, {"code": 42210000, "message": "invalid json"})
+            return
+        if not body.get("symbol") or not body.get("qty") or body.get("side") not in ("buy", "sell"):
+            self.send_json(422, {"code": 42210000, "message": "symbol, qty and side are required"})
+            return
+
+        now   = datetime.now(timezone.utc).isoformat()
+        order = {
+            "id":            str(uuid.uuid4()),
+            "client_order_id": str(uuid.uuid4()),
+            "created_at":    now,
+            "submitted_at":  now,
+            "symbol":        body["symbol"].upper(),
+            "qty":           str(body["qty"]),
+            "side":          body["side"],
+            "type":          body.get("type", "market"),
+            "time_in_force": body.get("time_in_force", "day"),
+            "status":        "accepted"
+        }
+        with self.state.lock:
+            self.state.recording["orders"].append(order)
+        self.send_json(200, order)
+
+    # --- record ---
+
+    def proxy(self, method: str):
+        parsed   = urlparse(self.path)
+        upstream = UPSTREAM_DATA_URL if parsed.path.startswith("/v2/stocks") else UPSTREAM_TRADING_URL
+        headers  = {k: v for k, v in self.headers.items() if k.lower().startswith("apca-") or k.lower() == "content-type"}
+        body     = self.read_body()
+
+        import requests  # נדרש רק במצב הקלטה — replay רץ על ספריה סטנדרטית בלבד
+        try:
+            response = requests.request(method, f"{upstream}{self.path}", headers=headers, data=body or None, timeout=30)
+        except requests.RequestException as e:
+            logger.error(f"שגיאה בהעברה ל-{upstream}: {e}")
+            self.send_json(502, {"message": str(e)})
+            return
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+
+        if response.ok and data is not None:
+            self.record(method, parsed, data)
+
+        self.send_response(response.status_code)
+        self.send_header("Content-Type", response.headers.get("Content-Type", "application/json"))
+        self.send_header("Content-Length", str(len(response.content)))
+        self.end_headers()
+        self.wfile.write(response.content)
+
+    def record(self, method: str, parsed, data):
+        path      = parsed.path.rstrip("/")
+        query     = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        timeframe = query.get("timeframe", "1Day")
+        recording = self.state.recording
+        single    = SINGLE_BARS_PATH.match(path)
+
+        with self.state.lock:
+            if method == "GET" and single:
+                symbol = single.group(1).upper()
+                frames = recording["bars"].setdefault(symbol, {})
+                frames[timeframe] = merge_bars(frames.get(timeframe, []), data.get("bars") or [])
+            elif method == "GET" and path == MULTI_BARS_PATH:
+                for symbol, bars in (data.get("bars") or {}).items():
+                    frames = recording["bars"].setdefault(symbol, {})
+                    frames[timeframe] = merge_bars(frames.get(timeframe, []), bars)
+            elif method == "GET" and path == "/v2/positions":
+                recording["positions"] = data
+            elif method == "GET" and path == "/v2/account":
+                recording["account"] = data
+            elif method == "POST" and path == "/v2/orders":
+                recording["orders"].append(data)
+            else:
+                return
+        self.state.persist()
+        logger.info(f"הוקלט: {method} {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="שרת Alpaca מקומי עם הקלטה והשמעה")
+    parser.add_argument("--mode",         choices=["record", "replay"], default="replay")
+    parser.add_argument("--recording",    default="alpaca_recording.json")
+    parser.add_argument("--host",         default="0.0.0.0")
+    parser.add_argument("--port",         type=int,   default=8765)
+    parser.add_argument("--latency-ms",   type=float, default=0, help="השהיה ממוצעת לכל בקשה")
+    parser.add_argument("--jitter-ms",    type=float, default=0, help="סטייה אקראית סביב ההשהיה")
+    parser.add_argument("--error-rate",   type=float, default=0, help="הסתברות לשגיאה מוזרקת (0-1)")
+    parser.add_argument("--error-status", type=int,   default=429, help="קוד השגיאה המוזרקת")
+    args = parser.parse_args()
+
+    StubHandler.state = StubState(
+        mode=args.mode,
+        recording_path=args.recording,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status
+    )
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    logger.info(f"Alpaca stub עלה | mode={args.mode} | {args.host}:{args.port} | recording={args.recording}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
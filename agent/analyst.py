@@ -1,10 +1,14 @@
 import os
+import re
 import json
 import asyncio
 import logging
-from groq import Groq
-from telegram import Bot
-import requests
+import outbox
+import bar_loader
+import llm
+import metrics
+import strategy
+from bar_loader import Bars
 from datetime import datetime, timedelta
 
 logging.basicConfig(level=logging.INFO)
@@ -13,118 +17,230 @@ logger = logging.getLogger(__name__)
 TELEGRAM_TOKEN    = os.environ.get("TELEGRAM_TOKEN")
 CHAT_ID           = os.environ.get("CHAT_ID")
 TASK              = os.environ.get("TASK")
-GROQ_API_KEY      = os.environ.get("GROQ_API_KEY")
-ALPACA_API_KEY    = os.environ.get("ALPACA_API_KEY")
-ALPACA_SECRET_KEY = os.environ.get("ALPACA_SECRET_KEY")
 
+MAX_TICKERS  = 10
+SIGNAL_EMOJI = {"BUY": "🟢", "SELL": "🔴", "HOLD": "🟡"}
+
+SNAPSHOT_NUMERIC = ("current_price", "change_pct", "rsi", "ma7", "ma20", "macd", "macd_signal", "close")
+
+_redis = None
+
+
+def _client():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis(host="redis-service", port=6379, decode_responses=True)
+    return _redis
+
+
+def read_snapshots(symbols: list) -> dict:
+    """
+    קורא את ה-snapshots שה-job הלילי חישב (ראה snapshot.py) וסופר את הבקשות
+    לטובת רשימת המניות המבוקשות — הכל ב-round trip אחד לכל המניות.
+    מחזיר {symbol: snapshot} רק למניות שנמצאו.
+    """
+    try:
+        pipe = _client().pipeline(transaction=False)
+        for symbol in symbols:
+            pipe.zincrby("analyst:requests", 1, symbol)
+            pipe.hgetall(f"snapshot:{symbol}")
+        results = pipe.execute()[1::2]
+    except Exception as e:
+        logger.warning(f"קריאת snapshot נכשלה: {e}")
+        return {}
+
+    found = {}
+    for symbol, snapshot in zip(symbols, results):
+        if not snapshot or "current_price" not in snapshot:
+            metrics.inc("snapshot_lookups", result="miss")
+            continue
+        metrics.inc("snapshot_lookups", result="hit")
+        for field in SNAPSHOT_NUMERIC:
+            if field in snapshot:
+                snapshot[field] = float(snapshot[field])
+        found[symbol] = snapshot
+    return found
+
+
+def fetch_bars_batch(symbols: list, days: int = 120) -> dict:
+    """
+    {symbol: Bars} לכמה מניות בבקשת multi-symbol אחת (עם דפדוף).
+    120 ימים אחורה — מספיק ל-MACD (26 + 9) ול-MA20.
+    """
+    start_date = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    return bar_loader.load_daily_bars(symbols, start_date)
+
+
+def compute_indicators(symbol: str, bars: Bars, values: dict = None) -> dict:
+    """
+    האינדיקטורים והסיגנל בנר האחרון. values — השורה של המניה מ-strategy.latest,
+    אם כבר חושבה יחד עם מניות אחרות (compute_all)
+    """
+    if values is None:
+        values = strategy.latest({symbol: bars})[symbol]
+    macd, macd_signal = calculate_macd(bars.c)
 
-def get_stock_data(symbol: str) -> dict:
-    headers = {
-        "APCA-API-KEY-ID": ALPACA_API_KEY,
-        "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
+    return {
+        "symbol":        symbol,
+        "current_price": round(values["close"], 2),
+        "change_pct":    round(values["change_pct"], 2),
+        "rsi":           round(values["rsi"], 2),
+        "ma7":           round(values["ma7"], 2),
+        "ma20":          round(values["ma20"], 2),
+        "macd":          round(float(macd), 3),
+        "macd_signal":   round(float(macd_signal), 3),
+        "signal":        values["signal"]
     }
-    # תאריך התחלה — 60 ימים אחורה
-    start_date = (datetime.now() - timedelta(days=60)).strftime("%Y-%m-%d")
-    
-    url    = f"https://data.alpaca.markets/v2/stocks/{symbol}/bars"
-    params = {"timeframe": "1Day", "limit": 30, "start": start_date}
-
-    response = requests.get(url, headers=headers, params=params)
-    data     = response.json()
-    bars     = data.get("bars", [])
-
-    if not bars:
-        return {"error": f"לא נמצאו נתונים עבור {symbol}"}
-
-    closes        = [bar["c"] for bar in bars]
-    rsi           = calculate_rsi(closes)
-    ma7           = sum(closes[-7:])  / min(7,  len(closes))
-    ma20          = sum(closes[-20:]) / min(20, len(closes))
-    current_price = closes[-1]
-    prev_price    = closes[-2] if len(closes) > 1 else current_price
-    change_pct    = ((current_price - prev_price) / prev_price) * 100
 
+
+def compute_all(bars_by_symbol: dict) -> dict:
+    """compute_indicators לכל המניות עם נרות — הערכה אחת של האסטרטגיה על כולן"""
+    latest = strategy.latest(bars_by_symbol)
+    return {symbol: compute_indicators(symbol, bars_by_symbol[symbol], values) for symbol, values in latest.items()}
+
+
+def analysis_cache_inputs(stocks: list) -> dict:
+    """מה שהניתוח תלוי בו — אותן מניות, אותו יום, אותם אינדיקטורים (מעוגלים ב-llm_cache)"""
+    fields = ("symbol", "current_price", "change_pct", "rsi", "ma7", "ma20", "macd", "macd_signal", "signal")
     return {
-        "symbol":        symbol,
-        "current_price": round(current_price, 2),
-        "change_pct":    round(change_pct, 2),
-        "rsi":           round(rsi, 2),
-        "ma7":           round(ma7, 2),
-        "ma20":          round(ma20, 2),
-        "signal":        get_signal(rsi, ma7, ma20, current_price)
+        "date":   datetime.now().strftime("%Y-%m-%d"),
+        "stocks": [{field: stock.get(field) for field in fields} for stock in stocks]
     }
 
 
-def calculate_rsi(closes: list, period: int = 14) -> float:
-    if len(closes) < period + 1:
-        return 50.0
-    gains, losses = [], []
-    for i in range(1, len(closes)):
-        diff = closes[i] - closes[i-1]
-        gains.append(max(diff, 0))
-        losses.append(max(-diff, 0))
-    avg_gain = sum(gains[-period:]) / period
-    avg_loss = sum(losses[-period:]) / period
-    if avg_loss == 0:
-        return 100.0
-    rs = avg_gain / avg_loss
-    return 100 - (100 / (1 + rs))
-
-
-def get_signal(rsi: float, ma7: float, ma20: float, price: float) -> str:
-    if rsi < 30 and ma7 > ma20:
-        return "BUY"
-    elif rsi > 70 and ma7 < ma20:
-        return "SELL"
-    else:
-        return "HOLD"
+def get_stocks_data(symbols: list) -> dict:
+    """
+    נתונים לכל המניות: קודם snapshots, ואת החסרות שולפים מ-Alpaca
+    בבקשה אחת ומחשבים יחד. מניה בלי נתונים מקבלת {"error": ...}
+    """
+    data    = read_snapshots(symbols)
+    missing = [symbol for symbol in symbols if symbol not in data]
+    if missing:
+        computed = compute_all(fetch_bars_batch(missing))
+        for symbol in missing:
+            data[symbol] = computed.get(symbol) or {"error": f"לא נמצאו נתונים עבור {symbol}"}
+    return data
 
 
-async def run():
-    logger.info(f"Analyst agent התעורר למשימה: {TASK}")
-    groq_client = Groq(api_key=GROQ_API_KEY)
+def get_stock_data(symbol: str) -> dict:
+    return get_stocks_data([symbol])[symbol]
 
-    # חילוץ שם המניה
-    extract_response = groq_client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[
-            {"role": "system", "content": "Extract only the stock ticker symbol from the text. Return ONLY the ticker in uppercase, nothing else. Example: AAPL"},
-            {"role": "user", "content": TASK}
-        ],
-        max_tokens=10
-    )
-    symbol = extract_response.choices[0].message.content.strip().upper()
-    logger.info(f"מנתח מניה: {symbol}")
 
-    stock_data = get_stock_data(symbol)
+def calculate_ema(values: list, period: int) -> list:
+    k   = 2 / (period + 1)
+    ema = values[0]
+    out = [ema]
+    for value in values[1:]:
+        ema = value * k + ema * (1 - k)
+        out.append(ema)
+    return out
 
-    if "error" in stock_data:
-        message = f"❌ {stock_data['error']}"
-    else:
-        analysis_response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": "אתה אנליסט מניות מומחה. נתח את הנתונים ותן המלצה ברורה. ענה בעברית."},
-                {"role": "user", "content": f"נתח את המניה {symbol} על בסיס הנתונים: {json.dumps(stock_data, ensure_ascii=False)}"}
-            ],
-            max_tokens=500
-        )
-        analysis      = analysis_response.choices[0].message.content
-        signal_emoji  = {"BUY": "🟢", "SELL": "🔴", "HOLD": "🟡"}.get(stock_data["signal"], "⚪")
 
-        message = f"""📊 *ניתוח {symbol}*
+def calculate_macd(closes: list, fast: int = 12, slow: int = 26, signal: int = 9) -> tuple:
+    """מחזיר (MACD, קו סיגנל). 0,0 אם אין מספיק נתונים"""
+    if len(closes) < slow + signal:
+        return 0.0, 0.0
+    fast_ema    = calculate_ema(closes, fast)
+    slow_ema    = calculate_ema(closes, slow)
+    macd_line   = [f - s for f, s in zip(fast_ema, slow_ema)][slow - 1:]
+    signal_line = calculate_ema(macd_line, signal)
+    return macd_line[-1], signal_line[-1]
+
+
+def parse_tickers(text: str) -> list:
+    """AAPL, MSFT ,nvda → ["AAPL", "MSFT", "NVDA"] — בלי כפילויות, עד MAX_TICKERS"""
+    tickers = []
+    for token in re.findall(r"[A-Za-z][A-Za-z.]{0,5}", text):
+        ticker = token.upper()
+        if ticker not in tickers:
+            tickers.append(ticker)
+    return tickers[:MAX_TICKERS]
+
+
+def single_header(stock_data: dict) -> str:
+    signal_emoji = SIGNAL_EMOJI.get(stock_data["signal"], "⚪")
+    return f"""📊 *ניתוח {stock_data['symbol']}*
 
 💰 מחיר: ${stock_data['current_price']}
 📈 שינוי: {stock_data['change_pct']}%
 📉 RSI: {stock_data['rsi']}
 📊 MA7: ${stock_data['ma7']} | MA20: ${stock_data['ma20']}
+📐 MACD: {stock_data['macd']} | Signal: {stock_data['macd_signal']}
 
 {signal_emoji} *סיגנל: {stock_data['signal']}*
 
-{analysis}"""
+"""
+
+
+def comparison_header(stocks: list) -> str:
+    """טבלה אחת לכל המניות — בתוך בלוק קוד כדי שהעמודות יישארו מיושרות"""
+    rows = [f"{'':<6}{'Price':>9}{'Chg%':>7}{'RSI':>6}{'MA7>20':>7}{'MACD':>8}  Sig"]
+    for stock in stocks:
+        trend = "yes" if stock["ma7"] > stock["ma20"] else "no"
+        rows.append(
+            f"{stock['symbol']:<6}{stock['current_price']:>9.2f}{stock['change_pct']:>7.2f}"
+            f"{stock['rsi']:>6.1f}{trend:>7}{stock['macd']:>8.2f}  {stock['signal']}"
+        )
+    table = "\n".join(rows)
+    return f"📊 *השוואת {len(stocks)} מניות*\n\n```\n{table}\n```\n\n"
+
+
+async def run():
+    logger.info(f"Analyst agent התעורר למשימה: {TASK}")
+
+    # חילוץ שמות המניות — אחת או יותר
+    extracted = llm.complete(
+        messages=[
+            {"role": "system", "content": "Extract all stock ticker symbols from the text. Return ONLY the tickers in uppercase, separated by commas, nothing else. Example: AAPL,MSFT"},
+            {"role": "user", "content": TASK}
+        ],
+        max_tokens=60,
+        stage="groq_extract",
+        cache_inputs={"task": TASK},
+        cache_ttl=7 * 24 * 60 * 60
+    )
+    symbols = parse_tickers(extracted)
+    logger.info(f"מנתח מניות: {symbols}")
+
+    if not symbols:
+        await outbox.send(CHAT_ID, "❌ לא מצאתי סימול מניה בהודעה.")
+        return
+
+    data   = get_stocks_data(symbols)
+    errors = [data[symbol]["error"] for symbol in symbols if "error" in data[symbol]]
+    stocks = [data[symbol] for symbol in symbols if "error" not in data[symbol]]
 
-    bot = Bot(token=TELEGRAM_TOKEN)
-    await bot.send_message(chat_id=CHAT_ID, text=message, parse_mode="Markdown")
+    if not stocks:
+        await outbox.send(CHAT_ID, "\n".join(f"❌ {error}" for error in errors), parse_mode="Markdown")
+        return
+
+    if len(stocks) == 1:
+        header = single_header(stocks[0])
+        prompt = f"נתח את המניה {stocks[0]['symbol']} על בסיס הנתונים: {json.dumps(stocks[0], ensure_ascii=False)}"
+        system = "אתה אנליסט מניות מומחה. נתח את הנתונים ותן המלצה ברורה. ענה בעברית."
+    else:
+        header = comparison_header(stocks)
+        prompt = f"השווה בין המניות על בסיס הנתונים: {json.dumps(stocks, ensure_ascii=False)}"
+        system = ("אתה אנליסט מניות מומחה. השווה בין המניות, דרג אותן מהחזקה לחלשה "
+                  "ותן המלצה ברורה לכל אחת במשפט או שניים. ענה בעברית.")
+    if errors:
+        header += "\n".join(f"⚠️ {error}" for error in errors) + "\n\n"
+
+    # הנתונים מוצגים מיד, והניתוח של המודל נכתב לתוך אותה הודעה תוך כדי יצירה
+    await llm.stream_reply(
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt}
+        ],
+        chat_id=CHAT_ID,
+        prefix=header,
+        max_tokens=500 if len(stocks) == 1 else min(1500, 250 * len(stocks)),
+        stage="groq_analysis",
+        parse_mode="Markdown",
+        cache_inputs=analysis_cache_inputs(stocks),
+        cache_ttl=12 * 60 * 60
+    )
     logger.info("ניתוח נשלח!")
 
 
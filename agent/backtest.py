@@ -1,11 +1,20 @@
 import os
 import json
+import time
 import asyncio
 import logging
-import requests
-from datetime import datetime, timedelta
-from groq import Groq
-from telegram import Bot
+import numpy as np
+import bar_loader
+import exits
+import llm
+import risk
+import metrics
+import strategy
+from bar_loader import Bars
+from strategy import WATCHLIST
+from datetime import datetime
+from tracing import span
+import outbox
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,124 +22,105 @@ logger = logging.getLogger(__name__)
 TELEGRAM_TOKEN    = os.environ.get("TELEGRAM_TOKEN")
 CHAT_ID           = os.environ.get("CHAT_ID")
 TASK              = os.environ.get("TASK", "backtest")
-GROQ_API_KEY      = os.environ.get("GROQ_API_KEY")
 ALPACA_API_KEY    = os.environ.get("ALPACA_API_KEY")
 ALPACA_SECRET_KEY = os.environ.get("ALPACA_SECRET_KEY")
+ALPACA_DATA_URL   = os.environ.get("ALPACA_DATA_URL", "https://data.alpaca.markets")
 
 HEADERS = {
     "APCA-API-KEY-ID": ALPACA_API_KEY,
     "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
 }
 
-WATCHLIST = [
-    "AAPL", "MSFT", "GOOGL", "AMZN", "NVDA",
-    "META", "TSLA", "AMD",  "NFLX", "CRM",
-    "SHOP", "SQ",   "COIN", "PLTR", "UBER",
-    "SNAP", "SPOT", "ZM",   "RBLX", "PYPL"
-]
-
-
-def get_historical_bars(symbol: str, start: str, end: str) -> list:
-    """שולף נתונים היסטוריים מ-Alpaca"""
-    url    = f"https://data.alpaca.markets/v2/stocks/{symbol}/bars"
-    params = {"timeframe": "1Day", "start": start, "end": end, "limit": 1000, "feed": "iex"}
-    response = requests.get(url, headers=HEADERS, params=params)
-    data     = response.json()
-    return data.get("bars", [])
-
-
-def calculate_rsi(closes: list, period: int = 14) -> float:
-    if len(closes) < period + 1:
-        return 50.0
-    gains, losses = [], []
-    for i in range(1, len(closes)):
-        diff = closes[i] - closes[i-1]
-        gains.append(max(diff, 0))
-        losses.append(max(-diff, 0))
-    avg_gain = sum(gains[-period:]) / period
-    avg_loss = sum(losses[-period:]) / period
-    if avg_loss == 0:
-        return 100.0
-    rs = avg_gain / avg_loss
-    return 100 - (100 / (1 + rs))
-
-
-def score_stock(closes: list, volumes: list) -> int:
-    """מחשב ציון הזדמנות — אותה לוגיקה כמו Scanner"""
-    if len(closes) < 20:
-        return 0
-
-    rsi    = calculate_rsi(closes)
-    ma7    = sum(closes[-7:])  / 7
-    ma20   = sum(closes[-20:]) / 20
-    change = ((closes[-1] - closes[-2]) / closes[-2]) * 100
-    avg_vol = sum(volumes[-10:]) / 10
-    vol_ratio = volumes[-1] / avg_vol if avg_vol > 0 else 1
-
-    score = 0
-    if 35 <= rsi <= 50:
-        score += 30
-    elif 30 <= rsi <= 35:
-        score += 20
-    if ma7 > ma20:
-        score += 25
-    if vol_ratio > 1.5:
-        score += 20
-    if 0 < change < 3:
-        score += 25
-
-    return score
-
-
-
-def is_market_bullish_on_date(all_spy_bars: list, date_str: str) -> bool:
-    """בודק אם השוק היה חיובי בתאריך מסוים"""
-    bars_until = [b for b in all_spy_bars if b["t"][:10] <= date_str]
-    if len(bars_until) < 20:
-        return True
-    closes  = [b["c"] for b in bars_until]
-    ma20    = sum(closes[-20:]) / 20
-    current = closes[-1]
-    return current > ma20
-
-
-def run_backtest(start_date: str, end_date: str, initial_capital: float = 100000) -> dict:
+# "הרץ backtest תוך-יומי" → נרות דקה (intraday_backtest.py) במקום נרות יומיים
+INTRADAY_WORDS = ("intraday", "תוך יומי", "תוך-יומי", "דקה", "דקות")
+# "הרץ sweep" → הרבה קונפיגורציות במקביל על Indexed Job (sweep.py)
+SWEEP_WORDS    = ("sweep", "סוויפ", "אופטימיזציה")
+
+# כללי התיק — משותפים ל-backtest היומי ול-intraday (intraday_backtest.py)
+MIN_SCORE      = strategy.STRATEGY["min_score"]   # ציון מינימלי לקנייה
+MAX_POSITIONS  = 5
+BUYS_PER_DAY   = 2
+POSITION_PCT   = 0.15   # מההון הפנוי לכל קנייה
+MIN_CASH_PCT   = 0.1    # לא קונים מתחת ל-10% מההון ההתחלתי
+
+# כל מה ש-run_backtest מקבל ב-params (sweep.py משנה אותם) — כללי התיק וכללי היציאה
+DEFAULT_PARAMS = {
+    "min_score":     MIN_SCORE,
+    "max_positions": MAX_POSITIONS,
+    "buys_per_day":  BUYS_PER_DAY,
+    "position_pct":  POSITION_PCT,
+    **strategy.STRATEGY["exits"]
+}
+
+
+def get_historical_bars(symbol: str, start: str, end: str) -> Bars:
+    """שולף נתונים היסטוריים מ-Alpaca — כל הדפים, לא רק 1000 הראשונים"""
+    return load_history([symbol], start, end).get(symbol, Bars.empty())
+
+
+def load_history(symbols: list, start: str, end: str) -> dict:
+    """{symbol: Bars} לכל המניות בבקשת multi-symbol אחת, עם דפדוף"""
+    return bar_loader.load_daily_bars(symbols, start, end, feed="iex")
+
+
+def market_filter(spy_bars: Bars) -> np.ndarray:
+    """לכל נר של SPY — האם השוק חיובי (פילטר השוק של strategy.py)"""
+    return strategy.evaluate_bars({"SPY": spy_bars}).get("SPY", {}).get("market", np.ones(0, dtype=bool))
+
+
+def is_market_bullish_on_date(spy_bars: Bars, market: np.ndarray, day: int) -> bool:
+    """בודק אם השוק היה חיובי בתאריך מסוים (epoch-day). לפני הנר הראשון — חיובי"""
+    index = int(np.searchsorted(spy_bars.t, day, side="right")) - 1
+    return bool(market[index]) if index >= 0 else True
+
+
+def run_backtest(start_date: str, end_date: str, initial_capital: float = 100000, risk_check: bool = True,
+                 params: dict = None, history: dict = None) -> dict:
     """
-    מריץ backtest על כל ה-watchlist בין start_date ל-end_date
+    מריץ backtest על כל ה-watchlist בין start_date ל-end_date.
+    risk_check — אותה בדיקת קורלציה כמו בסריקת הבוקר (risk.py) לפני כל קנייה
+    params     — דריסה של DEFAULT_PARAMS
+    history    — {symbol: Bars} שכבר נטענו (sweep), אחרת נטען מ-Alpaca
     """
     logger.info(f"מריץ backtest: {start_date} → {end_date}")
+    params = {**DEFAULT_PARAMS, **(params or {})}
 
-    # טעינת נתוני SPY לפילטר שוק
-    spy_bars = get_historical_bars("SPY", start_date, end_date)
+    # שלב 1: הורדת כל הנתונים, כולל SPY לפילטר שוק
+    if history is None:
+        history = load_history(WATCHLIST + ["SPY"], start_date, end_date)
+    spy_bars = history.get("SPY", Bars.empty())
 
-    # שלב 1: הורדת כל הנתונים
     all_data = {}
     for symbol in WATCHLIST:
-        bars = get_historical_bars(symbol, start_date, end_date)
+        bars = history.get(symbol, Bars.empty())
         if len(bars) >= 30:
             all_data[symbol] = bars
 
     if not all_data:
         return {"error": "לא נמצאו נתונים"}
 
+    # הציונים של כל המניות בכל הימים בהערכה אחת של strategy.py — בלולאה רק שולפים
+    scores = {symbol: values["score"] for symbol, values in strategy.evaluate_bars(all_data).items()}
+    market = market_filter(spy_bars)
+
     # שלב 2: סימולציה יום אחרי יום
     capital       = initial_capital
     positions     = {}   # symbol → {qty, buy_price, buy_date}
     trades        = []   # היסטוריית עסקאות
     daily_capital = []   # לגרף
 
-    # מוצאים את כל התאריכים הייחודיים
-    all_dates = set()
-    for bars in all_data.values():
-        for bar in bars:
-            all_dates.add(bar["t"][:10])
-    all_dates = sorted(all_dates)
+    risk_model = risk.RollingCovariance(list(all_data))
+
+    # מוצאים את כל התאריכים הייחודיים (epoch-day)
+    all_days = np.unique(np.concatenate([bars.t for bars in all_data.values()]))
+
+    for day in all_days:
+        date_str = bar_loader.day_str(day)
 
-    for date_str in all_dates:
-        # בנה snapshot של נתונים עד היום הזה
+        # בנה snapshot של נתונים עד היום הזה — views, בלי להעתיק נרות
         day_data = {}
         for symbol, bars in all_data.items():
-            bars_until_today = [b for b in bars if b["t"][:10] <= date_str]
+            bars_until_today = bars.until(day)
             if len(bars_until_today) >= 20:
                 day_data[symbol] = bars_until_today
 
@@ -138,20 +128,19 @@ def run_backtest(start_date: str, end_date: str, initial_capital: float = 100000
         for symbol in list(positions.keys()):
             if symbol not in day_data:
                 continue
-            current_price = day_data[symbol][-1]["c"]
+            current_price = float(day_data[symbol].c[-1])
             buy_price     = positions[symbol]["buy_price"]
             pl_pct        = ((current_price - buy_price) / buy_price) * 100
-            days_held     = (datetime.strptime(date_str, "%Y-%m-%d") -
-                             datetime.strptime(positions[symbol]["buy_date"], "%Y-%m-%d")).days
 
-            # מכור: רווח > 15% או הפסד > 10% או החזקה > 10 ימים
-            should_sell = pl_pct >= 15 or pl_pct <= -10 or days_held >= 10
+            # אותם כללים כמו המסחר החי (exits.py): take profit, stop loss, trailing stop, timeout
+            state = positions[symbol]["exit"]
+            exits.update(state, current_price)
+            reason = exits.check_exit(state, current_price, date_str, params)
 
-            if should_sell:
+            if reason:
                 qty        = positions[symbol]["qty"]
                 sell_value = qty * current_price
                 capital   += sell_value
-                reason     = "take_profit" if pl_pct >= 15 else ("stop_loss" if pl_pct <= -10 else "timeout")
 
                 trades.append({
                     "symbol":     symbol,
@@ -165,40 +154,57 @@ def run_backtest(start_date: str, end_date: str, initial_capital: float = 100000
                 del positions[symbol]
 
         # סרוק הזדמנויות חדשות (רק אם יש מספיק הון והשוק חיובי)
-        market_ok = is_market_bullish_on_date(spy_bars, date_str)
-        if market_ok and capital > initial_capital * 0.1 and len(positions) < 5:
+        market_ok = is_market_bullish_on_date(spy_bars, market, day)
+        if market_ok and can_buy(capital, initial_capital, positions, params["max_positions"]):
             candidates = []
             for symbol, bars in day_data.items():
                 if symbol in positions:
                     continue
-                closes  = [b["c"] for b in bars]
-                volumes = [b["v"] for b in bars]
-                score   = score_stock(closes, volumes)
-                if score >= 50:
-                    candidates.append((symbol, score, closes[-1]))
+                score = int(scores[symbol][len(bars) - 1])
+                if score >= params["min_score"]:
+                    candidates.append((symbol, score, float(bars.c[-1])))
 
             candidates.sort(key=lambda x: x[1], reverse=True)
 
-            for symbol, score, price in candidates[:2]:
-                invest = min(capital * 0.15, capital / 3)
-                qty    = int(invest / price)
+            prices = {symbol: price for symbol, score, price in candidates}
+            picks  = [(symbol, 1.0) for symbol, score, price in candidates[:params["buys_per_day"]]]
+            if risk_check:
+                risk.feed(risk_model, all_data, until_day=day)
+                picks, _ = risk.select(risk_model, [c[0] for c in candidates], list(positions), params["buys_per_day"])
+
+            for symbol, factor in picks:
+                price = prices[symbol]
+                qty   = int(position_size(capital, price, params["position_pct"]) * factor)
                 if qty > 0:
                     cost     = qty * price
                     capital -= cost
                     positions[symbol] = {
                         "qty":       qty,
                         "buy_price": price,
-                        "buy_date":  date_str
+                        "buy_date":  date_str,
+                        "exit":      exits.new_state(price, date_str)
                     }
 
         # חשב שווי יומי
         portfolio_value = capital
         for symbol, pos in positions.items():
             if symbol in day_data:
-                portfolio_value += pos["qty"] * day_data[symbol][-1]["c"]
+                portfolio_value += pos["qty"] * float(day_data[symbol].c[-1])
         daily_capital.append(portfolio_value)
 
-    # חשב סטטיסטיקות
+    return summarize(trades, daily_capital, initial_capital, start_date, end_date)
+
+
+def can_buy(capital: float, initial_capital: float, positions: dict, max_positions: int = MAX_POSITIONS) -> bool:
+    return capital > initial_capital * MIN_CASH_PCT and len(positions) < max_positions
+
+
+def position_size(capital: float, price: float, position_pct: float = POSITION_PCT) -> int:
+    return int(min(capital * position_pct, capital / 3) / price)
+
+
+def summarize(trades: list, daily_capital: list, initial_capital: float, start_date: str, end_date: str) -> dict:
+    """סטטיסטיקות מהעסקאות ומהשווי היומי — אותו פורמט ל-backtest היומי ול-intraday"""
     if not trades:
         return {"error": "לא בוצעו עסקאות"}
 
@@ -242,13 +248,40 @@ def run_backtest(start_date: str, end_date: str, initial_capital: float = 100000
     }
 
 
+def is_intraday(task: str) -> bool:
+    task = (task or "").lower()
+    return any(word in task for word in INTRADAY_WORDS)
+
+
+def is_sweep(task: str) -> bool:
+    task = (task or "").lower()
+    return any(word in task for word in SWEEP_WORDS)
+
+
+async def run_sweep(start_date: str, end_date: str):
+    import sweep
+    launched = await asyncio.to_thread(sweep.launch, start_date, end_date)
+    await outbox.send(
+        CHAT_ID,
+        f"🧪 *Sweep הושק* — {launched['configs']} קונפיגורציות על {launched['shards']} pods במקביל.\n"
+        f"התוצאות יגיעו לכאן כשכל ה-shards יסיימו.",
+        parse_mode="Markdown"
+    )
+
+
 async def run():
     logger.info(f"Backtest agent התעורר | task={TASK}")
-    bot = Bot(token=TELEGRAM_TOKEN)
+    if is_sweep(TASK):
+        await run_sweep("2024-08-01", datetime.now().strftime("%Y-%m-%d"))
+        return
 
-    await bot.send_message(
-        chat_id=CHAT_ID,
-        text="⏳ *מריץ Backtest...*\nבודק את האסטרטגיה על 6 חודשים אחורה. זה ייקח 2-3 דקות.",
+    intraday = is_intraday(TASK)
+    mode     = "intraday" if intraday else "daily"
+
+    await outbox.send(
+        CHAT_ID,
+        ("⏳ *מריץ Backtest תוך-יומי...*\nכניסה ב-09:30 ויציאות על נרות דקה, 6 חודשים אחורה." if intraday else
+         "⏳ *מריץ Backtest...*\nבודק את האסטרטגיה על 6 חודשים אחורה. זה ייקח 2-3 דקות."),
         parse_mode="Markdown"
     )
 
@@ -256,22 +289,30 @@ async def run():
     end_date   = datetime.now().strftime("%Y-%m-%d")
     start_date = "2024-08-01"
 
-    # בדיקת נתונים לפני הרצה
-    test_bars = get_historical_bars("AAPL", start_date, end_date)
-    import asyncio as _asyncio
-    await bot.send_message(chat_id=CHAT_ID, text=f"🔍 בדיקה: AAPL החזיר {len(test_bars)} ימים מ-{start_date}")
+    if not intraday:
+        # בדיקת נתונים לפני הרצה
+        test_bars = get_historical_bars("AAPL", start_date, end_date)
+        await outbox.send(CHAT_ID, f"🔍 בדיקה: AAPL החזיר {len(test_bars)} ימים מ-{start_date}")
 
-    results = run_backtest(start_date, end_date)
+    with span("backtest_run"):
+        started = time.time()
+        if intraday:
+            from intraday_backtest import run_intraday_backtest
+            results = run_intraday_backtest(start_date, end_date)
+        else:
+            results = run_backtest(start_date, end_date)
+        metrics.observe("backtest_seconds", time.time() - started, mode=mode)
 
     if "error" in results:
-        await bot.send_message(chat_id=CHAT_ID, text=f"❌ {results['error']}")
+        await outbox.send(CHAT_ID, f"❌ {results['error']}")
         return
 
     return_emoji = "🟢" if results["total_return"] >= 0 else "🔴"
     best  = results["best_trade"]
     worst = results["worst_trade"]
 
-    message = f"""📊 *תוצאות Backtest*
+    title   = "Backtest תוך-יומי" if intraday else "Backtest"
+    message = f"""📊 *תוצאות {title}*
 _{results['start_date']} → {results['end_date']}_
 
 💰 הון התחלתי: ${results['initial_capital']:,.0f}
@@ -293,20 +334,19 @@ _{results['start_date']} → {results['end_date']}_
 💸 *עסקה הכי גרועה:*
 {worst['symbol']}: {worst['pl_pct']}% ({worst['buy_date']} → {worst['sell_date']})"""
 
-    # ניתוח AI של התוצאות
-    groq_client = Groq(api_key=GROQ_API_KEY)
-    analysis    = groq_client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
+    # ניתוח AI של התוצאות — נכתב לתוך הודעת התוצאות תוך כדי יצירה
+    await llm.stream_reply(
         messages=[
             {"role": "system", "content": "אתה אנליסט מסחר מומחה. נתח את תוצאות ה-backtest ותן המלצות לשיפור האסטרטגיה. ענה בעברית, 3-4 משפטים."},
             {"role": "user",   "content": f"תוצאות backtest: {json.dumps(results, ensure_ascii=False)}"}
         ],
-        max_tokens=300
+        chat_id=CHAT_ID,
+        prefix=message + "\n\n🤖 *ניתוח AI:*\n",
+        max_tokens=300,
+        parse_mode="Markdown",
+        cache_inputs=results,
+        cache_ttl=24 * 60 * 60
     )
-
-    message += f"\n\n🤖 *ניתוח AI:*\n{analysis.choices[0].message.content}"
-
-    await bot.send_message(chat_id=CHAT_ID, text=message, parse_mode="Markdown")
     logger.info("Backtest הושלם!")
 
 
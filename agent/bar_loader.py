@@ -0,0 +1,227 @@
+"""
+טעינת נרות מ-Alpaca בדפים — בלי לחתוך היסטוריה ארוכה ובלי להחזיק אותה בזיכרון.
+
+iter_pages  — generator שעובר על next_page_token (בקשת multi-symbol)
+iter_chunks — אותו דבר, אבל כל chunk הוא מערכים טיפוסיים של numpy
+              (t ב-epoch seconds כ-int64, ו-o/h/l/c/v כ-float64) במקום רשימת dicts
+Bars        — נרות יומיים כעמודות (t = epoch-day). נבנה כאן, בגבול השליפה, וזה
+              מה ש-scanner, analyst ו-backtest מקבלים במקום ה-JSON של Alpaca
+BarStore    — מאגר מקומי על דיסק: קובץ בינארי לכל עמודה, נכתב ב-append ישירות
+              מה-stream ונקרא כ-memmap. כך backtest של שנים על נרות דקה רץ
+              בזיכרון חסום בתוך ה-limit של 512Mi.
+"""
+import os
+import json
+import shutil
+import logging
+
+import numpy as np
+
+import alpaca
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ALPACA_API_KEY    = os.environ.get("ALPACA_API_KEY")
+ALPACA_SECRET_KEY = os.environ.get("ALPACA_SECRET_KEY")
+ALPACA_DATA_URL   = os.environ.get("ALPACA_DATA_URL", "https://data.alpaca.markets")
+BAR_STORE_DIR     = os.environ.get("BAR_STORE_DIR", "/tmp/bars")
+
+HEADERS = {
+    "APCA-API-KEY-ID": ALPACA_API_KEY,
+    "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
+}
+
+PAGE_LIMIT      = 10000   # המקסימום ש-Alpaca מחזיר בדף
+SECONDS_PER_DAY = 86400
+FIELDS     = ("o", "h", "l", "c", "v")
+COLUMNS    = ("t",) + FIELDS
+DTYPES     = {"t": np.int64, **{field: np.float64 for field in FIELDS}}
+
+
+def iter_pages(symbols: list, timeframe: str, start: str, end: str = None, feed: str = None,
+               page_limit: int = PAGE_LIMIT):
+    """מחזיר דף אחרי דף {symbol: [bar, ...]} עד שאין next_page_token"""
+    url    = f"{ALPACA_DATA_URL}/v2/stocks/bars"
+    params = {"symbols": ",".join(symbols), "timeframe": timeframe, "start": start, "limit": page_limit}
+    if end:
+        params["end"] = end
+    if feed:
+        params["feed"] = feed
+
+    while True:
+        data = alpaca.get(url, headers=HEADERS, params=params).json()
+        bars = data.get("bars") or {}
+        if bars:
+            yield bars
+        token = data.get("next_page_token")
+        if not token:
+            return
+        params["page_token"] = token
+
+
+def to_columns(raw: list) -> dict:
+    """[{"t": "2024-08-01T13:30:00Z", "o": ..., ...}] → {"t": int64[], "o": float64[], ...}"""
+    columns = {"t": np.array([bar["t"][:19] for bar in raw], dtype="datetime64[s]").astype(np.int64)}
+    for field in FIELDS:
+        columns[field] = np.fromiter((bar[field] for bar in raw), dtype=np.float64, count=len(raw))
+    return columns
+
+
+def iter_chunks(symbols: list, timeframe: str, start: str, end: str = None, feed: str = None):
+    """(symbol, columns) לכל חתיכה של דף. מניה ארוכה מגיעה בכמה chunks, לפי הסדר"""
+    for page in iter_pages(symbols, timeframe, start, end, feed):
+        for symbol, raw in page.items():
+            metrics.inc("bars_loaded", len(raw), timeframe=timeframe)
+            yield symbol, to_columns(raw)
+
+
+def load_bars(symbols: list, timeframe: str, start: str, end: str = None, feed: str = None) -> dict:
+    """כל הנרות בזיכרון, {symbol: columns} — לטווחים קצרים. לטווחים ארוכים: BarStore"""
+    parts = {}
+    for symbol, columns in iter_chunks(symbols, timeframe, start, end, feed):
+        parts.setdefault(symbol, []).append(columns)
+    return {symbol: concat(chunks) for symbol, chunks in parts.items()}
+
+
+def concat(chunks: list) -> dict:
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in COLUMNS}
+
+
+def empty_columns() -> dict:
+    return {name: np.empty(0, dtype=DTYPES[name]) for name in COLUMNS}
+
+
+def to_day(date_str: str) -> int:
+    """"2024-08-01" (או timestamp מלא) → ימים מ-1970-01-01"""
+    return int(np.datetime64(date_str[:10], "D").astype(np.int64))
+
+
+def day_str(day: int) -> str:
+    """ימים מ-1970-01-01 → 2024-08-01"""
+    return str(np.datetime64(int(day), "D"))
+
+
+class Bars:
+    """
+    נרות יומיים כעמודות: t = epoch-day כ-int64, o/h/l/c/v כ-float64 —
+    48 בייט לנר במקום dict של JSON עם timestamp כמחרוזת.
+
+    השוואת תאריכים היא השוואת int, ו-slicing (כולל until / between, שמוצאים
+    את הגבול ב-binary search) מחזיר Bars של views על אותם מערכים, בלי העתקה.
+    """
+    __slots__ = COLUMNS
+
+    def __init__(self, t, o, h, l, c, v):
+        self.t = t
+        self.o = o
+        self.h = h
+        self.l = l
+        self.c = c
+        self.v = v
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> "Bars":
+        """מהעמודות של to_columns / BarStore (t ב-epoch seconds)"""
+        return cls(columns["t"] // SECONDS_PER_DAY, *(columns[field] for field in FIELDS))
+
+    @classmethod
+    def from_json(cls, raw: list) -> "Bars":
+        return cls.from_columns(to_columns(raw))
+
+    @classmethod
+    def empty(cls) -> "Bars":
+        return cls.from_columns(empty_columns())
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+    def __getitem__(self, index: slice) -> "Bars":
+        if not isinstance(index, slice):
+            raise TypeError("Bars תומך רק ב-slicing — לעמודה בודדת: bars.c[i]")
+        return Bars(*(getattr(self, name)[index] for name in COLUMNS))
+
+    def until(self, day: int) -> "Bars":
+        """כל הנרות עד day כולל"""
+        return self[:int(np.searchsorted(self.t, day, side="right"))]
+
+    def between(self, start: int, end: int) -> "Bars":
+        """הנרות מ-start עד end, כולל שניהם"""
+        return self[int(np.searchsorted(self.t, start, side="left")):int(np.searchsorted(self.t, end, side="right"))]
+
+    def __repr__(self) -> str:
+        if not len(self):
+            return "Bars(0)"
+        return f"Bars({len(self)}, {day_str(self.t[0])} → {day_str(self.t[-1])})"
+
+
+def load_daily_bars(symbols: list, start: str, end: str = None, feed: str = None) -> dict:
+    """{symbol: Bars} לנרות יומיים — נקודת הכניסה לכל מי שצריך נרות יומיים"""
+    return {symbol: Bars.from_columns(columns)
+            for symbol, columns in load_bars(symbols, "1Day", start, end, feed).items()}
+
+
+class BarStore:
+    """
+    {root}/{timeframe}/{SYMBOL}/{t,o,h,l,c,v}.bin + meta.json עם הטווח שהורד.
+    download() כותב כל chunk לדיסק ברגע שהגיע, load() מחזיר memmap.
+    """
+
+    def __init__(self, root: str = BAR_STORE_DIR):
+        self.root = root
+
+    def path(self, timeframe: str, symbol: str) -> str:
+        return os.path.join(self.root, timeframe, symbol)
+
+    def meta(self, timeframe: str, symbol: str) -> dict:
+        try:
+            with open(os.path.join(self.path(timeframe, symbol), "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def covers(self, timeframe: str, symbol: str, start: str, end: str = None, feed: str = None) -> bool:
+        meta = self.meta(timeframe, symbol)
+        return (bool(meta) and meta.get("feed") == feed and meta["start"] <= start
+                and end is not None and meta.get("end") is not None and meta["end"] >= end)
+
+    def append(self, timeframe: str, symbol: str, columns: dict):
+        directory = self.path(timeframe, symbol)
+        os.makedirs(directory, exist_ok=True)
+        for name in COLUMNS:
+            with open(os.path.join(directory, f"{name}.bin"), "ab") as f:
+                columns[name].astype(DTYPES[name], copy=False).tofile(f)
+
+    def download(self, symbols: list, timeframe: str, start: str, end: str = None, feed: str = None) -> dict:
+        """מוריד מחדש את symbols ל-store, chunk אחרי chunk. מחזיר {symbol: מספר נרות}"""
+        for symbol in symbols:
+            shutil.rmtree(self.path(timeframe, symbol), ignore_errors=True)
+
+        counts = {symbol: 0 for symbol in symbols}
+        for symbol, columns in iter_chunks(symbols, timeframe, start, end, feed):
+            self.append(timeframe, symbol, columns)
+            counts[symbol] = counts.get(symbol, 0) + len(columns["t"])
+
+        for symbol, count in counts.items():
+            os.makedirs(self.path(timeframe, symbol), exist_ok=True)
+            with open(os.path.join(self.path(timeframe, symbol), "meta.json"), "w") as f:
+                json.dump({"start": start, "end": end, "feed": feed, "count": count}, f)
+        logger.info(f"הורדו {sum(counts.values())} נרות {timeframe} ל-{len(symbols)} מניות")
+        return counts
+
+    def ensure(self, symbols: list, timeframe: str, start: str, end: str = None, feed: str = None):
+        """מוריד רק את המניות שעוד אין להן את כל הטווח ב-store"""
+        missing = [symbol for symbol in symbols if not self.covers(timeframe, symbol, start, end, feed)]
+        if missing:
+            self.download(missing, timeframe, start, end, feed)
+
+    def load(self, timeframe: str, symbol: str) -> dict:
+        """{"t": ..., "o": ..., ...} כ-memmap לקריאה בלבד — הדפים נטענים מהדיסק רק כשניגשים אליהם"""
+        directory = self.path(timeframe, symbol)
+        count     = self.meta(timeframe, symbol).get("count", 0)
+        if not count:
+            return empty_columns()
+        return {
+            name: np.memmap(os.path.join(directory, f"{name}.bin"), dtype=DTYPES[name], mode="r", shape=(count,))
+            for name in COLUMNS
+        }
@@ -0,0 +1,208 @@
+"""
+מנוע יציאה תוך-יומי — בודק את כל הפוזיציות הפתוחות כל EXIT_POLL_INTERVAL
+שניות במקום פעם אחת ב-15:45.
+
+בכל tick: פוזיציות מה-cache (account_cache), מחיר אחרון לכל המניות של כל
+החשבונות בבקשה אחת (/v2/stocks/trades/latest), ואז כללי exits.py לכל
+פוזיציה. ה-state של כל פוזיציה (כניסה ו-high-water mark) נשמר ב-Redis hash
+לכל חשבון, כך שהוא שורד בין ריצות ומשותף עם סריקת הערב.
+
+רץ כ-CronJob לפני פתיחת המסחר (ROLE=exits): מחכה לפתיחה של הסשן הרגיל לפי
+/v2/clock של Alpaca (שעון קיץ, חגים וימים מקוצרים), ויוצא בסגירה — פקודות
+"day" לא נשלחות על מחירי pre-market / after-hours.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+import alpaca
+import account_cache
+import exits
+import metrics
+import tracing
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ALPACA_API_KEY    = os.environ.get("ALPACA_API_KEY")
+ALPACA_SECRET_KEY = os.environ.get("ALPACA_SECRET_KEY")
+ALPACA_DATA_URL   = os.environ.get("ALPACA_DATA_URL", "https://data.alpaca.markets")
+
+HEADERS = {
+    "APCA-API-KEY-ID": ALPACA_API_KEY,
+    "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
+}
+
+POLL_INTERVAL = float(os.environ.get("EXIT_POLL_INTERVAL", "15"))
+MAX_OPEN_WAIT = 2 * 60 * 60   # שניות — פתיחה רחוקה מזה (סוף שבוע, חג) היא לא של הריצה הזו
+STATE_TTL     = 60 * 60 * 24 * 30
+
+_redis = None
+
+
+def _client():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis(host="redis-service", port=6379, decode_responses=True)
+    return _redis
+
+
+def state_key(headers: dict) -> str:
+    return account_cache.cache_key("exit_state", headers)
+
+
+def position_states(headers: dict, positions: list, today: str) -> dict:
+    """
+    {symbol: state} לכל הפוזיציות הפתוחות. פוזיציה חדשה מקבלת state מ-avg_entry_price
+    עם תאריך היום, ו-state של פוזיציה שנסגרה נמחק.
+    """
+    client = _client()
+    key    = state_key(headers)
+    stored = {symbol: json.loads(raw) for symbol, raw in client.hgetall(key).items()}
+
+    states = {}
+    for pos in positions:
+        symbol = pos["symbol"]
+        states[symbol] = stored.get(symbol) or exits.new_state(float(pos["avg_entry_price"]), today)
+
+    closed = [symbol for symbol in stored if symbol not in states]
+    pipe   = client.pipeline(transaction=False)
+    if closed:
+        pipe.hdel(key, *closed)
+    new = {symbol: json.dumps(state) for symbol, state in states.items() if symbol not in stored}
+    if new:
+        pipe.hset(key, mapping=new)
+        pipe.expire(key, STATE_TTL)
+    pipe.execute()
+    return states
+
+
+def save_states(headers: dict, states: dict):
+    if states:
+        _client().hset(state_key(headers), mapping={symbol: json.dumps(state) for symbol, state in states.items()})
+
+
+def latest_prices(symbols: list) -> dict:
+    """מחיר העסקה האחרונה לכל המניות — בקשה אחת"""
+    if not symbols:
+        return {}
+    url    = f"{ALPACA_DATA_URL}/v2/stocks/trades/latest"
+    trades = alpaca.get(url, headers=HEADERS, params={"symbols": ",".join(symbols)}).json().get("trades") or {}
+    return {symbol: float(trade["p"]) for symbol, trade in trades.items()}
+
+
+def evaluate(states: dict, prices: dict, today: str) -> tuple:
+    """
+    מעדכן high-water marks ובודק את הכללים לכל פוזיציה.
+    מחזיר (exits [(symbol, reason)], changed {symbol: state})
+    """
+    to_exit, changed = [], {}
+    for symbol, state in states.items():
+        price = prices.get(symbol)
+        if price is None:
+            continue
+        if exits.update(state, price):
+            changed[symbol] = state
+        reason = exits.check_exit(state, price, today)
+        if reason:
+            to_exit.append((symbol, reason))
+    return to_exit, changed
+
+
+async def check_account(account: dict, positions: list, prices: dict, today: str, sold: set):
+    from scanner import notify, place_order
+
+    held   = {pos["symbol"]: pos for pos in positions if (account["name"], pos["symbol"]) not in sold}
+    states = await asyncio.to_thread(position_states, account["headers"], list(held.values()), today)
+    to_exit, changed = evaluate(states, prices, today)
+    await asyncio.to_thread(save_states, account["headers"], changed)
+
+    for symbol, reason in to_exit:
+        qty   = held[symbol]["qty"]
+        price = prices[symbol]
+        try:
+            ok = await asyncio.to_thread(place_order, account, symbol, qty, "sell")
+        except Exception as e:
+            logger.error(f"מכירה של {symbol} ב-{account['name']} נכשלה: {e}")
+            continue
+        if not ok:
+            continue
+        # מסומן גם אם הפקודה עוד לא התמלאה, כדי לא למכור פעמיים
+        sold.add((account["name"], symbol))
+        metrics.inc("exits_triggered", reason=reason)
+        await notify(
+            account["chat_ids"],
+            f"🔔 *יציאה אוטומטית:* {symbol} — {qty} מניות ב-${price:.2f}\n{exits.describe(reason, states[symbol], price, today)}",
+            parse_mode="Markdown"
+        )
+
+
+async def tick(accounts: list, sold: set):
+    today     = datetime.now().strftime("%Y-%m-%d")
+    positions = await asyncio.gather(*(
+        asyncio.to_thread(account_cache.get_positions, account["headers"], account["base_url"])
+        for account in accounts
+    ))
+    positions = [p if isinstance(p, list) else [] for p in positions]
+    symbols   = sorted({pos["symbol"] for account_positions in positions for pos in account_positions})
+    prices    = await asyncio.to_thread(latest_prices, symbols)
+    await asyncio.gather(*(
+        check_account(account, account_positions, prices, today, sold)
+        for account, account_positions in zip(accounts, positions)
+    ))
+
+
+def session(account: dict) -> tuple:
+    """
+    (פתיחה, סגירה) של הסשן הנוכחי או הבא ב-epoch seconds, לפי /v2/clock.
+    אם Alpaca לא עונה — הסשן של היום לפי שעון ניו יורק (session_bounds, בלי חגים)
+    """
+    try:
+        clock = alpaca.get(f"{account['base_url']}/v2/clock", headers=account["headers"]).json()
+        close = datetime.fromisoformat(clock["next_close"]).timestamp()
+        if clock["is_open"]:
+            return time.time(), close
+        return datetime.fromisoformat(clock["next_open"]).timestamp(), close
+    except Exception as e:
+        logger.warning(f"קריאת /v2/clock נכשלה ({e}), לפי שעות המסחר הרגילות")
+    from intraday_backtest import session_bounds
+    from bar_loader import SECONDS_PER_DAY
+    now = time.time()
+    if datetime.now(timezone.utc).weekday() >= 5:
+        return now, now   # סוף שבוע — אין סשן
+    return session_bounds(int(now // SECONDS_PER_DAY))
+
+
+async def run():
+    from scanner import load_accounts
+    accounts = load_accounts()
+    sold     = set()
+
+    open_ts, close_ts = await asyncio.to_thread(session, accounts[0])
+    wait = open_ts - time.time()
+    if wait > MAX_OPEN_WAIT or time.time() >= close_ts:
+        logger.info("אין סשן מסחר בריצה הזו — exit engine יוצא")
+        return
+    if wait > 0:
+        logger.info(f"מחכה {wait / 60:.0f} דקות לפתיחת המסחר")
+        await asyncio.sleep(wait)
+    logger.info(f"Exit engine פעיל ל-{len(accounts)} חשבונות, כל {POLL_INTERVAL} שניות")
+
+    while time.time() < close_ts:
+        started = time.time()
+        try:
+            with tracing.span("exit_tick"):
+                await tick(accounts, sold)
+        except Exception as e:
+            logger.error(f"tick של exit engine נכשל: {e}")
+            metrics.inc("exit_tick_errors")
+        metrics.observe("exit_tick_seconds", time.time() - started)
+        # ריצה של שעות — שולחים מטריקות ו-spans בכל tick ולא רק ביציאה
+        metrics.flush()
+        tracing.flush()
+        await asyncio.sleep(max(0, POLL_INTERVAL - (time.time() - started)))
+    logger.info("המסחר נסגר — exit engine יוצא")
@@ -0,0 +1,113 @@
+"""
+כללי יציאה מפוזיציה — אותו קוד ל-backtest, לסריקת הערב ול-exit_engine.
+
+לכל פוזיציה נשמר state קטן: מחיר כניסה, תאריך כניסה והמחיר הגבוה ביותר
+מאז הכניסה (high-water mark). בכל tick מעדכנים את ה-high ובודקים את
+הכללים — O(1) לפוזיציה, בלי היסטוריית מחירים.
+
+  take_profit   — רווח של TAKE_PROFIT_PCT ומעלה
+  stop_loss     — הפסד של STOP_LOSS_PCT ומטה
+  trailing_stop — אחרי שהפוזיציה עלתה TRAILING_ACTIVATION_PCT, ירידה של
+                  TRAILING_STOP_PCT מהשיא
+  timeout       — MAX_HOLD_DAYS ימים מהכניסה (כמו ב-backtest המקורי)
+
+first_exit מריץ את אותם כללים על סדרת מחירים שלמה (יום של נרות דקה)
+בפעולות מערך אחת — ל-backtest התוך-יומי.
+"""
+from datetime import datetime
+
+import numpy as np
+
+TAKE_PROFIT_PCT         = 15
+STOP_LOSS_PCT           = -10
+TRAILING_ACTIVATION_PCT = 5
+TRAILING_STOP_PCT       = 7
+MAX_HOLD_DAYS           = 10
+
+# הספים כ-dict — ברירת המחדל של כל הפונקציות. backtest / sweep מעבירים ספים אחרים
+RULES = {
+    "take_profit_pct":         TAKE_PROFIT_PCT,
+    "stop_loss_pct":           STOP_LOSS_PCT,
+    "trailing_activation_pct": TRAILING_ACTIVATION_PCT,
+    "trailing_stop_pct":       TRAILING_STOP_PCT,
+    "max_hold_days":           MAX_HOLD_DAYS
+}
+
+REASON_LABELS = {
+    "take_profit":   "רווח {pl_pct:.1f}% 🎯",
+    "stop_loss":     "Stop Loss {pl_pct:.1f}% 🛑",
+    "trailing_stop": "Trailing Stop — {drawdown:.1f}% מהשיא 📉",
+    "timeout":       "{days} ימים בפוזיציה ⏰"
+}
+
+
+def new_state(entry_price: float, entry_date: str) -> dict:
+    """entry_date בפורמט YYYY-MM-DD"""
+    return {"entry_price": float(entry_price), "entry_date": entry_date, "high": float(entry_price)}
+
+
+def update(state: dict, price: float) -> bool:
+    """מעדכן את ה-high-water mark. מחזיר True אם השתנה"""
+    if price > state["high"]:
+        state["high"] = price
+        return True
+    return False
+
+
+def days_held(state: dict, today: str) -> int:
+    return (datetime.strptime(today, "%Y-%m-%d") - datetime.strptime(state["entry_date"], "%Y-%m-%d")).days
+
+
+def check_exit(state: dict, price: float, today: str, rules: dict = RULES):
+    """מחזיר את סיבת היציאה (take_profit / stop_loss / trailing_stop / timeout) או None"""
+    entry    = state["entry_price"]
+    pl_pct   = (price - entry) / entry * 100
+    peak_pct = (state["high"] - entry) / entry * 100
+    drawdown = (state["high"] - price) / state["high"] * 100
+
+    if pl_pct >= rules["take_profit_pct"]:
+        return "take_profit"
+    if pl_pct <= rules["stop_loss_pct"]:
+        return "stop_loss"
+    if peak_pct >= rules["trailing_activation_pct"] and drawdown >= rules["trailing_stop_pct"]:
+        return "trailing_stop"
+    if days_held(state, today) >= rules["max_hold_days"]:
+        return "timeout"
+    return None
+
+
+def first_exit(state: dict, prices: np.ndarray, today: str, rules: dict = RULES):
+    """
+    update + check_exit לכל המחירים לפי הסדר, בפעולות מערך.
+    מחזיר (index, reason) של המחיר הראשון שמפעיל יציאה, או None.
+    state["high"] מתעדכן עד המחיר הזה (או עד סוף הסדרה אם לא הייתה יציאה).
+    """
+    if not len(prices):
+        return None
+    entry = state["entry_price"]
+    highs = np.maximum(np.maximum.accumulate(prices), state["high"])
+
+    pl_pct   = (prices - entry) / entry * 100
+    peak_pct = (highs - entry) / entry * 100
+    drawdown = (highs - prices) / highs * 100
+    hit      = ((pl_pct >= rules["take_profit_pct"]) | (pl_pct <= rules["stop_loss_pct"])
+                | ((peak_pct >= rules["trailing_activation_pct"]) & (drawdown >= rules["trailing_stop_pct"])))
+
+    if days_held(state, today) >= rules["max_hold_days"]:
+        index = 0
+    elif hit.any():
+        index = int(np.argmax(hit))
+    else:
+        state["high"] = float(highs[-1])
+        return None
+    state["high"] = float(highs[index])
+    return index, check_exit(state, float(prices[index]), today, rules)
+
+
+def describe(reason: str, state: dict, price: float, today: str) -> str:
+    """טקסט לדוח — "רווח 16.2% 🎯" וכו'"""
+    return REASON_LABELS[reason].format(
+        pl_pct=(price - state["entry_price"]) / state["entry_price"] * 100,
+        drawdown=(state["high"] - price) / state["high"] * 100,
+        days=days_held(state, today)
+    )
@@ -0,0 +1,213 @@
+"""
+Backtest תוך-יומי על נרות דקה — אותה אסטרטגיה כמו backtest.py, עם התזמון
+של המערכת החיה במקום "הכל במחיר הסגירה":
+
+  כניסה  — הציונים מחושבים מהנרות היומיים עד אתמול (כמו סריקת הבוקר),
+           והקנייה מתמלאת בפתיחה של הנר הראשון אחרי 09:30 + ENTRY_DELAY
+  יציאה  — כללי exits.py על כל נר דקה (כמו exit_engine), והמכירה מתמלאת
+           בפתיחה של הנר הבא. סיגנל בנר האחרון של היום מתמלא בפתיחה של מחר
+
+הנתונים נקראים יום אחרי יום מ-BarStore (memmap), כך שהזיכרון לא תלוי
+באורך ההיסטוריה. הציונים היומיים מחושבים מראש לכל הנרות (strategy.py) ו-RollingDaily
+רק מזיז סמן יום אחרי יום, והיציאות נבדקות ב-exits.first_exit — פעולת מערך
+אחת לכל פוזיציה לכל יום, לא לולאה על דקות.
+"""
+import os
+import time
+import logging
+from datetime import date, timedelta
+
+import numpy as np
+
+import bar_loader
+import exits
+import metrics
+import risk
+import strategy
+from backtest import WATCHLIST, MIN_SCORE, BUYS_PER_DAY, can_buy, position_size, summarize
+
+logger = logging.getLogger(__name__)
+
+ENTRY_DELAY     = int(os.environ.get("INTRADAY_ENTRY_DELAY", "60"))   # שניות מ-09:30 עד שהפקודות של הסריקה יוצאות
+WARMUP_DAYS     = 45              # ימים קלנדריים של נרות יומיים לפני ההתחלה — מספיק ל-MA20
+SESSION_OPEN    = 9 * 3600 + 30 * 60
+SESSION_SECONDS = 390 * 60
+
+
+def eastern_offset(day: int) -> int:
+    """
+    הפרש השעות בין ניו יורק ל-UTC ביום נתון (epoch-day): 4 בשעון קיץ, 5 בחורף.
+    שעון קיץ בארה"ב — מיום ראשון השני של מרץ עד יום ראשון הראשון של נובמבר.
+    """
+    d         = date(1970, 1, 1) + timedelta(days=int(day))
+    march     = date(d.year, 3, 8)
+    november  = date(d.year, 11, 1)
+    dst_start = march    + timedelta(days=(6 - march.weekday()) % 7)
+    dst_end   = november + timedelta(days=(6 - november.weekday()) % 7)
+    return 4 if dst_start <= d < dst_end else 5
+
+
+def session_bounds(day: int) -> tuple:
+    """(פתיחה, סגירה) של המסחר הרגיל ב-epoch seconds"""
+    open_ts = int(day) * bar_loader.SECONDS_PER_DAY + SESSION_OPEN + eastern_offset(day) * 3600
+    return open_ts, open_ts + SESSION_SECONDS
+
+
+class RollingDaily:
+    """
+    הציון ופילטר השוק של מניה אחת מהנרות היומיים. values — העמודות של
+    strategy.evaluate_bars לכל הנרות, ו-advance(day) מזיז את הסמן עד הנר שלפני day.
+    """
+    __slots__ = ("bars", "values", "cursor")
+
+    def __init__(self, bars: bar_loader.Bars, values: dict = None):
+        self.bars   = bars
+        self.values = values
+        self.cursor = 0
+
+    def advance(self, day: int):
+        self.cursor = int(np.searchsorted(self.bars.t, day))
+
+    def score(self) -> int:
+        return int(self.values["score"][self.cursor - 1]) if self.cursor else 0
+
+    def bullish(self) -> bool:
+        """פילטר השוק של SPY — לפני שיש נרות השוק נחשב חיובי"""
+        return bool(self.values["market"][self.cursor - 1]) if self.cursor else True
+
+
+def session_bars(minute: dict, open_ts: int, close_ts: int) -> dict:
+    """{symbol: {"t", "o", "c"}} — views על הנרות של היום מתוך ה-memmap"""
+    session = {}
+    for symbol, columns in minute.items():
+        lo, hi = np.searchsorted(columns["t"], (open_ts, close_ts))
+        if hi > lo:
+            session[symbol] = {name: columns[name][lo:hi] for name in ("t", "o", "c")}
+    return session
+
+
+def close_position(positions: dict, trades: list, symbol: str, price: float, reason: str, date_str: str) -> float:
+    """סוגר פוזיציה, רושם עסקה ומחזיר את התמורה"""
+    pos = positions.pop(symbol)
+    trades.append({
+        "symbol":     symbol,
+        "buy_date":   pos["buy_date"],
+        "sell_date":  date_str,
+        "buy_price":  round(pos["buy_price"], 2),
+        "sell_price": round(price, 2),
+        "pl_pct":     round((price - pos["buy_price"]) / pos["buy_price"] * 100, 2),
+        "reason":     reason
+    })
+    return pos["qty"] * price
+
+
+def run_intraday_backtest(start_date: str, end_date: str, initial_capital: float = 100000,
+                          store: bar_loader.BarStore = None, risk_check: bool = True) -> dict:
+    logger.info(f"מריץ backtest תוך-יומי: {start_date} → {end_date}")
+    store     = store or bar_loader.BarStore()
+    start_day = bar_loader.to_day(start_date)
+    end_day   = bar_loader.to_day(end_date)
+
+    # נרות יומיים לציונים ולפילטר השוק, נרות דקה ל-BarStore על דיסק
+    warmup = bar_loader.day_str(start_day - WARMUP_DAYS)
+    daily  = bar_loader.load_daily_bars(WATCHLIST + ["SPY"], warmup, end_date, feed="iex")
+    store.ensure(WATCHLIST, "1Min", start_date, end_date, feed="iex")
+    minute  = {symbol: store.load("1Min", symbol) for symbol in WATCHLIST}
+    values  = strategy.evaluate_bars(daily)
+    rolling = {symbol: RollingDaily(daily.get(symbol, bar_loader.Bars.empty()), values.get(symbol))
+               for symbol in WATCHLIST + ["SPY"]}
+    risk_model = risk.RollingCovariance(WATCHLIST)
+
+    spy_days = rolling["SPY"].bars.between(start_day, end_day).t
+    if not len(spy_days):
+        return {"error": "לא נמצאו נתונים"}
+
+    capital       = initial_capital
+    positions     = {}   # symbol → {qty, buy_price, buy_date, exit}
+    pending       = {}   # symbol → reason — סיגנל מכירה בנר האחרון, מתמלא בפתיחה הבאה
+    last_price    = {}
+    trades        = []
+    daily_capital = []
+    bars_seen     = 0
+    started       = time.time()
+
+    for day in spy_days:
+        date_str          = bar_loader.day_str(day)
+        open_ts, close_ts = session_bounds(day)
+        session           = session_bars(minute, open_ts, close_ts)
+        bars_seen        += sum(len(bars["t"]) for bars in session.values())
+        for state in rolling.values():
+            state.advance(day)
+
+        # מכירות שהסיגנל שלהן היה בנר האחרון של אתמול
+        for symbol in list(pending):
+            if symbol in session:
+                capital += close_position(positions, trades, symbol, float(session[symbol]["o"][0]),
+                                          pending.pop(symbol), date_str)
+
+        # כניסה — כמו סריקת הבוקר: ציונים עד אתמול, מילוי בנר שאחרי 09:30 + ENTRY_DELAY
+        entered = {}
+        if rolling["SPY"].bullish() and can_buy(capital, initial_capital, positions):
+            candidates = []
+            for symbol in WATCHLIST:
+                if symbol in positions or symbol not in session:
+                    continue
+                score = rolling[symbol].score()
+                if score >= MIN_SCORE:
+                    candidates.append((symbol, score))
+            candidates.sort(key=lambda x: x[1], reverse=True)
+
+            # בדיקת הקורלציה של סריקת הבוקר — על הסגירות עד אתמול
+            picks = [(symbol, 1.0) for symbol, score in candidates[:BUYS_PER_DAY]]
+            if risk_check:
+                risk.feed(risk_model, daily, until_day=day - 1)
+                picks, _ = risk.select(risk_model, [c[0] for c in candidates], list(positions), BUYS_PER_DAY)
+
+            for symbol, factor in picks:
+                bars  = session[symbol]
+                index = int(np.searchsorted(bars["t"], open_ts + ENTRY_DELAY))
+                if index >= len(bars["t"]):
+                    continue
+                price = float(bars["o"][index])
+                qty   = int(position_size(capital, price) * factor)
+                if qty > 0:
+                    capital -= qty * price
+                    positions[symbol] = {
+                        "qty":       qty,
+                        "buy_price": price,
+                        "buy_date":  date_str,
+                        "exit":      exits.new_state(price, date_str)
+                    }
+                    entered[symbol] = index
+
+        # יציאות — כללי exits.py על כל נר דקה, מילוי בפתיחה של הנר הבא
+        for symbol in list(positions):
+            if symbol in pending or symbol not in session:
+                continue
+            bars  = session[symbol]
+            start = entered.get(symbol, 0)
+            hit   = exits.first_exit(positions[symbol]["exit"], bars["c"][start:], date_str)
+            if hit is None:
+                continue
+            index, reason = hit
+            fill = start + index + 1
+            if fill < len(bars["t"]):
+                capital += close_position(positions, trades, symbol, float(bars["o"][fill]), reason, date_str)
+            else:
+                pending[symbol] = reason
+
+        # שווי בסוף היום
+        for symbol, bars in session.items():
+            last_price[symbol] = float(bars["c"][-1])
+        daily_capital.append(capital + sum(pos["qty"] * last_price.get(symbol, pos["buy_price"])
+                                           for symbol, pos in positions.items()))
+
+    elapsed = time.time() - started
+    logger.info(f"backtest תוך-יומי: {bars_seen} נרות דקה ב-{elapsed:.1f} שניות")
+    # קצב = backtest_minute_bars / backtest_minute_seconds_sum
+    metrics.inc("backtest_minute_bars", bars_seen)
+    metrics.observe("backtest_minute_seconds", elapsed)
+
+    results = summarize(trades, daily_capital, initial_capital, start_date, end_date)
+    results["minute_bars"] = bars_seen
+    return results
@@ -0,0 +1,47 @@
+"""
+סיום Job — מעדכן את הסטטוס שה-Brain כתב ב-job:{JOB_ID} ושולח את התוצאה
+לכל הצ'אטים שביקשו את אותה משימה בזמן שה-Job רץ (ראה brain/inflight.py).
+
+הסטטוס והקריאה של ה-waiters נעשים ב-MULTI אחד: ה-Brain מצטרף עם WATCH
+על job:{JOB_ID}, אז waiter נרשם לפני הסיום ומקבל את התוצאה, או אחרי
+הסיום ומקבל Job חדש — אף אחד לא נופל בין הכיסאות.
+"""
+import os
+import json
+import logging
+
+import outbox
+
+logger = logging.getLogger(__name__)
+
+JOB_ID  = os.environ.get("JOB_ID")
+CHAT_ID = os.environ.get("CHAT_ID")
+ROLE    = os.environ.get("ROLE")
+
+JOB_STATUS_TTL = 3600
+
+
+def finish(status: str) -> list:
+    """מסמן את ה-Job כ-done / failed ומחזיר את הצ'אטים שמחכים לתוצאה"""
+    import redis
+    client = redis.Redis(host="redis-service", port=6379, decode_responses=True)
+    data   = {"chat_id": int(CHAT_ID) if CHAT_ID else None, "agent_type": ROLE, "status": status}
+    pipe   = client.pipeline(transaction=True)
+    pipe.setex(f"job:{JOB_ID}", JOB_STATUS_TTL, json.dumps(data))
+    pipe.smembers(f"job:{JOB_ID}:waiters")
+    pipe.delete(f"job:{JOB_ID}:waiters")
+    return sorted(pipe.execute()[1])
+
+
+async def complete(status: str = "done"):
+    # CronJobs לא נוצרים דרך ה-Brain ואין להם סטטוס
+    if not JOB_ID:
+        return
+    try:
+        waiters = finish(status)
+    except Exception as e:
+        logger.warning(f"עדכון סטטוס ה-Job נכשל: {e}")
+        return
+    if waiters:
+        logger.info(f"שולח את התוצאה ל-{len(waiters)} צ'אטים נוספים")
+        await outbox.fan_out(waiters, failed=status != "done")
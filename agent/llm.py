@@ -0,0 +1,205 @@
+"""
+עטיפה אחת לקריאות Groq — מודדת latency ושימוש בטוקנים לכל שלב.
+
+stream_reply() צורכת את ה-stream של Groq ועורכת הודעת Telegram אחת
+תוך כדי יצירה, כך שהמשתמש רואה טקסט אחרי הטוקן הראשון ולא בסוף.
+
+cache_inputs מפעיל את ה-cache (ראה llm_cache.py) — מעבירים רק את מה
+שהתשובה באמת תלויה בו, למשל אינדיקטורים ותאריך ולא זמן העדכון.
+"""
+import os
+import time
+import asyncio
+import logging
+
+import llm_cache
+import metrics
+import outbox
+import tracing
+
+logger = logging.getLogger(__name__)
+
+GROQ_API_KEY   = os.environ.get("GROQ_API_KEY")
+TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
+MODEL          = "llama-3.3-70b-versatile"
+
+# LLM_STREAMING=0 מחזיר להתנהגות הישנה — completion מלא ואז הודעה אחת
+LLM_STREAMING = os.environ.get("LLM_STREAMING", "1") == "1"
+EDIT_INTERVAL = float(os.environ.get("LLM_EDIT_INTERVAL", "1.0"))   # שניות בין עריכות
+MAX_MESSAGE_LEN = 4096
+CACHE_TTL       = 6 * 60 * 60
+EMPTY_REPLY     = "🤷 המודל לא החזיר תשובה"   # Telegram לא מקבל הודעה ריקה
+STREAM_FAILED   = "❌ יצירת התשובה נכשלה — נסה שוב בעוד רגע"
+
+_client       = None
+_async_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        from groq import Groq
+        _client = Groq(api_key=GROQ_API_KEY)
+    return _client
+
+
+def complete(messages: list, max_tokens: int = None, stage: str = "groq", model: str = MODEL,
+             cache_inputs=None, cache_ttl: int = CACHE_TTL) -> str:
+    """מריץ completion ומחזיר את הטקסט. stage משמש כשם ה-span וכ-label במטריקות"""
+    cache_key = None
+    if cache_inputs is not None:
+        cache_key = llm_cache.make_key(model, stage, messages, cache_inputs)
+        cached    = llm_cache.get(cache_key, stage)
+        if cached is not None:
+            return cached
+
+    kwargs = {"model": model, "messages": messages}
+    if max_tokens is not None:
+        kwargs["max_tokens"] = max_tokens
+
+    start = time.time()
+    try:
+        response = get_client().chat.completions.create(**kwargs)
+    except Exception:
+        metrics.inc("groq_errors", stage=stage)
+        raise
+    finally:
+        end = time.time()
+        tracing.record(stage, start, end)
+        metrics.observe("groq_request_seconds", end - start, stage=stage)
+
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        metrics.inc("groq_tokens", usage.prompt_tokens or 0, stage=stage, kind="prompt")
+        metrics.inc("groq_tokens", usage.completion_tokens or 0, stage=stage, kind="completion")
+    result = response.choices[0].message.content
+    if cache_key:
+        llm_cache.put(cache_key, result, cache_ttl)
+    return result
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        from groq import AsyncGroq
+        _async_client = AsyncGroq(api_key=GROQ_API_KEY)
+    return _async_client
+
+
+async def _send(bot, chat_id, text: str):
+    """שולח הודעה ישירות (צריך את ה-message_id לעריכות), ומחכה אם Telegram ביקש להאט (429)"""
+    from telegram.error import RetryAfter
+    while True:
+        try:
+            return await bot.send_message(chat_id=chat_id, text=text)
+        except RetryAfter as e:
+            await asyncio.sleep(float(e.retry_after))
+
+
+async def _edit(bot, chat_id, message_id: int, text: str, parse_mode: str = None) -> float:
+    """עורך את ההודעה. מחזיר 0 בהצלחה, או כמה שניות לחכות אם Telegram ביקש להאט (429)"""
+    from telegram.error import BadRequest, RetryAfter
+    try:
+        await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, parse_mode=parse_mode)
+    except RetryAfter as e:
+        return float(e.retry_after)
+    except BadRequest as e:
+        if "not modified" in str(e).lower():
+            return 0
+        if parse_mode is None:
+            raise
+        # Markdown שבור בטקסט של המודל — עדיף טקסט רגיל מאשר לאבד את התשובה
+        try:
+            await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+        except RetryAfter as e:
+            return float(e.retry_after)
+    return 0
+
+
+async def stream_reply(messages: list, chat_id, prefix: str = "", max_tokens: int = None,
+                       stage: str = "groq", parse_mode: str = None, model: str = MODEL,
+                       cache_inputs=None, cache_ttl: int = CACHE_TTL) -> str:
+    """
+    שולח ל-chat_id את prefix ואחריו את תשובת המודל, תוך עריכה הדרגתית
+    של הודעה אחת כל EDIT_INTERVAL שניות. מחזיר את טקסט התשובה (בלי prefix).
+    עריכות הביניים נשלחות בלי parse_mode כי Markdown חלקי נשבר; העריכה
+    האחרונה נשלחת עם parse_mode.
+    """
+    cache_key = None
+    if cache_inputs is not None:
+        cache_key = llm_cache.make_key(model, stage, messages, cache_inputs)
+        cached    = llm_cache.get(cache_key, stage)
+        if cached is not None:
+            await outbox.send(chat_id, prefix + cached, parse_mode=parse_mode)
+            return cached
+
+    if not LLM_STREAMING:
+        result = complete(messages, max_tokens=max_tokens, stage=stage, model=model)
+        if cache_key:
+            llm_cache.put(cache_key, result, cache_ttl)
+        await outbox.send(chat_id, prefix + (result or EMPTY_REPLY), parse_mode=parse_mode)
+        return result
+
+    from telegram import Bot
+    bot = Bot(token=TELEGRAM_TOKEN)
+
+    kwargs = {"model": model, "messages": messages, "stream": True}
+    if max_tokens is not None:
+        kwargs["max_tokens"] = max_tokens
+
+    start = time.time()
+    with tracing.span("telegram"):
+        placeholder = await _send(bot, chat_id, f"{prefix}⏳")
+
+    parts, usage = [], None
+    first_token_at, next_edit = None, 0.0
+    try:
+        stream = await get_async_client().chat.completions.create(**kwargs)
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            x_groq = getattr(chunk, "x_groq", None)
+            if x_groq is not None and getattr(x_groq, "usage", None) is not None:
+                usage = x_groq.usage
+            if not delta:
+                continue
+            parts.append(delta)
+
+            now = time.time()
+            if first_token_at is None:
+                first_token_at = now
+                tracing.record(f"{stage}_first_token", start, now)
+                metrics.observe("groq_first_token_seconds", now - start, stage=stage)
+            if now >= next_edit:
+                text      = (prefix + "".join(parts))[:MAX_MESSAGE_LEN]
+                wait      = await _edit(bot, chat_id, placeholder.message_id, text)
+                next_edit = now + max(EDIT_INTERVAL, wait)
+    except Exception:
+        metrics.inc("groq_errors", stage=stage)
+        # שה-⏳ לא יישאר תלוי — ה-Job עצמו מדווח על הכישלון למעלה
+        try:
+            await _edit(bot, chat_id, placeholder.message_id, prefix + STREAM_FAILED)
+        except Exception as e:
+            logger.warning(f"עדכון הודעת ה-placeholder נכשל: {e}")
+        raise
+    finally:
+        end = time.time()
+        tracing.record(stage, start, end)
+        metrics.observe("groq_request_seconds", end - start, stage=stage)
+
+    if usage is not None:
+        metrics.inc("groq_tokens", usage.prompt_tokens or 0, stage=stage, kind="prompt")
+        metrics.inc("groq_tokens", usage.completion_tokens or 0, stage=stage, kind="completion")
+
+    result = "".join(parts)
+    full   = prefix + (result or EMPTY_REPLY)
+    if cache_key:
+        llm_cache.put(cache_key, result, cache_ttl)
+    with tracing.span("telegram"):
+        # העריכה האחרונה חייבת לעבור — מחכים אם Telegram מבקש
+        while (wait := await _edit(bot, chat_id, placeholder.message_id, full[:MAX_MESSAGE_LEN], parse_mode)):
+            await asyncio.sleep(wait)
+    outbox.remember(chat_id, full[:MAX_MESSAGE_LEN], parse_mode)
+    if len(full) > MAX_MESSAGE_LEN:
+        # ההמשך עובר דרך ה-outbox, שמפצל הודעות ארוכות
+        await outbox.send(chat_id, full[MAX_MESSAGE_LEN:])
+    return result
@@ -0,0 +1,99 @@
+"""
+Cache לתשובות Groq — אותן כניסות מחזירות תשובה ב-ms בלי לבזבז quota.
+
+המפתח הוא model + תבנית הפרומפט (stage ו-hash של ה-system prompt) + הכניסות
+אחרי נרמול: מספרים מעוגלים ל-CACHE_SIG_DIGITS ספרות משמעותיות, מפתחות
+ממוינים ורווחים מנורמלים. כך RSI של 34.61 ו-34.64 באותו יום נותנים אותו מפתח.
+
+התשובות נשמרות עם TTL, ו-ZSET של זמן גישה אחרון שומר על LRU: כשיש
+יותר מ-CACHE_MAX_ENTRIES, הישנות ביותר נמחקות.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED     = os.environ.get("LLM_CACHE", "1") == "1"
+CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "5000"))
+CACHE_SIG_DIGITS  = 3
+
+ENTRY_PREFIX = "llmcache:"
+LRU_KEY      = "llmcache:lru"
+STATS_KEY    = "llmcache:stats"
+
+_redis = None
+
+
+def _client():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis(host="redis-service", port=6379, decode_responses=True)
+    return _redis
+
+
+def canonicalize(value):
+    """מנרמל כניסות למפתח יציב"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return float(f"{value:.{CACHE_SIG_DIGITS}g}")
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold()
+    if isinstance(value, dict):
+        return {str(k): canonicalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v) for v in value]
+    return str(value)
+
+
+def make_key(model: str, stage: str, messages: list, inputs) -> str:
+    system   = next((m["content"] for m in messages if m.get("role") == "system"), "")
+    template = hashlib.sha256(f"{stage}\n{system}".encode()).hexdigest()[:16]
+    payload  = json.dumps({"model": model, "template": template, "inputs": canonicalize(inputs)},
+                          sort_keys=True, ensure_ascii=False)
+    return ENTRY_PREFIX + hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get(key: str, stage: str):
+    if not CACHE_ENABLED:
+        return None
+    try:
+        client = _client()
+        value  = client.get(key)
+        pipe   = client.pipeline(transaction=False)
+        if value is None:
+            pipe.hincrby(STATS_KEY, "misses", 1)
+        else:
+            pipe.hincrby(STATS_KEY, "hits", 1)
+            pipe.zadd(LRU_KEY, {key: time.time()})
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"קריאה מה-LLM cache נכשלה: {e}")
+        return None
+    metrics.inc("llm_cache_lookups", stage=stage, result="miss" if value is None else "hit")
+    return value
+
+
+def put(key: str, value: str, ttl: int):
+    if not CACHE_ENABLED or not value:
+        return
+    try:
+        client = _client()
+        pipe   = client.pipeline(transaction=False)
+        pipe.setex(key, ttl, value)
+        pipe.zadd(LRU_KEY, {key: time.time()})
+        pipe.zcard(LRU_KEY)
+        size = pipe.execute()[-1]
+        if size > CACHE_MAX_ENTRIES:
+            evicted = [k for k, _ in client.zpopmin(LRU_KEY, size - CACHE_MAX_ENTRIES)]
+            if evicted:
+                client.delete(*evicted)
+                client.hincrby(STATS_KEY, "evictions", len(evicted))
+    except Exception as e:
+        logger.warning(f"כתיבה ל-LLM cache נכשלה: {e}")
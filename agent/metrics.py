@@ -0,0 +1,56 @@
+"""
+מטריקות לסוכנים — counters ו-histograms שנצברים ב-Redis.
+
+פוד של סוכן חי שניות ונמחק אחרי ttl_seconds_after_finished, אז אין לו
+endpoint משלו. כל ריצה צוברת ערכים בזיכרון ושולחת אותם ב-flush() אחד
+ל-Redis (HINCRBYFLOAT), וה-Brain חושף אותם ב-/metrics בפורמט Prometheus.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_KEY   = "metrics:counters"
+HISTOGRAMS_KEY = "metrics:histograms"
+
+# שניות — עד 10 דקות בשביל backtest
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_counters   = {}
+_histograms = {}
+
+
+def _labels(labels: dict) -> str:
+    return ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+
+
+def inc(name: str, value: float = 1, **labels):
+    """מעלה counter — למשל inc("alpaca_requests", status="429")"""
+    field = f"{name}|{_labels(labels)}"
+    _counters[field] = _counters.get(field, 0) + value
+
+
+def observe(name: str, value: float, **labels):
+    """מוסיף תצפית ל-histogram (בשניות)"""
+    series = f"{name}|{_labels(labels)}"
+    bucket = next((str(b) for b in BUCKETS if value <= b), "+Inf")
+    for field, delta in ((f"{series}|{bucket}", 1), (f"{series}|sum", value), (f"{series}|count", 1)):
+        _histograms[field] = _histograms.get(field, 0) + delta
+
+
+def flush():
+    """שולח את כל מה שנצבר ל-Redis ב-pipeline אחד"""
+    if not _counters and not _histograms:
+        return
+    try:
+        import redis
+        client = redis.Redis(host="redis-service", port=6379, decode_responses=True)
+        pipe   = client.pipeline(transaction=False)
+        for field, value in _counters.items():
+            pipe.hincrbyfloat(COUNTERS_KEY, field, value)
+        for field, value in _histograms.items():
+            pipe.hincrbyfloat(HISTOGRAMS_KEY, field, value)
+        pipe.execute()
+        _counters.clear()
+        _histograms.clear()
+    except Exception as e:
+        logger.warning(f"שליחת מטריקות ל-Redis נכשלה: {e}")
@@ -0,0 +1,73 @@
+"""
+שליחת הודעות Telegram דרך ה-outbox של ה-Brain.
+
+הסוכן לא שולח ישירות — הוא כותב ל-Redis stream, וה-Brain מאחד הודעות
+רצופות, שומר על מגבלות ה-flood ומנסה שוב על 429 (ראה brain/outbox.py).
+אם Redis לא זמין, נופלים לשליחה ישירה כדי לא לאבד את ההודעה.
+
+כל מה שנשלח ל-CHAT_ID של ה-Job נשמר ב-transcript, כדי שבסוף הריצה
+אפשר יהיה לשלוח את אותה תוצאה לצ'אטים שביקשו משימה זהה (fan_out).
+"""
+import os
+import time
+import logging
+
+import tracing
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
+CHAT_ID        = os.environ.get("CHAT_ID")
+
+OUTBOX_STREAM = "outbox"
+OUTBOX_MAXLEN = 100000
+
+_redis     = None
+transcript = []   # (text, parse_mode) שנשלחו ל-CHAT_ID
+
+
+def _client():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis(host="redis-service", port=6379, decode_responses=True)
+    return _redis
+
+
+def remember(chat_id, text: str, parse_mode: str = None):
+    """רושם הודעה שנשלחה ל-CHAT_ID — גם כזו שלא עברה דרך send (הודעה שנערכה ב-streaming)"""
+    if str(chat_id) == str(CHAT_ID):
+        transcript.append((text, parse_mode))
+
+
+async def send(chat_id, text: str, parse_mode: str = None):
+    remember(chat_id, text, parse_mode)
+    fields = {
+        "chat_id":     str(chat_id),
+        "text":        text,
+        "parse_mode":  parse_mode or "",
+        "enqueued_at": f"{time.time():.6f}",
+        "trace_id":    tracing.TRACE_ID,
+        "role":        tracing.ROLE
+    }
+    with span("telegram_enqueue"):
+        try:
+            _client().xadd(OUTBOX_STREAM, fields, maxlen=OUTBOX_MAXLEN, approximate=True)
+            return
+        except Exception as e:
+            logger.warning(f"outbox לא זמין ({e}), שולח ישירות ל-Telegram")
+
+    from telegram import Bot
+    with span("telegram"):
+        await Bot(token=TELEGRAM_TOKEN).send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+
+
+async def fan_out(chat_ids: list, failed: bool = False):
+    """שולח את כל מה שה-Job שלח ל-CHAT_ID גם לצ'אטים האחרים שחיכו לו"""
+    messages = list(transcript)
+    if failed:
+        messages.append(("❌ המשימה נכשלה — נסה לשלוח אותה שוב.", None))
+    for chat_id in chat_ids:
+        for text, parse_mode in messages:
+            await send(chat_id, text, parse_mode=parse_mode)
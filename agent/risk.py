@@ -0,0 +1,233 @@
+"""
+בדיקת ריכוז סיכון לפני קנייה — קורלציה בין המועמדים לבין מה שכבר בתיק.
+
+RollingCovariance מחזיק את התשואות היומיות של WINDOW הימים האחרונים לכל
+המניות, ומתעדכן יום אחד בכל פעם: שורה חדשה נכנסת, הישנה יוצאת, וסכומי
+המכפלות (n×n) מתעדכנים ב-outer product — בלי לחשב מחדש את כל החלון.
+ה-state נשמר ב-Redis בין ריצות (load_model / save_model), כך שסריקת הבוקר
+רק מוסיפה את הימים החדשים.
+
+select() עובר על המועמדים לפי סדר הציון: מועמד שהקורלציה שלו עם מניה בתיק
+(או עם מועמד שכבר נבחר) היא MAX_CORRELATION ומעלה נפסל, והשאר מקבלים מקדם
+גודל לפי הקורלציה הממוצעת שלהם עם התיק. אותה פונקציה רצה בסריקה וב-backtest.
+"""
+import os
+import json
+import time
+import logging
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WINDOW          = int(os.environ.get("RISK_WINDOW", "60"))              # ימי מסחר
+MAX_CORRELATION = float(os.environ.get("RISK_MAX_CORRELATION", "0.8"))
+MIN_SIZE        = 0.25   # מקדם הגודל המינימלי למועמד שעבר
+MIN_HISTORY     = 20     # פחות תשואות מזה — הקורלציות לא אמינות, לא מסננים
+
+CACHE_KEY = "risk:covariance"
+CACHE_TTL = 60 * 60 * 24 * 7
+
+_redis = None
+
+
+def _client():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis(host="redis-service", port=6379, decode_responses=True)
+    return _redis
+
+
+class RollingCovariance:
+    """
+    חלון מתגלגל של תשואות log יומיות ל-symbols. update() מוסיף יום ב-O(n²),
+    correlation() מחזיר את מטריצת הקורלציה הנוכחית.
+    """
+    __slots__ = ("symbols", "index", "window", "returns", "cursor", "count",
+                 "total", "cross", "last_close", "last_day")
+
+    def __init__(self, symbols: list, window: int = WINDOW):
+        n = len(symbols)
+        self.symbols    = list(symbols)
+        self.index      = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.window     = window
+        self.returns    = np.zeros((window, n))
+        self.cursor     = 0
+        self.count      = 0
+        self.total      = np.zeros(n)
+        self.cross      = np.zeros((n, n))
+        self.last_close = np.full(n, np.nan)
+        self.last_day   = None
+
+    def update(self, day: int, closes: np.ndarray):
+        """
+        closes — מחיר הסגירה של כל מניה ביום day (NaN אם אין נר).
+        מניה בלי נר נחשבת כתשואה 0 והסגירה האחרונה שלה נשמרת.
+        """
+        if self.last_day is not None and day <= self.last_day:
+            return
+        valid = np.isfinite(closes) & np.isfinite(self.last_close)
+        row   = np.zeros(len(self.symbols))
+        row[valid] = np.log(closes[valid] / self.last_close[valid])
+        self.last_close = np.where(np.isfinite(closes), closes, self.last_close)
+        self.last_day   = int(day)
+        if valid.any():
+            self.push(row)
+
+    def push(self, row: np.ndarray):
+        if self.count == self.window:
+            old = self.returns[self.cursor]
+            self.total -= old
+            self.cross -= np.outer(old, old)
+        else:
+            self.count += 1
+        self.returns[self.cursor] = row
+        self.total += row
+        self.cross += np.outer(row, row)
+        self.cursor = (self.cursor + 1) % self.window
+        if self.cursor == 0:
+            # פעם בחלון מחשבים את הסכומים מחדש, כדי שטעויות עיגול לא יצטברו
+            rows       = self.returns[:self.count]
+            self.total = rows.sum(axis=0)
+            self.cross = rows.T @ rows
+
+    def covariance(self) -> np.ndarray:
+        if self.count < 2:
+            return None
+        mean = self.total / self.count
+        return (self.cross - self.count * np.outer(mean, mean)) / (self.count - 1)
+
+    def correlation(self) -> np.ndarray:
+        cov = self.covariance()
+        if cov is None:
+            return None
+        std = np.sqrt(np.clip(np.diag(cov), 0, None))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = cov / np.outer(std, std)
+        corr[~np.isfinite(corr)] = 0.0
+        np.fill_diagonal(corr, 1.0)
+        return corr
+
+    def to_dict(self) -> dict:
+        """ל-JSON — התשואות לפי סדר כרונולוגי, הסכומים מחושבים מחדש בטעינה"""
+        order = np.roll(np.arange(self.window), -self.cursor)[-self.count:] if self.count else []
+        return {
+            "symbols":    self.symbols,
+            "window":     self.window,
+            "returns":    self.returns[order].tolist() if self.count else [],
+            "last_close": [None if np.isnan(c) else float(c) for c in self.last_close],
+            "last_day":   self.last_day
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RollingCovariance":
+        model = cls(data["symbols"], data["window"])
+        for row in data["returns"]:
+            model.push(np.array(row))
+        model.last_close = np.array([np.nan if c is None else c for c in data["last_close"]])
+        model.last_day   = data["last_day"]
+        return model
+
+
+def feed(model: RollingCovariance, bars_by_symbol: dict, until_day: int = None):
+    """מוסיף למודל את כל הימים שאחרי model.last_day (ועד until_day כולל)"""
+    after = model.last_day if model.last_day is not None else -1
+    parts = {}
+    for symbol in model.symbols:
+        bars = bars_by_symbol.get(symbol)
+        if bars is None or not len(bars):
+            continue
+        bars = bars[int(np.searchsorted(bars.t, after, side="right")):]
+        if until_day is not None:
+            bars = bars.until(until_day)
+        if len(bars):
+            parts[symbol] = bars
+    if not parts:
+        return
+
+    days   = np.unique(np.concatenate([bars.t for bars in parts.values()]))
+    closes = np.full((len(days), len(model.symbols)), np.nan)
+    for symbol, bars in parts.items():
+        closes[np.searchsorted(days, bars.t), model.index[symbol]] = bars.c
+    for day, row in zip(days, closes):
+        model.update(day, row)
+
+
+def select(model: RollingCovariance, candidates: list, held: list, limit: int) -> tuple:
+    """
+    candidates — symbols לפי סדר הציון, held — מה שכבר בתיק.
+    מחזיר (picked [(symbol, מקדם גודל)], skipped [(symbol, המניה הקרובה, קורלציה)])
+    """
+    corr = model.correlation() if model.count >= MIN_HISTORY else None
+    if corr is None:
+        return [(symbol, 1.0) for symbol in candidates[:limit]], []
+
+    book    = [model.index[symbol] for symbol in held if symbol in model.index]
+    picked  = []
+    skipped = []
+    for symbol in candidates:
+        if len(picked) >= limit:
+            break
+        i = model.index.get(symbol)
+        if i is None:
+            picked.append((symbol, 1.0))
+            continue
+        # מניה שכבר בתיק נבדקת מול שאר התיק — לא מול עצמה (קורלציה 1)
+        others    = [j for j in book if j != i]
+        book_corr = corr[i, others]
+        if book_corr.size and book_corr.max() >= MAX_CORRELATION:
+            closest = int(np.argmax(book_corr))
+            skipped.append((symbol, model.symbols[others[closest]], round(float(book_corr[closest]), 2)))
+            continue
+        factor = 1.0
+        if book_corr.size:
+            factor = float(np.clip(1 - max(book_corr.mean(), 0), MIN_SIZE, 1))
+        picked.append((symbol, factor))
+        if i not in book:
+            book.append(i)
+    metrics.inc("risk_candidates_skipped", len(skipped))
+    return picked, skipped
+
+
+def load_model(symbols: list):
+    """המודל מה-cache, או None אם אין / המניות השתנו"""
+    try:
+        raw = _client().get(CACHE_KEY)
+    except Exception as e:
+        logger.warning(f"קריאת מודל הסיכון מה-cache נכשלה: {e}")
+        return None
+    if not raw:
+        return None
+    data = json.loads(raw)
+    if data["symbols"] != list(symbols) or data["window"] != WINDOW:
+        return None
+    return RollingCovariance.from_dict(data)
+
+
+def save_model(model: RollingCovariance):
+    try:
+        _client().setex(CACHE_KEY, CACHE_TTL, json.dumps(model.to_dict()))
+    except Exception as e:
+        logger.warning(f"שמירת מודל הסיכון ל-cache נכשלה: {e}")
+
+
+def model_for(symbols: list, bars_by_symbol: dict) -> RollingCovariance:
+    """
+    מודל עדכני ל-symbols: מה-cache + הימים החדשים מ-bars_by_symbol.
+    אם ה-cache חסר, או שיש פער בינו לבין הנרות — בונים מחדש מהנרות.
+    """
+    started = time.time()
+    model   = load_model(symbols)
+    first   = min((int(bars.t[0]) for bars in bars_by_symbol.values() if len(bars)), default=None)
+    if model is not None and (model.last_day is None or first is None or model.last_day < first):
+        model = None
+    metrics.inc("risk_model_cache", result="miss" if model is None else "hit")
+    if model is None:
+        model = RollingCovariance(symbols)
+    feed(model, bars_by_symbol)
+    save_model(model)
+    metrics.observe("risk_model_seconds", time.time() - started)
+    return model
@@ -1,11 +1,21 @@
 import os
 import json
+import time
 import asyncio
 import logging
-from groq import Groq
-from telegram import Bot
-import requests
-from datetime import datetime, timedelta
+from tracing import span
+import outbox
+import alpaca
+import account_cache
+import exit_engine
+import exits
+import metrics
+import risk
+import strategy
+from analyst import fetch_bars_batch
+from bar_loader import Bars
+from strategy import WATCHLIST
+from datetime import datetime
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,295 +23,309 @@ logger = logging.getLogger(__name__)
 TELEGRAM_TOKEN    = os.environ.get("TELEGRAM_TOKEN")
 CHAT_ID           = os.environ.get("CHAT_ID")
 TASK              = os.environ.get("TASK", "morning_scan")
-GROQ_API_KEY      = os.environ.get("GROQ_API_KEY")
 ALPACA_API_KEY    = os.environ.get("ALPACA_API_KEY")
 ALPACA_SECRET_KEY = os.environ.get("ALPACA_SECRET_KEY")
 ALPACA_BASE_URL   = os.environ.get("ALPACA_BASE_URL", "https://paper-api.alpaca.markets")
+ALPACA_DATA_URL   = os.environ.get("ALPACA_DATA_URL", "https://data.alpaca.markets")
+
+# אופציונלי — כמה חשבונות/צ'אטים לאותה סריקה (ראה load_accounts)
+SCAN_ACCOUNTS     = os.environ.get("SCAN_ACCOUNTS")
 
 HEADERS = {
     "APCA-API-KEY-ID": ALPACA_API_KEY,
     "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
 }
 
-# רשימת המניות לסריקה
-WATCHLIST = [
-    "AAPL", "MSFT", "GOOGL", "AMZN", "NVDA",
-    "META", "TSLA", "AMD",  "NFLX", "CRM",
-    "SHOP", "SQ",   "COIN", "PLTR", "UBER",
-    "SNAP", "SPOT", "ZM",   "RBLX", "PYPL"
-]
-
-
-def get_stock_bars(symbol: str) -> list:
-    """שולף נתוני מניה מ-Alpaca"""
-    start_date = (datetime.now() - timedelta(days=60)).strftime("%Y-%m-%d")
-    url        = f"https://data.alpaca.markets/v2/stocks/{symbol}/bars"
-    params     = {"timeframe": "1Day", "limit": 30, "start": start_date}
-    response   = requests.get(url, headers=HEADERS, params=params)
-    data       = response.json()
-    return data.get("bars", [])
-
-
-def calculate_rsi(closes: list, period: int = 14) -> float:
-    if len(closes) < period + 1:
-        return 50.0
-    gains, losses = [], []
-    for i in range(1, len(closes)):
-        diff = closes[i] - closes[i-1]
-        gains.append(max(diff, 0))
-        losses.append(max(-diff, 0))
-    avg_gain = sum(gains[-period:]) / period
-    avg_loss = sum(losses[-period:]) / period
-    if avg_loss == 0:
-        return 100.0
-    rs = avg_gain / avg_loss
-    return 100 - (100 / (1 + rs))
-
-
-def scan_stock(symbol: str) -> dict:
-    """סורק מניה אחת ומחזיר ציון"""
-    try:
-        bars = get_stock_bars(symbol)
-        if len(bars) < 10:
-            return None
-
-        closes        = [bar["c"] for bar in bars]
-        volumes       = [bar["v"] for bar in bars]
-        rsi           = calculate_rsi(closes)
-        ma7           = sum(closes[-7:])  / min(7,  len(closes))
-        ma20          = sum(closes[-20:]) / min(20, len(closes))
-        current_price = closes[-1]
-        prev_price    = closes[-2]
-        change_pct    = ((current_price - prev_price) / prev_price) * 100
-        avg_volume    = sum(volumes[-10:]) / 10
-        curr_volume   = volumes[-1]
-        volume_ratio  = curr_volume / avg_volume if avg_volume > 0 else 1
-
-        # ציון הזדמנות (0-100)
-        score = 0
-
-        # RSI בין 35-50 = הזדמנות קנייה טובה
-        if 35 <= rsi <= 50:
-            score += 30
-        elif 30 <= rsi <= 35:
-            score += 20
-
-        # MA7 מעל MA20 = מגמה חיובית
-        if ma7 > ma20:
-            score += 25
-
-        # נפח גבוה = עניין בשוק
-        if volume_ratio > 1.5:
-            score += 20
-
-        # שינוי חיובי קטן = מומנטום
-        if 0 < change_pct < 3:
-            score += 25
-
-        return {
-            "symbol":       symbol,
-            "price":        round(current_price, 2),
-            "change_pct":   round(change_pct, 2),
-            "rsi":          round(rsi, 2),
-            "ma7":          round(ma7, 2),
-            "ma20":         round(ma20, 2),
-            "volume_ratio": round(volume_ratio, 2),
-            "score":        score
-        }
-    except Exception as e:
-        logger.warning(f"שגיאה בסריקת {symbol}: {e}")
+BUY_QTY           = 2     # מניות לכל קנייה בסריקת הבוקר, לפני מקדם הסיכון
+RISK_HISTORY_DAYS = 100   # ימים קלנדריים — מספיק לחלון של risk.WINDOW ימי מסחר
+
+
+def load_accounts() -> list:
+    """
+    החשבונות שהסריקה רצה עבורם. SCAN_ACCOUNTS הוא JSON (מה-secret):
+      [{"name": "main", "chat_ids": ["123"], "key_id": "...", "secret_key": "...", "base_url": "..."}]
+    בלי SCAN_ACCOUNTS — חשבון אחד מה-env הרגיל, כמו קודם.
+    """
+    if not SCAN_ACCOUNTS:
+        return [{"name": "main", "chat_ids": [CHAT_ID], "headers": HEADERS, "base_url": ALPACA_BASE_URL}]
+
+    accounts = []
+    for i, entry in enumerate(json.loads(SCAN_ACCOUNTS)):
+        chat_ids = entry.get("chat_ids") or [entry["chat_id"]]
+        accounts.append({
+            "name":     entry.get("name", f"account-{i + 1}"),
+            "chat_ids": [str(chat_id) for chat_id in chat_ids],
+            "headers":  {"APCA-API-KEY-ID": entry["key_id"], "APCA-API-SECRET-KEY": entry["secret_key"]},
+            "base_url": entry.get("base_url", ALPACA_BASE_URL)
+        })
+    return accounts
+
+
+def all_chats(accounts: list) -> list:
+    """כל הצ'אטים, בלי כפילויות — להודעות שזהות לכל החשבונות"""
+    chats = []
+    for account in accounts:
+        for chat_id in account["chat_ids"]:
+            if chat_id not in chats:
+                chats.append(chat_id)
+    return chats
+
+
+async def notify(chat_ids: list, text: str, parse_mode: str = None):
+    for chat_id in chat_ids:
+        await outbox.send(chat_id, text, parse_mode=parse_mode)
+
+
+def scan_stock(symbol: str, bars: Bars, values: dict) -> dict:
+    """
+    השורה של מניה אחת בדוח — values הם הערכים בנר האחרון מ-strategy.latest.
+    הציון עצמו (כללים ומשקלים) מוגדר ב-strategy.STRATEGY
+    """
+    if len(bars) < 10 or values is None:
         return None
+    return {
+        "symbol":       symbol,
+        "price":        round(values["close"], 2),
+        "change_pct":   round(values["change_pct"], 2),
+        "rsi":          round(values["rsi"], 2),
+        "ma7":          round(values["ma7"], 2),
+        "ma20":         round(values["ma20"], 2),
+        "volume_ratio": round(values["volume_ratio"], 2),
+        "score":        values["score"]
+    }
+
+
+def get_current_positions(account: dict) -> list:
+    """מחזיר פוזיציות פתוחות (מה-cache אם עדכני)"""
+    return account_cache.get_positions(account["headers"], account["base_url"])
+
+
+def place_order(account: dict, symbol: str, qty: str, side: str) -> bool:
+    """פקודת שוק — True אם Alpaca קיבל אותה"""
+    url  = f"{account['base_url']}/v2/orders"
+    body = {
+        "symbol":        symbol,
+        "qty":           qty,
+        "side":          side,
+        "type":          "market",
+        "time_in_force": "day"
+    }
+    response = alpaca.post(url, headers={**account["headers"], "Content-Type": "application/json"}, json=body)
+    account_cache.invalidate(account["headers"])
+    return "id" in response.json()
+
+
+def check_evening_positions(account: dict, positions: list) -> list:
+    """בודק אילו פוזיציות צריך למכור — אותם כללים כמו exit_engine וה-backtest (exits.py)"""
+    today  = datetime.now().strftime("%Y-%m-%d")
+    states = exit_engine.position_states(account["headers"], positions, today)
+    to_sell, changed = [], {}
+    for pos in positions:
+        symbol = pos.get("symbol")
+        state  = states[symbol]
+        price  = float(pos.get("current_price", 0))
+        if exits.update(state, price):
+            changed[symbol] = state
+        reason = exits.check_exit(state, price, today)
+        if reason:
+            to_sell.append({"symbol": symbol, "qty": pos.get("qty"), "reason": exits.describe(reason, state, price, today)})
+    exit_engine.save_states(account["headers"], changed)
+    return to_sell
 
 
-def get_current_positions() -> list:
-    """מחזיר פוזיציות פתוחות"""
-    url      = f"{ALPACA_BASE_URL}/v2/positions"
-    response = requests.get(url, headers=HEADERS)
-    return response.json()
-
+def is_market_bullish(spy_bars: Bars) -> bool:
+    """בודק אם השוק במגמה חיובית לפי SPY (פילטר השוק של strategy.py)"""
+    return bool(strategy.latest({"SPY": spy_bars}).get("SPY", {}).get("market", True))
 
-def check_evening_positions(positions: list) -> list:
-    """בודק אילו פוזיציות צריך למכור"""
-    to_sell = []
-    for pos in positions:
-        symbol  = pos.get("symbol")
-        pl_pct  = float(pos.get("unrealized_plpc", 0)) * 100
-        qty     = pos.get("qty")
 
-        # מכור אם רווח > 15% או הפסד > 10%
-        if pl_pct >= 15:
-            to_sell.append({"symbol": symbol, "qty": qty, "reason": f"רווח {pl_pct:.1f}% 🎯"})
-        elif pl_pct <= -10:
-            to_sell.append({"symbol": symbol, "qty": qty, "reason": f"Stop Loss {pl_pct:.1f}% 🛑"})
+def scan_market(held: list = ()) -> tuple:
+    """
+    החלק המשותף לכל החשבונות — נרות של כל ה-watchlist, SPY והמניות שבתיקים
+    בבקשה אחת, פילטר השוק, ציונים ומודל הקורלציות (risk.py).
+    מחזיר (market_ok, results ממוינים לפי ציון, risk_model)
+    """
+    risk_symbols = WATCHLIST + sorted(set(held) - set(WATCHLIST))
+    try:
+        bars_by_symbol = fetch_bars_batch(risk_symbols + ["SPY"], days=RISK_HISTORY_DAYS)
+    except Exception as e:
+        logger.error(f"שליפת נתוני שוק נכשלה: {e}")
+        return True, [], None
+
+    market_ok = is_market_bullish(bars_by_symbol.get("SPY", Bars.empty()))
+    watchlist = {symbol: bars_by_symbol.get(symbol, Bars.empty()) for symbol in WATCHLIST}
+    latest    = strategy.latest(watchlist)
+    results   = []
+    for symbol, bars in watchlist.items():
+        result = scan_stock(symbol, bars, latest.get(symbol))
+        if result:
+            results.append(result)
+    results.sort(key=lambda x: x["score"], reverse=True)
 
-    return to_sell
+    try:
+        risk_model = risk.model_for(risk_symbols, bars_by_symbol)
+    except Exception as e:
+        logger.error(f"בניית מודל הסיכון נכשלה: {e}")
+        risk_model = None
+    return market_ok, results, risk_model
 
 
+def account_tag(account: dict, accounts: list) -> str:
+    return f" ({account['name']})" if len(accounts) > 1 else ""
 
-def is_market_bullish() -> bool:
-    """בודק אם השוק במגמה חיובית לפי SPY"""
-    try:
-        start_date = (datetime.now() - timedelta(days=60)).strftime("%Y-%m-%d")
-        url        = "https://data.alpaca.markets/v2/stocks/SPY/bars"
-        params     = {"timeframe": "1Day", "limit": 25, "start": start_date}
-        response   = requests.get(url, headers=HEADERS, params=params)
-        bars       = response.json().get("bars", [])
-        if len(bars) < 20:
-            return True
-        closes  = [bar["c"] for bar in bars]
-        ma20    = sum(closes[-20:]) / 20
-        current = closes[-1]
-        return current > ma20
-    except:
-        return True
-
-
-async def morning_scan(bot: Bot):
-    """סריקת בוקר — מוצא הזדמנויות וקונה"""
-    logger.info("🌅 סריקת בוקר מתחילה...")
 
-    # בדוק אם השוק חיובי
-    market_ok = is_market_bullish()
-    market_msg = "🟢 השוק במגמה חיובית" if market_ok else "🔴 השוק במגמה שלילית — לא קונה היום"
+def positions_report(title: str, positions: list) -> list:
+    lines = [title]
+    total_pl = 0
+    for pos in positions:
+        pl     = float(pos.get("unrealized_pl", 0))
+        pl_pct = float(pos.get("unrealized_plpc", 0)) * 100
+        emoji  = "🟢" if pl >= 0 else "🔴"
+        total_pl += pl
+        lines.append(f"{emoji} {pos.get('symbol')}: ${pl:.2f} ({pl_pct:.1f}%)")
+    total_emoji = "🟢" if total_pl >= 0 else "🔴"
+    lines.append(f"\n{total_emoji} *סה\"כ P&L: ${total_pl:.2f}*")
+    return lines
 
-    await bot.send_message(
-        chat_id=CHAT_ID,
-        text=f"🌅 *סריקת בוקר מתחילה...*\n{market_msg}\nסורק 20 מניות, זה ייקח כדקה.",
-        parse_mode="Markdown"
-    )
 
+async def morning_account(account: dict, tag: str, market_ok: bool, top_picks: list, risk_model):
+    """החלק של חשבון אחד בסריקת הבוקר — מצב התיק או קנייה של Top 3"""
+    positions = await asyncio.to_thread(get_current_positions, account)
     if not market_ok:
-        positions = get_current_positions()
         if positions and isinstance(positions, list) and len(positions) > 0:
-            lines = ["📋 *מצב התיק הנוכחי:*\n"]
-            total_pl = 0
-            for pos in positions:
-                pl     = float(pos.get("unrealized_pl", 0))
-                pl_pct = float(pos.get("unrealized_plpc", 0)) * 100
-                emoji  = "🟢" if pl >= 0 else "🔴"
-                total_pl += pl
-                lines.append(f"{emoji} {pos.get('symbol')}: ${pl:.2f} ({pl_pct:.1f}%)")
-            total_emoji = "🟢" if total_pl >= 0 else "🔴"
-            lines.append(f"\n{total_emoji} *סה\"כ P&L: ${total_pl:.2f}*")
-            await bot.send_message(chat_id=CHAT_ID, text="\n".join(lines), parse_mode="Markdown")
+            lines = positions_report(f"📋 *מצב התיק הנוכחי{tag}:*\n", positions)
+            await notify(account["chat_ids"], "\n".join(lines), parse_mode="Markdown")
         else:
-            await bot.send_message(chat_id=CHAT_ID, text="📭 אין פוזיציות פתוחות כרגע.")
+            await notify(account["chat_ids"], f"📭 אין פוזיציות פתוחות כרגע{tag}.")
         return
 
-    # סריקת כל המניות
-    results = []
-    for symbol in WATCHLIST:
-        result = scan_stock(symbol)
-        if result:
-            results.append(result)
+    # קנייה אוטומטית של Top 3 — אחרי בדיקת קורלציה מול התיק (risk.py)
+    held       = [pos["symbol"] for pos in positions] if isinstance(positions, list) else []
+    candidates = [stock["symbol"] for stock in top_picks if stock["score"] >= strategy.DEFAULT.min_score]
+    if risk_model is not None:
+        picks, skipped = risk.select(risk_model, candidates, held, limit=3)
+    else:
+        picks, skipped = [(symbol, 1.0) for symbol in candidates[:3]], []
 
-    # מיון לפי ציון
-    results.sort(key=lambda x: x["score"], reverse=True)
-    top_picks = results[:5]  # 5 הטובות ביותר
+    bought = []
+    for symbol, factor in picks:
+        qty = max(1, round(BUY_QTY * factor))
+        try:
+            if await asyncio.to_thread(place_order, account, symbol, str(qty), "buy"):
+                bought.append(f"{symbol} ×{qty}")
+        except Exception as e:
+            logger.error(f"שגיאה בקנייה של {symbol}{tag}: {e}")
 
-    if not top_picks:
-        await bot.send_message(chat_id=CHAT_ID, text="😴 לא נמצאו הזדמנויות טובות הבוקר.")
-        return
+    lines = []
+    if bought:
+        lines.append(f"✅ *קניתי אוטומטית{tag}:* {', '.join(bought)}\nבמחיר שוק.")
+    for symbol, other, corr in skipped:
+        lines.append(f"⚠️ דילגתי על {symbol} — קורלציה {corr} עם {other}")
+    if lines:
+        await notify(account["chat_ids"], "\n".join(lines), parse_mode="Markdown")
 
-    # בניית הודעת סיכום
-    lines = ["📊 *סריקת בוקר — תוצאות:*\n"]
-    for i, stock in enumerate(top_picks, 1):
-        lines.append(
-            f"{i}. *{stock['symbol']}* — ציון: {stock['score']}/100\n"
-            f"   💰 ${stock['price']} | RSI: {stock['rsi']} | שינוי: {stock['change_pct']}%\n"
-        )
 
-    await bot.send_message(chat_id=CHAT_ID, text="\n".join(lines), parse_mode="Markdown")
+async def morning_scan():
+    """סריקת בוקר — סורק פעם אחת וקונה לכל החשבונות במקביל"""
+    logger.info("🌅 סריקת בוקר מתחילה...")
+    accounts = load_accounts()
+    chats    = all_chats(accounts)
 
-    # קנייה אוטומטית של Top 3
-    bought = []
-    for stock in top_picks[:3]:
-        if stock["score"] >= 50:  # קנה רק אם ציון גבוה מספיק
-            try:
-                url  = f"{ALPACA_BASE_URL}/v2/orders"
-                body = {
-                    "symbol":        stock["symbol"],
-                    "qty":           "2",
-                    "side":          "buy",
-                    "type":          "market",
-                    "time_in_force": "day"
-                }
-                response = requests.post(url, headers={**HEADERS, "Content-Type": "application/json"}, json=body)
-                result   = response.json()
-                if "id" in result:
-                    bought.append(stock["symbol"])
-            except Exception as e:
-                logger.error(f"שגיאה בקנייה של {stock['symbol']}: {e}")
+    # הפוזיציות של כל החשבונות (מה-cache) — כדי שמודל הסיכון יכסה גם אותן
+    positions = await asyncio.gather(*(asyncio.to_thread(get_current_positions, account) for account in accounts),
+                                     return_exceptions=True)
+    held      = sorted({pos["symbol"] for account_positions in positions if isinstance(account_positions, list)
+                        for pos in account_positions})
 
-    if bought:
-        await bot.send_message(
-            chat_id=CHAT_ID,
-            text=f"✅ *קניתי אוטומטית:* {', '.join(bought)}\n2 מניות מכל אחת במחיר שוק.",
-            parse_mode="Markdown"
-        )
+    with span("scan_market"):
+        market_ok, results, risk_model = scan_market(held)
+    market_msg = "🟢 השוק במגמה חיובית" if market_ok else "🔴 השוק במגמה שלילית — לא קונה היום"
 
+    await notify(
+        chats,
+        f"🌅 *סריקת בוקר מתחילה...*\n{market_msg}\nסורק {len(WATCHLIST)} מניות.",
+        parse_mode="Markdown"
+    )
 
-async def evening_scan(bot: Bot):
-    """סריקת ערב — בודק פוזיציות ומוכר לפי הצורך"""
-    logger.info("🌆 סריקת ערב מתחילה...")
+    top_picks = results[:5]  # 5 הטובות ביותר
+    if market_ok:
+        if not top_picks:
+            await notify(chats, "😴 לא נמצאו הזדמנויות טובות הבוקר.")
+            return
+
+        # בניית הודעת סיכום — זהה לכל החשבונות
+        lines = ["📊 *סריקת בוקר — תוצאות:*\n"]
+        for i, stock in enumerate(top_picks, 1):
+            lines.append(
+                f"{i}. *{stock['symbol']}* — ציון: {stock['score']}/100\n"
+                f"   💰 ${stock['price']} | RSI: {stock['rsi']} | שינוי: {stock['change_pct']}%\n"
+            )
+        await notify(chats, "\n".join(lines), parse_mode="Markdown")
+
+    await fan_out(accounts, morning_account, market_ok, top_picks, risk_model)
 
-    positions = get_current_positions()
+
+async def evening_account(account: dict, tag: str):
+    """סריקת ערב לחשבון אחד — בודק פוזיציות ומוכר לפי הצורך"""
+    positions = await asyncio.to_thread(get_current_positions, account)
 
     if not positions:
-        await bot.send_message(chat_id=CHAT_ID, text="🌆 *סריקת ערב:* אין פוזיציות פתוחות.", parse_mode="Markdown")
+        await notify(account["chat_ids"], f"🌆 *סריקת ערב{tag}:* אין פוזיציות פתוחות.", parse_mode="Markdown")
         return
 
-    to_sell = check_evening_positions(positions)
+    to_sell = await asyncio.to_thread(check_evening_positions, account, positions)
 
     # מכירה אוטומטית
     sold = []
     for item in to_sell:
         try:
-            url  = f"{ALPACA_BASE_URL}/v2/orders"
-            body = {
-                "symbol":        item["symbol"],
-                "qty":           item["qty"],
-                "side":          "sell",
-                "type":          "market",
-                "time_in_force": "day"
-            }
-            response = requests.post(url, headers={**HEADERS, "Content-Type": "application/json"}, json=body)
-            result   = response.json()
-            if "id" in result:
+            if await asyncio.to_thread(place_order, account, item["symbol"], item["qty"], "sell"):
                 sold.append(f"{item['symbol']} ({item['reason']})")
         except Exception as e:
-            logger.error(f"שגיאה במכירה של {item['symbol']}: {e}")
+            logger.error(f"שגיאה במכירה של {item['symbol']}{tag}: {e}")
 
     # דוח ערב
-    lines = ["🌆 *דוח ערב:*\n"]
-    total_pl = 0
-    for pos in positions:
-        symbol  = pos.get("symbol")
-        pl      = float(pos.get("unrealized_pl", 0))
-        pl_pct  = float(pos.get("unrealized_plpc", 0)) * 100
-        emoji   = "🟢" if pl >= 0 else "🔴"
-        total_pl += pl
-        lines.append(f"{emoji} {symbol}: ${pl:.2f} ({pl_pct:.1f}%)")
-
-    total_emoji = "🟢" if total_pl >= 0 else "🔴"
-    lines.append(f"\n{total_emoji} *סה\"כ P&L: ${total_pl:.2f}*")
-
+    lines = positions_report(f"🌆 *דוח ערב{tag}:*\n", positions)
     if sold:
         lines.append(f"\n🔄 *מכרתי:* {', '.join(sold)}")
 
-    await bot.send_message(chat_id=CHAT_ID, text="\n".join(lines), parse_mode="Markdown")
+    await notify(account["chat_ids"], "\n".join(lines), parse_mode="Markdown")
+
+
+async def evening_scan():
+    """סריקת ערב — כל החשבונות במקביל"""
+    logger.info("🌆 סריקת ערב מתחילה...")
+    await fan_out(load_accounts(), evening_account)
+
+
+async def fan_out(accounts: list, handler, *args):
+    """
+    מריץ את handler לכל חשבון במקביל. קריאות Alpaca רצות ב-thread, כך
+    שזמן הסריקה כמעט לא גדל עם מספר החשבונות. כשל בחשבון אחד לא עוצר את השאר.
+    """
+    results = await asyncio.gather(
+        *(handler(account, account_tag(account, accounts), *args) for account in accounts),
+        return_exceptions=True
+    )
+    for account, result in zip(accounts, results):
+        if isinstance(result, Exception):
+            logger.error(f"הסריקה נכשלה בחשבון {account['name']}: {result}")
+            metrics.inc("scan_account_errors", account=account["name"])
 
 
 async def run():
     logger.info(f"Scanner agent התעורר | task={TASK}")
-    bot = Bot(token=TELEGRAM_TOKEN)
 
+    start = time.time()
     if TASK == "morning_scan":
-        await morning_scan(bot)
+        with span("morning_scan"):
+            await morning_scan()
+        metrics.observe("scan_seconds", time.time() - start, task=TASK)
     elif TASK == "evening_scan":
-        await evening_scan(bot)
+        with span("evening_scan"):
+            await evening_scan()
+        metrics.observe("scan_seconds", time.time() - start, task=TASK)
     else:
-        await bot.send_message(chat_id=CHAT_ID, text=f"❓ TASK לא מוכר: {TASK}")
+        await outbox.send(CHAT_ID, f"❓ TASK לא מוכר: {TASK}")
 
 
 if __name__ == "__main__":
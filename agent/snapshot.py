@@ -0,0 +1,111 @@
+"""
+Snapshot אינדיקטורים — מחושב אחרי הסגירה ונשמר ב-Redis כ-hash לכל מניה.
+
+nightly_snapshot  — נרות יומיים לכל ה-watchlist + המניות הכי מבוקשות ב-analyst,
+                    בבקשת multi-symbol אחת, וחישוב RSI / MA / MACD / סיגנל
+intraday_snapshot — מעדכן רק מחיר ושינוי יומי לפי העסקה האחרונה
+
+ה-analyst קורא את ה-hash ב-round trip אחד, ורק אם אין snapshot שולף מ-Alpaca.
+"""
+import os
+import time
+import logging
+from datetime import datetime
+
+import alpaca
+import metrics
+from analyst import compute_all, fetch_bars_batch
+from strategy import WATCHLIST
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TASK              = os.environ.get("TASK", "nightly_snapshot")
+ALPACA_API_KEY    = os.environ.get("ALPACA_API_KEY")
+ALPACA_SECRET_KEY = os.environ.get("ALPACA_SECRET_KEY")
+ALPACA_DATA_URL   = os.environ.get("ALPACA_DATA_URL", "https://data.alpaca.markets")
+
+HEADERS = {
+    "APCA-API-KEY-ID": ALPACA_API_KEY,
+    "APCA-API-SECRET-KEY": ALPACA_SECRET_KEY
+}
+
+SNAPSHOT_TTL  = 60 * 60 * 26   # שורד עד ה-snapshot של הלילה הבא
+TOP_REQUESTED = 30
+
+
+def _client():
+    import redis
+    return redis.Redis(host="redis-service", port=6379, decode_responses=True)
+
+
+def snapshot_symbols(client) -> list:
+    """ה-watchlist ועוד המניות שהכי הרבה ביקשו לנתח"""
+    requested = client.zrevrange("analyst:requests", 0, TOP_REQUESTED - 1)
+    symbols   = list(WATCHLIST)
+    for symbol in requested:
+        if symbol not in symbols:
+            symbols.append(symbol)
+    return symbols
+
+
+def nightly_snapshot():
+    client  = _client()
+    symbols = snapshot_symbols(client)
+    logger.info(f"מחשב snapshot ל-{len(symbols)} מניות")
+
+    bars_by_symbol = fetch_bars_batch(symbols)
+    as_of          = datetime.now().strftime("%Y-%m-%d")
+    pipe           = client.pipeline(transaction=False)
+    written        = 0
+    computed       = compute_all({symbol: bars for symbol, bars in bars_by_symbol.items() if len(bars) >= 2})
+    for symbol, snapshot in computed.items():
+        snapshot["close"]      = snapshot["current_price"]
+        snapshot["as_of"]      = as_of
+        snapshot["updated_at"] = f"{time.time():.0f}"
+        key = f"snapshot:{symbol}"
+        pipe.delete(key)
+        pipe.hset(key, mapping={k: str(v) for k, v in snapshot.items()})
+        pipe.expire(key, SNAPSHOT_TTL)
+        written += 1
+    pipe.execute()
+    metrics.inc("snapshots_written", written, task="nightly")
+    logger.info(f"נשמרו {written} snapshots")
+
+
+def intraday_snapshot():
+    """מעדכן מחיר ושינוי לפי העסקה האחרונה — האינדיקטורים נשארים מהלילה"""
+    client  = _client()
+    symbols = snapshot_symbols(client)
+    url     = f"{ALPACA_DATA_URL}/v2/stocks/trades/latest"
+    trades  = alpaca.get(url, headers=HEADERS, params={"symbols": ",".join(symbols)}).json().get("trades") or {}
+
+    pipe = client.pipeline(transaction=False)
+    for symbol in trades:
+        pipe.hget(f"snapshot:{symbol}", "close")
+    closes = dict(zip(trades, pipe.execute()))
+
+    updated = 0
+    for symbol, trade in trades.items():
+        close = closes.get(symbol)
+        if not close:
+            continue
+        price      = float(trade["p"])
+        change_pct = (price - float(close)) / float(close) * 100
+        pipe.hset(f"snapshot:{symbol}", mapping={
+            "current_price": str(round(price, 2)),
+            "change_pct":    str(round(change_pct, 2)),
+            "updated_at":    f"{time.time():.0f}"
+        })
+        updated += 1
+    pipe.execute()
+    metrics.inc("snapshots_written", updated, task="intraday")
+    logger.info(f"עודכנו {updated} snapshots")
+
+
+async def run():
+    logger.info(f"Snapshot agent התעורר | task={TASK}")
+    if TASK == "intraday_snapshot":
+        intraday_snapshot()
+    else:
+        nightly_snapshot()
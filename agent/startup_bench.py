@@ -0,0 +1,158 @@
+"""
+מדידת cold start לכל role — כמה זמן לוקח לפוד להגיע לתחילת המשימה.
+
+כל ריצה היא תהליך Python חדש (כמו פוד חדש) עם -X importtime, שמייבא את
+agent.py וטוען את ה-role דרך load_role(). מודדים זמן כולל (כולל עליית
+המפרש), ומפרקים את זמן ה-imports לפי מודול עליון כדי לראות מי הכבד.
+
+הרצה:
+  python startup_bench.py                           # כל ה-roles, 5 ריצות לכל אחד
+  python startup_bench.py --roles analyst trader --runs 10 --top 5
+  python startup_bench.py --json startup.json       # שמירת תוצאות
+  python startup_bench.py --baseline startup.json   # נכשל (exit 1) אם role הואט מעבר ל-tolerance
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ROLES = ["analyst", "trader", "scanner", "snapshot", "backtest", "exits", "sweep", "researcher"]
+
+# תלויות כבדות שאסור שייטענו לפני שה-role באמת צריך אותן
+HEAVY_MODULES = ("groq", "telegram", "redis", "requests", "numpy")
+
+# אחרי load_role התהליך מדפיס אילו מ-HEAVY_MODULES נמצאים ב-sys.modules — כולל מה
+# שנטען בעקיפין (numpy דרך bar_loader וכו'), ש-importtime לא משייך ל-imports הישירים
+SNIPPET = (
+    "import sys, json, agent; agent.load_role({role!r}); "
+    "print(json.dumps(sorted(name for name in {heavy!r} if name in sys.modules)))"
+)
+
+
+def parse_importtime(stderr: str) -> dict:
+    """
+    מפרק את הפלט של -X importtime ל-{module: cumulative_us} לפי מודול עליון —
+    הזמן המצטבר שלו כבר כולל את כל מה שהוא ייבא. agent עצמו מפורק לפי
+    ה-imports הישירים שלו, אחרת כל ה-imports שלו היו מתחבאים בשורה אחת.
+    """
+    modules, children = {}, {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        name  = name.strip()
+        if depth == 1:
+            # -X importtime מדפיס את הילדים לפני האב
+            children[name] = children.get(name, 0) + int(cumulative)
+            continue
+        if depth > 1:
+            continue
+        if name == "agent":
+            modules.update(children)
+            modules["agent (self)"] = int(self_us)
+        else:
+            top = name.split(".")[0]
+            modules[top] = modules.get(top, 0) + int(cumulative)
+        children = {}
+    return modules
+
+
+def run_once(role: str) -> tuple:
+    """מריץ תהליך אחד. מחזיר (זמן כולל בשניות, {module: us}, התלויות הכבדות שנטענו)"""
+    env = dict(os.environ, ROLE=role, TASK=os.environ.get("TASK", "bench"))
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SNIPPET.format(role=role, heavy=HEAVY_MODULES)],
+        cwd=AGENT_DIR, env=env, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode
+        raise RuntimeError(f"{role}: {error}")
+    return elapsed, parse_importtime(proc.stderr), json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def bench_role(role: str, runs: int) -> dict:
+    totals, imports, heavy = [], {}, set()
+    for _ in range(runs):
+        elapsed, modules, loaded = run_once(role)
+        totals.append(elapsed)
+        heavy.update(loaded)
+        for name, us in modules.items():
+            imports.setdefault(name, []).append(us)
+
+    per_module = {name: statistics.median(values) / 1000 for name, values in imports.items()}
+    return {
+        "role":       role,
+        "total_ms":   round(statistics.median(totals) * 1000, 1),
+        "imports_ms": round(sum(per_module.values()), 1),
+        "heavy":      sorted(heavy),
+        "modules":    {name: round(ms, 2) for name, ms in sorted(per_module.items(), key=lambda kv: -kv[1])}
+    }
+
+
+def print_report(results: list, top: int):
+    print(f"{'role':<12}{'total ms':>10}{'imports ms':>12}  heavy")
+    for result in results:
+        heavy = ",".join(result["heavy"]) or "-"
+        print(f"{result['role']:<12}{result['total_ms']:>10.1f}{result['imports_ms']:>12.1f}  {heavy}")
+
+    for result in results:
+        print(f"\n{result['role']} — {top} ה-imports הכבדים:")
+        for name, ms in list(result["modules"].items())[:top]:
+            print(f"  {name:<24}{ms:>8.2f} ms")
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """
+    מחזיר את ה-roles שהזמן הכולל שלהם עלה ביותר מ-tolerance מול ה-baseline,
+    או שטוענים בהפעלה תלות כבדה שב-baseline לא נטענה
+    """
+    with open(baseline_path) as f:
+        baseline = {result["role"]: result for result in json.load(f)}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["role"])
+        if before and result["total_ms"] > before["total_ms"] * (1 + tolerance):
+            regressions.append(f"{result['role']}: {before['total_ms']} → {result['total_ms']} ms")
+        new_heavy = sorted(set(result["heavy"]) - set(before["heavy"])) if before else []
+        if new_heavy:
+            regressions.append(f"{result['role']}: טוען בהפעלה {', '.join(new_heavy)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="מדידת cold start לכל role של הסוכן")
+    parser.add_argument("--roles",     nargs="+", default=ROLES)
+    parser.add_argument("--runs",      type=int,   default=5)
+    parser.add_argument("--top",       type=int,   default=8, help="כמה imports כבדים להציג לכל role")
+    parser.add_argument("--json",      help="קובץ לשמירת התוצאות")
+    parser.add_argument("--baseline",  help="קובץ תוצאות קודם להשוואה")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="האטה מותרת מול ה-baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    results = [bench_role(role, args.runs) for role in args.roles]
+    print_report(results, args.top)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\n❌ האטה או תלות כבדה חדשה ב-cold start:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\n✅ אין האטה מול ה-baseline")
+
+
+if __name__ == "__main__":
+    main()
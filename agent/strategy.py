@@ -0,0 +1,264 @@
+"""
+האסטרטגיה כהגדרה אחת — אינדיקטורים, כללי ציון ומשקלים, ספים, סיגנל, פילטר
+שוק וכללי יציאה — במקום שלושה עותקים ידניים ב-scanner, analyst ו-backtest.
+
+STRATEGY הוא dict. compile_strategy הופך אותו ל-Strategy: כל תנאי הופך לביטוי
+מערך, וכל ההגדרה רצה פעם אחת על מטריצה של תאריכים × מניות — הציון של כל
+מניה בכל יום בכמה פעולות numpy, במקום לולאה על score_stock לכל מניה לכל יום.
+
+  features  — {שם: (אינדיקטור, פרמטרים...)} מתוך INDICATORS. כל אינדיקטור מחשב
+              בשורה i את מה שהגרסה הסקלרית הייתה מחשבת על closes[:i + 1]
+  score     — כללים: רשימת תנאים (AND) ונקודות. כללים עם אותו group הם
+              if / elif — רק הראשון שמתקיים נספר
+  signal    — BUY / SELL לפי הכלל הראשון שמתקיים, אחרת default_signal
+  market    — פילטר השוק (על SPY)
+  exits     — הספים של exits.py
+
+תנאי הוא (feature, op, ערך) או (feature, op, feature) — ("ma7", ">", "ma20"),
+ועם שני ערכים ל-between (כולל) ו-inside (לא כולל): ("change_pct", "inside", 0, 3).
+פחות מ-min_history נרות — ציון 0 והשוק נחשב חיובי.
+
+המטריצה מיושרת לנר האחרון: מניה עם פחות נרות מרופדת ב-NaN מההתחלה (stack),
+כך שהיא מקבלת בדיוק את החלונות החלקיים שהקוד הסקלרי קיבל.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import exits
+
+# המניות שהסריקה, ה-snapshot וה-backtest עובדים עליהן
+WATCHLIST = [
+    "AAPL", "MSFT", "GOOGL", "AMZN", "NVDA",
+    "META", "TSLA", "AMD",  "NFLX", "CRM",
+    "SHOP", "SQ",   "COIN", "PLTR", "UBER",
+    "SNAP", "SPOT", "ZM",   "RBLX", "PYPL"
+]
+
+STRATEGY = {
+    "name":        "rsi-pullback",
+    "min_history": 20,
+    "min_score":   50,     # ציון מינימלי לקנייה
+    "features": {
+        "close":        ("close",),
+        "rsi":          ("rsi", 14),
+        "ma7":          ("sma", 7),
+        "ma20":         ("sma", 20),
+        "change_pct":   ("change_pct",),
+        "volume_ratio": ("volume_ratio", 10)
+    },
+    "score": [
+        {"name": "rsi_pullback", "group": "rsi", "when": [("rsi", "between", 35, 50)],  "points": 30},
+        {"name": "rsi_low",      "group": "rsi", "when": [("rsi", "between", 30, 35)],  "points": 20},
+        {"name": "uptrend",                      "when": [("ma7", ">", "ma20")],        "points": 25},
+        {"name": "volume",                       "when": [("volume_ratio", ">", 1.5)],  "points": 20},
+        {"name": "momentum",                     "when": [("change_pct", "inside", 0, 3)], "points": 25}
+    ],
+    "signal": [
+        {"signal": "BUY",  "when": [("rsi", "<", 30), ("ma7", ">", "ma20")]},
+        {"signal": "SELL", "when": [("rsi", ">", 70), ("ma7", "<", "ma20")]}
+    ],
+    "default_signal": "HOLD",
+    "market": [("close", ">", "ma20")],
+    "exits":  exits.RULES
+}
+
+
+def windows(x: np.ndarray, n: int) -> np.ndarray:
+    """(T, ...) → (T, ..., n): החלון של n השורות שמסתיימות בכל שורה, עם NaN לפני ההתחלה"""
+    pad = np.full((n - 1,) + x.shape[1:], np.nan)
+    return sliding_window_view(np.concatenate([pad, x]), n, axis=0)
+
+
+def rolling_mean(x: np.ndarray, n: int) -> np.ndarray:
+    """כמו x[-n:].mean() בכל שורה — על הערכים שיש אם יש פחות מ-n"""
+    w = windows(x, n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.nansum(w, axis=-1) / np.isfinite(w).sum(axis=-1)
+
+
+def previous(x: np.ndarray) -> np.ndarray:
+    return np.concatenate([np.full((1,) + x.shape[1:], np.nan), x[:-1]])
+
+
+def close(closes, volumes):
+    return closes
+
+
+def sma(closes, volumes, n: int):
+    return rolling_mean(closes, n)
+
+
+def rsi(closes, volumes, period: int = 14):
+    """
+    RSI פשוט — ממוצע העליות והירידות ב-period השינויים האחרונים.
+    50 כשיש פחות מ-period + 1 נרות, 100 כשאין ירידות
+    """
+    diffs  = closes - previous(closes)
+    gains  = np.nansum(windows(np.clip(diffs, 0, None), period), axis=-1) / period
+    losses = np.nansum(windows(np.clip(-diffs, 0, None), period), axis=-1) / period
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = 100 - 100 / (1 + gains / losses)
+    values = np.where(losses == 0, 100.0, values)
+    return np.where(history(closes) < period + 1, 50.0, values)
+
+
+def change_pct(closes, volumes):
+    """שינוי מהסגירה הקודמת ב-%. 0 בנר הראשון"""
+    prev = previous(closes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        values = (closes - prev) / prev * 100
+    return np.where(np.isfinite(values), values, 0.0)
+
+
+def volume_ratio(closes, volumes, n: int = 10):
+    """הנפח האחרון מול הממוצע של n הנרות האחרונים. 1 אם אין ממוצע"""
+    avg = rolling_mean(volumes, n)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(avg > 0, volumes / avg, 1.0)
+
+
+def history(closes: np.ndarray) -> np.ndarray:
+    """כמה נרות יש עד כל שורה (בלי הריפוד)"""
+    return np.cumsum(np.isfinite(closes), axis=0)
+
+
+INDICATORS = {
+    "close":        close,
+    "sma":          sma,
+    "rsi":          rsi,
+    "change_pct":   change_pct,
+    "volume_ratio": volume_ratio
+}
+
+OPS = {
+    ">":       lambda x, a: x > a,
+    ">=":      lambda x, a: x >= a,
+    "<":       lambda x, a: x < a,
+    "<=":      lambda x, a: x <= a,
+    "between": lambda x, a, b: (x >= a) & (x <= b),
+    "inside":  lambda x, a, b: (x > a) & (x < b)
+}
+
+
+def compile_condition(condition: tuple, features: dict):
+    """("rsi", "between", 35, 50) → פונקציה מ-{feature: מערך} למסכת bool"""
+    name, op, *operands = condition
+    if name not in features:
+        raise ValueError(f"feature לא מוגדר: {name}")
+    if op not in OPS:
+        raise ValueError(f"אופרטור לא מוכר: {op}")
+    for operand in operands:
+        if isinstance(operand, str) and operand not in features:
+            raise ValueError(f"feature לא מוגדר: {operand}")
+
+    def evaluate(values: dict) -> np.ndarray:
+        args = [values[operand] if isinstance(operand, str) else operand for operand in operands]
+        return OPS[op](values[name], *args)
+    return evaluate
+
+
+def compile_all(conditions: list, features: dict):
+    compiled = [compile_condition(condition, features) for condition in conditions]
+
+    def evaluate(values: dict) -> np.ndarray:
+        mask = compiled[0](values)
+        for condition in compiled[1:]:
+            mask = mask & condition(values)
+        return mask
+    return evaluate
+
+
+class Strategy:
+    """STRATEGY אחרי קומפילציה — evaluate() על מטריצות (T, S) של סגירות ונפחים"""
+    __slots__ = ("spec", "min_history", "min_score", "exits", "score_rules", "signal_rules", "market_rule")
+
+    def __init__(self, spec: dict):
+        features = spec["features"]
+        for name, (indicator, *_) in features.items():
+            if indicator not in INDICATORS:
+                raise ValueError(f"אינדיקטור לא מוכר: {indicator} ({name})")
+        self.spec         = spec
+        self.min_history  = spec["min_history"]
+        self.min_score    = spec["min_score"]
+        self.exits        = spec["exits"]
+        self.score_rules  = [(rule.get("group", rule["name"]), compile_all(rule["when"], features), rule["points"])
+                             for rule in spec["score"]]
+        self.signal_rules = [(rule["signal"], compile_all(rule["when"], features)) for rule in spec["signal"]]
+        self.market_rule  = compile_all(spec["market"], features)
+
+    def features(self, closes: np.ndarray, volumes: np.ndarray) -> dict:
+        closes  = np.asarray(closes, dtype=np.float64)
+        volumes = np.asarray(volumes, dtype=np.float64)
+        return {name: INDICATORS[indicator](closes, volumes, *params)
+                for name, (indicator, *params) in self.spec["features"].items()}
+
+    def evaluate(self, closes: np.ndarray, volumes: np.ndarray) -> dict:
+        """
+        {feature: מערך, "score", "signal", "market"} — כל מערך בצורה של closes.
+        שורה i היא מה שהקוד הסקלרי היה מחזיר על הנרות עד i
+        """
+        values = self.features(closes, volumes)
+        enough = history(np.asarray(closes, dtype=np.float64)) >= self.min_history
+
+        score = np.zeros(enough.shape, dtype=np.int64)
+        taken = {}
+        for group, condition, points in self.score_rules:
+            hit = condition(values)
+            if group in taken:
+                hit = hit & ~taken[group]
+                taken[group] = taken[group] | hit
+            else:
+                taken[group] = hit
+            score += points * hit
+        values["score"] = np.where(enough, score, 0)
+
+        choices = [condition(values) for _, condition in self.signal_rules]
+        labels  = [signal for signal, _ in self.signal_rules]
+        values["signal"] = np.select(choices, labels, default=self.spec["default_signal"]) if choices \
+            else np.full(enough.shape, self.spec["default_signal"])
+        values["market"] = self.market_rule(values) | ~enough
+        return values
+
+
+def compile_strategy(spec: dict = STRATEGY, **overrides) -> Strategy:
+    """overrides דורסים מפתחות עליונים — compile_strategy(min_score=55)"""
+    return Strategy({**spec, **overrides})
+
+
+def stack(series: list) -> np.ndarray:
+    """מערכים באורכים שונים → מטריצה (T, S) מיושרת לסוף, עם NaN בהתחלה"""
+    length = max((len(values) for values in series), default=0)
+    matrix = np.full((length, len(series)), np.nan)
+    for column, values in enumerate(series):
+        if len(values):
+            matrix[length - len(values):, column] = values
+    return matrix
+
+
+def evaluate_bars(bars_by_symbol: dict, strategy: Strategy = None) -> dict:
+    """
+    {symbol: Bars} → {symbol: {feature: מערך}} — מטריצה אחת לכל המניות,
+    ולכל מניה views באורך הנרות שלה (האינדקס i הוא הנר ה-i של המניה)
+    """
+    strategy = strategy or DEFAULT
+    symbols  = [symbol for symbol, bars in bars_by_symbol.items() if len(bars)]
+    if not symbols:
+        return {}
+    values = strategy.evaluate(stack([bars_by_symbol[symbol].c for symbol in symbols]),
+                               stack([bars_by_symbol[symbol].v for symbol in symbols]))
+    length = len(values["score"])
+    return {
+        symbol: {name: column[length - len(bars_by_symbol[symbol]):, i] for name, column in values.items()}
+        for i, symbol in enumerate(symbols)
+    }
+
+
+def latest(bars_by_symbol: dict, strategy: Strategy = None) -> dict:
+    """{symbol: {feature: ערך}} בנר האחרון — מה שהסריקה והניתוח צריכים"""
+    return {
+        symbol: {name: column[-1].item() for name, column in values.items()}
+        for symbol, values in evaluate_bars(bars_by_symbol, strategy).items()
+    }
+
+
+DEFAULT = compile_strategy()
@@ -0,0 +1,270 @@
+"""
+Sweep של פרמטרים לאסטרטגיה — מפוצל ל-shards שרצים במקביל כ-Kubernetes Indexed Job.
+
+coordinator — backtest עם "sweep" במשימה (backtest.run → launch):
+  1. טוען את הנרות פעם אחת ושומר אותם ב-Redis (sweep:{id}:data) — כל ה-shards קוראים משם
+  2. שומר את רשימת הקונפיגורציות וה-meta ב-sweep:{id} ומוסיף את ה-sweep ל-sweeps:active
+  3. יוצר Indexed Job דרך BatchV1Api עם SWEEP_SHARDS pods — או פחות, כמה שנכנסים
+     ל-openclaw-quota בלי לגעת ב-reserve של trader — ויוצא
+
+shard — ROLE=sweep (run): ה-pod עם JOB_COMPLETION_INDEX=i מריץ את הקונפיגורציות
+  i, i+shards, ... על הנתונים המשותפים, ודוחף תוצאות מקוצרות ל-sweep:{id}:results.
+
+ה-Brain (brain/sweeps.py) מאחד את התוצאות כשכל ה-shards סיימו ושולח את הטובות ל-Telegram.
+זמן ה-sweep יורד עם מספר ה-shards, כל עוד יש nodes להריץ אותם.
+"""
+import io
+import os
+import json
+import time
+import logging
+import itertools
+
+import numpy as np
+
+import backtest
+import metrics
+from bar_loader import Bars, COLUMNS
+
+logger = logging.getLogger(__name__)
+
+CHAT_ID     = os.environ.get("CHAT_ID")
+SWEEP_ID    = os.environ.get("SWEEP_ID")
+SHARD_INDEX = int(os.environ.get("JOB_COMPLETION_INDEX", "0"))   # ש-Kubernetes מזריק ל-Indexed Job
+
+SWEEP_SHARDS   = int(os.environ.get("SWEEP_SHARDS", "4"))
+SWEEP_DEADLINE = int(os.environ.get("SWEEP_DEADLINE", "1800"))   # שניות — אחרי זה ה-Brain מדווח על מה שיש
+SWEEP_TTL      = 60 * 60 * 24
+AGENT_IMAGE    = os.environ.get("AGENT_IMAGE", "giladi17/openclaw-agent:latest")
+NAMESPACE      = os.environ.get("POD_NAMESPACE", "default")
+
+ACTIVE_KEY = "sweeps:active"
+
+# הפרמטרים שה-sweep עובר עליהם — כל צירוף הוא קונפיגורציה (דריסה של backtest.DEFAULT_PARAMS)
+GRID = {
+    "min_score":         [45, 50, 55, 60],
+    "take_profit_pct":   [10, 15, 20],
+    "stop_loss_pct":     [-5, -7, -10],
+    "trailing_stop_pct": [5, 7, 10],
+    "max_hold_days":     [5, 10, 15]
+}
+
+# shard הוא חישוב ב-thread אחד. 4 shards + ה-coordinator + trader נכנסים ל-openclaw-quota
+# (limits.cpu: 4 × 500m + 1 + 500m) — ו-fit_shards מוריד את המספר כשה-quota תפוסה
+SHARD_RESOURCES = {
+    "requests": {"memory": "256Mi", "cpu": "250m"},
+    "limits":   {"memory": "512Mi", "cpu": "500m"}
+}
+
+QUOTA_NAME = "openclaw-quota"
+
+# Job אחד של trader — אותו reserve כמו ב-brain/scheduler.py, כדי שה-sweep לא יחסום עסקה
+TRADER_RESERVE = {
+    "requests.cpu":    "250m",
+    "requests.memory": "256Mi",
+    "limits.cpu":      "500m",
+    "limits.memory":   "512Mi",
+    "pods":            "1"
+}
+
+_redis  = None
+_binary = None
+
+
+def _client():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis(host="redis-service", port=6379, decode_responses=True)
+    return _redis
+
+
+def _binary_client():
+    """הנתונים המשותפים הם bytes — client בלי decode"""
+    global _binary
+    if _binary is None:
+        import redis
+        _binary = redis.Redis(host="redis-service", port=6379)
+    return _binary
+
+
+def sweep_key(sweep_id: str, part: str = None) -> str:
+    return f"sweep:{sweep_id}:{part}" if part else f"sweep:{sweep_id}"
+
+
+def expand_grid(grid: dict = GRID) -> list:
+    """{"a": [1, 2], "b": [3]} → [{"a": 1, "b": 3}, {"a": 2, "b": 3}]"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def shard_configs(configs: list, index: int, shards: int) -> list:
+    """(מספר, קונפיגורציה) של shard אחד — אחת מכל shards, כך שהעומס מתחלק שווה"""
+    return [(i, configs[i]) for i in range(index, len(configs), shards)]
+
+
+def encode_history(history: dict) -> bytes:
+    """{symbol: Bars} → npz אחד"""
+    buffer = io.BytesIO()
+    np.savez(buffer, **{f"{symbol}.{name}": getattr(bars, name) for symbol, bars in history.items() for name in COLUMNS})
+    return buffer.getvalue()
+
+
+def decode_history(data: bytes) -> dict:
+    arrays  = np.load(io.BytesIO(data))
+    symbols = sorted({key.rsplit(".", 1)[0] for key in arrays.files})
+    return {symbol: Bars(*(arrays[f"{symbol}.{name}"] for name in COLUMNS)) for symbol in symbols}
+
+
+def compact(index: int, results: dict) -> dict:
+    """מה שה-Brain צריך כדי לדרג — בלי רשימת העסקאות"""
+    if "error" in results:
+        return {"i": index, "error": results["error"]}
+    return {
+        "i":        index,
+        "return":   results["total_return"],
+        "drawdown": results["max_drawdown"],
+        "trades":   results["total_trades"],
+        "win_rate": results["win_rate"]
+    }
+
+
+def fit_shards(hard: dict, used: dict, wanted: int) -> int:
+    """
+    כמה shards נכנסים למה שנשאר ב-quota אחרי ה-reserve של trader — בין 1 ל-wanted.
+    גם כשאין מקום מריצים shard אחד: ה-Job controller ייצור אותו כשיתפנה מקום
+    """
+    from kubernetes.utils import parse_quantity
+
+    per_shard = {f"{kind}.{name}": parse_quantity(value)
+                 for kind, values in SHARD_RESOURCES.items() for name, value in values.items()}
+    per_shard["pods"] = 1
+    shards = wanted
+    for resource, amount in per_shard.items():
+        if resource not in hard:
+            continue
+        free   = parse_quantity(hard[resource]) - parse_quantity(used.get(resource, "0")) \
+            - parse_quantity(TRADER_RESERVE[resource])
+        shards = min(shards, int(free // amount))
+    return max(1, shards)
+
+
+def quota_shards(wanted: int) -> int:
+    """fit_shards לפי openclaw-quota. אם אי אפשר לקרוא אותה — wanted"""
+    from kubernetes import client
+    try:
+        status = client.CoreV1Api().read_namespaced_resource_quota(QUOTA_NAME, NAMESPACE).status
+        return fit_shards(status.hard or {}, status.used or {}, wanted)
+    except Exception as e:
+        logger.warning(f"קריאת {QUOTA_NAME} נכשלה ({e}) — {wanted} shards")
+        return wanted
+
+
+def shard_job(sweep_id: str, shards: int):
+    from kubernetes import client
+
+    # ה-shards לא פונים ל-Alpaca ולא ל-Telegram — כל מה שהם צריכים נמצא ב-Redis, בלי secrets
+    env = [
+        client.V1EnvVar(name="ROLE",     value="sweep"),
+        client.V1EnvVar(name="SWEEP_ID", value=sweep_id)
+    ]
+    return client.V1Job(
+        metadata=client.V1ObjectMeta(
+            name=f"sweep-{sweep_id}",
+            labels={"app": "openclaw-agent", "role": "backtest", "sweep": sweep_id}
+        ),
+        spec=client.V1JobSpec(
+            completion_mode="Indexed",
+            completions=shards,
+            parallelism=shards,
+            backoff_limit=shards,
+            active_deadline_seconds=SWEEP_DEADLINE,
+            ttl_seconds_after_finished=300,
+            template=client.V1PodTemplateSpec(
+                metadata=client.V1ObjectMeta(labels={"app": "openclaw-agent", "role": "backtest", "sweep": sweep_id}),
+                spec=client.V1PodSpec(
+                    restart_policy="Never",
+                    priority_class_name="openclaw-batch",
+                    image_pull_secrets=[client.V1LocalObjectReference(name="dockerhub-secret")],
+                    containers=[
+                        client.V1Container(
+                            name="agent",
+                            image=AGENT_IMAGE,
+                            resources=client.V1ResourceRequirements(**SHARD_RESOURCES),
+                            env=env
+                        )
+                    ]
+                )
+            )
+        )
+    )
+
+
+def launch(start_date: str, end_date: str, shards: int = SWEEP_SHARDS, grid: dict = GRID) -> dict:
+    """מכין את הנתונים וה-meta ב-Redis ומשיק את ה-Indexed Job. מחזיר את ה-meta"""
+    from kubernetes import client, config
+
+    sweep_id = os.environ.get("JOB_ID") or os.urandom(3).hex()[:5]
+    configs  = expand_grid(grid)
+    config.load_incluster_config()
+    shards   = max(1, min(quota_shards(shards), len(configs)))
+
+    history = backtest.load_history(backtest.WATCHLIST + ["SPY"], start_date, end_date)
+    data    = encode_history(history)
+    _binary_client().setex(sweep_key(sweep_id, "data"), SWEEP_TTL, data)
+
+    meta = {
+        "chat_id":    str(CHAT_ID),
+        "start_date": start_date,
+        "end_date":   end_date,
+        "shards":     shards,
+        "configs":    json.dumps(configs),
+        "created_at": f"{time.time():.0f}",
+        "deadline":   f"{time.time() + SWEEP_DEADLINE:.0f}"
+    }
+    pipe = _client().pipeline()
+    pipe.hset(sweep_key(sweep_id), mapping=meta)
+    pipe.expire(sweep_key(sweep_id), SWEEP_TTL)
+    pipe.sadd(ACTIVE_KEY, sweep_id)
+    pipe.execute()
+
+    try:
+        client.BatchV1Api().create_namespaced_job(namespace=NAMESPACE, body=shard_job(sweep_id, shards))
+    except Exception:
+        # בלי Job אין למה לחכות — שה-Brain לא ידווח על sweep ריק אחרי ה-deadline
+        _client().srem(ACTIVE_KEY, sweep_id)
+        _client().delete(sweep_key(sweep_id))
+        _binary_client().delete(sweep_key(sweep_id, "data"))
+        raise
+    metrics.inc("sweeps_launched")
+    logger.info(f"Sweep {sweep_id}: {len(configs)} קונפיגורציות, {shards} shards, {len(data) / 1e6:.1f}MB נתונים")
+    return {"sweep_id": sweep_id, "configs": len(configs), "shards": shards}
+
+
+async def run():
+    """shard אחד של ה-Indexed Job"""
+    client  = _client()
+    meta    = client.hgetall(sweep_key(SWEEP_ID))
+    data    = _binary_client().get(sweep_key(SWEEP_ID, "data"))
+    if not meta or data is None:
+        raise RuntimeError(f"Sweep {SWEEP_ID} לא נמצא ב-Redis")
+
+    history = decode_history(data)
+    configs = json.loads(meta["configs"])
+    mine    = shard_configs(configs, SHARD_INDEX, int(meta["shards"]))
+    logger.info(f"Sweep {SWEEP_ID} shard {SHARD_INDEX}: {len(mine)} קונפיגורציות")
+
+    started = time.time()
+    results = []
+    for index, params in mine:
+        results.append(compact(index, backtest.run_backtest(
+            meta["start_date"], meta["end_date"], params=params, history=history
+        )))
+    metrics.observe("sweep_shard_seconds", time.time() - started)
+
+    # כתיבה אחת בסוף — ניסיון חוזר של אותו index פשוט דורס
+    results_key = sweep_key(SWEEP_ID, "results")
+    pipe = client.pipeline()
+    pipe.hset(results_key, str(SHARD_INDEX), json.dumps(results))
+    pipe.expire(results_key, SWEEP_TTL)
+    pipe.execute()
@@ -0,0 +1,71 @@
+"""
+מעקב זמנים (tracing) לסוכן — כל שלב נמדד כ-span ונכתב ל-Redis stream.
+
+ה-trace ID הוא ה-JOB_ID שה-Brain מעביר לפוד, כך שאפשר לחבר את השלבים
+של ה-Brain (ניתוב, יצירת Job) לשלבים של הסוכן (Alpaca, Groq, Telegram).
+ה-spans נאספים בזיכרון ונשלחים ל-Redis בבת אחת ב-flush() בסוף הריצה.
+"""
+import os
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACE_STREAM = "traces"
+TRACE_MAXLEN = 100000
+
+# CronJobs לא מקבלים JOB_ID מה-Brain — מייצרים אחד כדי שגם הסריקות יימדדו
+TRACE_ID   = os.environ.get("JOB_ID") or os.urandom(3).hex()[:5]
+ROLE       = os.environ.get("ROLE", "unknown")
+STARTED_AT = time.time()
+
+_pending = []
+
+
+def record(stage: str, start: float, end: float):
+    """רושם span שהסתיים — start/end ב-epoch seconds"""
+    _pending.append({
+        "trace_id":    TRACE_ID,
+        "role":        ROLE,
+        "stage":       stage,
+        "start":       f"{start:.6f}",
+        "duration_ms": f"{(end - start) * 1000:.3f}"
+    })
+
+
+@contextmanager
+def span(stage: str):
+    """מודד את זמן הבלוק ורושם אותו כ-span"""
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(stage, start, time.time())
+
+
+def _redis():
+    import redis
+    return redis.Redis(host="redis-service", port=6379, decode_responses=True)
+
+
+def flush():
+    """
+    שולח את כל ה-spans שנאספו ל-Redis ב-pipeline אחד, כולל end_to_end
+    ו-pod_startup (מיצירת ה-Job ב-Brain ועד שהסוכן התעורר). שניהם נקראים
+    מ-trace:{JOB_ID} כאן ולא בתחילת הריצה, כדי לא לעכב את הסוכן ב-round trip.
+    """
+    try:
+        client           = _redis()
+        started, created = client.hmget(f"trace:{TRACE_ID}", "start", "job_created")
+        if created:
+            record("pod_startup", float(created), STARTED_AT)
+        if started:
+            record("end_to_end", float(started), time.time())
+        pipe = client.pipeline(transaction=False)
+        for fields in _pending:
+            pipe.xadd(TRACE_STREAM, fields, maxlen=TRACE_MAXLEN, approximate=True)
+        pipe.execute()
+        _pending.clear()
+    except Exception as e:
+        logger.warning(f"שליחת ה-trace ל-Redis נכשלה: {e}")
@@ -2,9 +2,10 @@ import os
 import json
 import asyncio
 import logging
-from groq import Groq
-from telegram import Bot
-import requests
+import outbox
+import alpaca
+import account_cache
+import llm
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -12,7 +13,6 @@ logger = logging.getLogger(__name__)
 TELEGRAM_TOKEN    = os.environ.get("TELEGRAM_TOKEN")
 CHAT_ID           = os.environ.get("CHAT_ID")
 TASK              = os.environ.get("TASK")
-GROQ_API_KEY      = os.environ.get("GROQ_API_KEY")
 ALPACA_API_KEY    = os.environ.get("ALPACA_API_KEY")
 ALPACA_SECRET_KEY = os.environ.get("ALPACA_SECRET_KEY")
 ALPACA_BASE_URL   = os.environ.get("ALPACA_BASE_URL", "https://paper-api.alpaca.markets")
@@ -23,19 +23,8 @@ HEADERS = {
     "Content-Type": "application/json"
 }
 
-
-def parse_trade_intent(task: str) -> dict:
-    """
-    משתמש ב-Groq כדי להבין מה המשתמש רוצה.
-    מחזיר JSON עם action, symbol, qty
-    """
-    groq_client = Groq(api_key=GROQ_API_KEY)
-    response = groq_client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[
-            {
-                "role": "system",
-                "content": """You are a trading intent parser. Extract trading intent from text and return ONLY a JSON object.
+# ברמת המודול — הזחה של הקוד שקורא ל-Groq לא משנה את הטקסט שנשלח למודל
+INTENT_PROMPT = """You are a trading intent parser. Extract trading intent from text and return ONLY a JSON object.
 
 Possible actions: buy, sell, positions, portfolio
 
@@ -47,12 +36,21 @@ Return format:
 
 If qty is not specified for buy/sell, use 1.
 Return ONLY the JSON, nothing else."""
-            },
+
+
+def parse_trade_intent(task: str) -> dict:
+    """
+    משתמש ב-Groq כדי להבין מה המשתמש רוצה.
+    מחזיר JSON עם action, symbol, qty
+    """
+    raw = llm.complete(
+        messages=[
+            {"role": "system", "content": INTENT_PROMPT},
             {"role": "user", "content": task}
         ],
-        max_tokens=50
-    )
-    raw = response.choices[0].message.content.strip()
+        max_tokens=50,
+        stage="groq_intent"
+    ).strip()
     return json.loads(raw)
 
 
@@ -66,7 +64,8 @@ def buy_stock(symbol: str, qty: int) -> dict:
         "type":          "market",
         "time_in_force": "day"
     }
-    response = requests.post(url, headers=HEADERS, json=body)
+    response = alpaca.post(url, headers=HEADERS, json=body)
+    account_cache.invalidate(HEADERS)
     return response.json()
 
 
@@ -80,22 +79,19 @@ def sell_stock(symbol: str, qty: int) -> dict:
         "type":          "market",
         "time_in_force": "day"
     }
-    response = requests.post(url, headers=HEADERS, json=body)
+    response = alpaca.post(url, headers=HEADERS, json=body)
+    account_cache.invalidate(HEADERS)
     return response.json()
 
 
 def get_positions() -> list:
-    """מחזיר את כל הפוזיציות הפתוחות"""
-    url      = f"{ALPACA_BASE_URL}/v2/positions"
-    response = requests.get(url, headers=HEADERS)
-    return response.json()
+    """מחזיר את כל הפוזיציות הפתוחות (מה-cache אם עדכני)"""
+    return account_cache.get_positions(HEADERS, ALPACA_BASE_URL)
 
 
 def get_portfolio() -> dict:
-    """מחזיר מידע על החשבון"""
-    url      = f"{ALPACA_BASE_URL}/v2/account"
-    response = requests.get(url, headers=HEADERS)
-    return response.json()
+    """מחזיר מידע על החשבון (מה-cache אם עדכני)"""
+    return account_cache.get_account(HEADERS, ALPACA_BASE_URL)
 
 
 def format_positions(positions: list) -> str:
@@ -123,7 +119,6 @@ def format_positions(positions: list) -> str:
 
 async def run():
     logger.info(f"Trader agent התעורר למשימה: {TASK}")
-    bot = Bot(token=TELEGRAM_TOKEN)
 
     try:
         intent = parse_trade_intent(TASK)
@@ -178,7 +173,7 @@ async def run():
         logger.error(f"שגיאה: {e}", exc_info=True)
         message = f"❌ שגיאה: {str(e)[:200]}"
 
-    await bot.send_message(chat_id=CHAT_ID, text=message, parse_mode="Markdown")
+    await outbox.send(CHAT_ID, message, parse_mode="Markdown")
     logger.info("תשובת trader נשלחה!")
 
 
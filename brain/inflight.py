@@ -0,0 +1,120 @@
+"""
+איחוד בקשות זהות — אם אותה משימה כבר רצה, לא פותחים Job נוסף.
+
+המפתח הוא role + משימה מנורמלת (ל-analyst: רשימת המניות). בקשה כפולה
+נרשמת כ-waiter של ה-Job שרץ, והסוכן שולח את התוצאה לכל ה-waiters כשהוא
+מסיים (ראה agent/job_status.py). מה שקובע אם Job עוד רץ הוא הסטטוס
+ש-save_job_status כותב ל-job:{id} — queued / running, ואז done / failed.
+Job במצב running נבדק גם מול Kubernetes (alive) — פוד שמת לפני שכתב done / failed
+לא ימשיך לאסוף waiters שלא יקבלו תשובה.
+
+trader לא מאוחד — שתי פקודות קנייה הן שתי עסקאות. researcher / coder /
+summarizer תלויים בהיסטוריה של כל צ'אט, אז גם הם לא מאוחדים.
+"""
+import re
+import json
+import hashlib
+import logging
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+COALESCE_ROLES = {"analyst", "backtest"}
+INFLIGHT_TTL   = 15 * 60   # אחרי זה בקשה זהה פותחת Job חדש גם אם הקודם עוד רץ
+ACTIVE         = ("queued", "running")
+
+# מילה לטינית של עד 5 אותיות (ו-.B כמו ב-BRK.B) — מה ש-parse_tickers של ה-analyst מקבל.
+# lookaround ולא \b, כי אותיות עבריות הן \w ("ל-AAPL", "וAAPL")
+TICKER_RE = re.compile(r"(?<![A-Za-z])[A-Za-z]{1,5}(?:\.[A-Za-z])?(?![A-Za-z])")
+
+# מילים קצרות שאינן מניות — אינדיקטורים ואנגלית של בקשה
+NOT_TICKERS = {
+    "A", "I", "AN", "AND", "OR", "THE", "OF", "TO", "FOR", "ON", "IN", "IS", "IT", "ME", "MY",
+    "VS", "WITH", "WHAT", "HOW", "SHOW", "TELL", "ABOUT", "CHECK", "STOCK", "PRICE", "BUY", "SELL",
+    "RSI", "MACD", "EMA", "SMA", "MA", "ETF", "PE", "EPS", "AI"
+}
+
+
+def normalize_task(role: str, task: str) -> str:
+    """"נתח את AAPL ו-MSFT" ו-"analyze msft, aapl" → "AAPL,MSFT" ל-analyst"""
+    if role == "analyst":
+        tokens = TICKER_RE.findall(task)
+        # מה שנכתב באותיות גדולות הוא כנראה המניה ("I want NVDA"); בלי כאלה — כל המילים
+        tokens  = [token for token in tokens if token.isupper()] or tokens
+        tickers = {token.upper() for token in tokens} - NOT_TICKERS
+        if tickers:
+            return ",".join(sorted(tickers))
+    return " ".join(re.findall(r"\w+", task.casefold()))
+
+
+def inflight_key(role: str, task: str) -> str:
+    digest = hashlib.sha1(normalize_task(role, task).encode()).hexdigest()[:16]
+    return f"inflight:{role}:{digest}"
+
+
+def waiters_key(job_id: str) -> str:
+    return f"job:{job_id}:waiters"
+
+
+def attach(client, role: str, task: str, chat_id: int, alive=None):
+    """
+    מצרף את chat_id ל-Job זהה שעוד רץ. מחזיר את ה-job_id אם צורף, אחרת None.
+    WATCH על job:{id} מבטיח שלא נצטרף ל-Job שבדיוק סיים ושלח ל-waiters.
+    alive(job_id, job) — בודק שה-Job עוד קיים ב-Kubernetes כשהסטטוס running
+    """
+    if role not in COALESCE_ROLES:
+        return None
+    job_id = client.get(inflight_key(role, task))
+    if not job_id:
+        return None
+
+    status = client.get(f"job:{job_id}")
+    job    = json.loads(status) if status else None
+    if job and job.get("status") == "running" and alive and not alive(job_id, job):
+        logger.warning(f"Job {job_id} ({role}) כבר לא רץ — לא מצטרפים אליו")
+        release(client, role, task, job_id)
+        return None
+
+    with client.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(f"job:{job_id}")
+                status = pipe.get(f"job:{job_id}")
+                job    = json.loads(status) if status else None
+                if not job or job.get("status") not in ACTIVE:
+                    pipe.unwatch()
+                    return None
+                pipe.multi()
+                # אותו צ'אט כבר יקבל את התוצאה — לא שולחים לו פעמיים
+                if str(job.get("chat_id")) != str(chat_id):
+                    pipe.sadd(waiters_key(job_id), chat_id)
+                    pipe.expire(waiters_key(job_id), INFLIGHT_TTL)
+                pipe.execute()
+                return job_id
+            except redis.WatchError:
+                continue
+
+
+def register(client, role: str, task: str, job_id: str):
+    """מסמן את job_id כ-Job שרץ למשימה הזו"""
+    if role in COALESCE_ROLES:
+        client.setex(inflight_key(role, task), INFLIGHT_TTL, job_id)
+
+
+def release(client, role: str, task: str, job_id: str):
+    """מוחק את הסימון — רק אם הוא עדיין מצביע על job_id ולא על Job חדש יותר"""
+    if role not in COALESCE_ROLES:
+        return
+    key = inflight_key(role, task)
+    with client.pipeline() as pipe:
+        try:
+            pipe.watch(key)
+            if pipe.get(key) == job_id:
+                pipe.multi()
+                pipe.delete(key)
+                pipe.execute()
+            else:
+                pipe.unwatch()
+        except redis.WatchError:
+            pass   # מישהו רשם Job חדש בינתיים — הסימון שלו נשאר
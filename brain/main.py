@@ -1,33 +1,48 @@
 import os
 import logging
 import json
+import time
+import asyncio
 import uuid
 from telegram import Update
-from telegram.ext import Application, MessageHandler, filters, ContextTypes
+from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 from kubernetes import client, config
 import redis
+import redis.asyncio as aioredis
 from groq import Groq
+from tracing import Tracer, format_summary
+import metrics
+from outbox import OutboxDispatcher, OUTBOX_STREAM, OUTBOX_MAXLEN
+from scheduler import JobScheduler, job_finished, profile_for
+from sweeps import SweepMerger
+import inflight
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 config.load_incluster_config()
-k8s = client.BatchV1Api()
+k8s      = client.BatchV1Api()
+k8s_core = client.CoreV1Api()
 
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 GROQ_API_KEY   = os.environ.get("GROQ_API_KEY")
+# אופציונלי — מפנה את הסוכנים לשרת Alpaca מקומי (alpaca_stub.py) לבדיקות עומס
+ALPACA_DATA_URL = os.environ.get("ALPACA_DATA_URL")
+METRICS_PORT    = int(os.environ.get("METRICS_PORT", "9100"))
 
 redis_client = redis.Redis(host="redis-service", port=6379, decode_responses=True)
 groq_client  = Groq(api_key=GROQ_API_KEY)
+tracer       = Tracer(redis_client)
 
 
 def decide_agent(message: str) -> str:
-    response = groq_client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[
-            {
-                "role": "system",
-                "content": """אתה נתב שמחליט איזה סוכן מתאים למשימה. ענה רק במילה אחת בלי שום תוספת.
+    with metrics.GROQ_SECONDS.labels(stage="routing").time():
+        response = groq_client.chat.completions.create(
+            model="llama-3.3-70b-versatile",
+            messages=[
+                {
+                    "role": "system",
+                    "content": """אתה נתב שמחליט איזה סוכן מתאים למשימה. ענה רק במילה אחת בלי שום תוספת.
 
 הכללים:
 - אם המשתמש מבקש לנתח מניה, לבדוק מחיר, RSI, סיגנל קנייה/מכירה - ענה: analyst
@@ -38,11 +53,14 @@ def decide_agent(message: str) -> str:
 - אם המשתמש מבקש לסכם, לקצר - ענה: summarizer
 - אם המשתמש מבקש קוד, תכנות - ענה: coder
 - בכל מקרה אחר - ענה: researcher"""
-            },
-            {"role": "user", "content": message}
-        ],
-        max_tokens=10
-    )
+                },
+                {"role": "user", "content": message}
+            ],
+            max_tokens=10
+        )
+    if response.usage is not None:
+        metrics.GROQ_TOKENS.labels(stage="routing", kind="prompt").inc(response.usage.prompt_tokens or 0)
+        metrics.GROQ_TOKENS.labels(stage="routing", kind="completion").inc(response.usage.completion_tokens or 0)
     agent = response.choices[0].message.content.strip().lower()
     valid = ["coder", "researcher", "summarizer", "analyst", "trader", "backtest"]
     if agent not in valid:
@@ -65,28 +83,34 @@ def save_job_status(job_id: str, chat_id: int, agent_type: str, status: str):
     redis_client.setex(key, 3600, json.dumps(data))
 
 
-def create_agent_job(task: str, agent_type: str, chat_id: int):
-    job_id = uuid.uuid4().hex[:5]
-    save_job_status(job_id, chat_id, agent_type, "running")
+def create_agent_job(task: str, agent_type: str, chat_id: int, job_id: str = None):
+    job_id  = job_id or uuid.uuid4().hex[:5]
+    profile = profile_for(agent_type)
+
+    extra_env = []
+    if ALPACA_DATA_URL:
+        extra_env.append(client.V1EnvVar(name="ALPACA_DATA_URL", value=ALPACA_DATA_URL))
 
     job = client.V1Job(
         metadata=client.V1ObjectMeta(
             name=f"agent-{chat_id}-{agent_type}-{job_id}",
-            labels={"app": "openclaw-agent"}
+            labels={"app": "openclaw-agent", "role": agent_type}
         ),
         spec=client.V1JobSpec(
             ttl_seconds_after_finished=60,
             template=client.V1PodTemplateSpec(
                 spec=client.V1PodSpec(
                     restart_policy="Never",
+                    priority_class_name=profile["priority_class"],
+                    service_account_name=profile.get("service_account"),
                     image_pull_secrets=[client.V1LocalObjectReference(name="dockerhub-secret")],
                     containers=[
                         client.V1Container(
                             name="agent",
                             image="giladi17/openclaw-agent:latest",
                             resources=client.V1ResourceRequirements(
-                                requests={"memory": "256Mi", "cpu": "250m"},
-                                limits={"memory": "512Mi", "cpu": "500m"}
+                                requests=profile["requests"],
+                                limits=profile["limits"]
                             ),
                             env=[
                                 client.V1EnvVar(name="ROLE",    value=agent_type),
@@ -98,6 +122,7 @@ def create_agent_job(task: str, agent_type: str, chat_id: int):
                                 client.V1EnvVar(name="ALPACA_API_KEY",  value_from=client.V1EnvVarSource(secret_key_ref=client.V1SecretKeySelector(name="openclaw-secrets", key="ALPACA_API_KEY"))),
                                 client.V1EnvVar(name="ALPACA_SECRET_KEY", value_from=client.V1EnvVarSource(secret_key_ref=client.V1SecretKeySelector(name="openclaw-secrets", key="ALPACA_SECRET_KEY"))),
                                 client.V1EnvVar(name="ALPACA_BASE_URL", value_from=client.V1EnvVarSource(secret_key_ref=client.V1SecretKeySelector(name="openclaw-secrets", key="ALPACA_BASE_URL"))),
+                                *extra_env,
                             ]
                         )
                     ]
@@ -105,22 +130,120 @@ def create_agent_job(task: str, agent_type: str, chat_id: int):
             )
         )
     )
-    k8s.create_namespaced_job(namespace="default", body=job)
-    logger.info(f"פוד חדש נפתח: {agent_type} למשימה: {task}")
+    try:
+        k8s.create_namespaced_job(namespace="default", body=job)
+    except Exception:
+        metrics.JOB_CREATE_ERRORS.labels(role=agent_type).inc()
+        raise
+    # רק אחרי שה-Job נוצר — אחרת inflight היה מצרף בקשות ל-Job שלא קיים
+    save_job_status(job_id, chat_id, agent_type, "running")
+    metrics.JOBS_CREATED.labels(role=agent_type).inc()
+    tracer.mark(job_id, "job_created")
+    logger.info(f"פוד חדש נפתח: {agent_type} למשימה: {task} | trace={job_id}")
+
+
+def job_launch_failed(task: str, agent_type: str, chat_id: int, job_id: str):
+    """ה-Job לא נוצר — מסמנים failed, משחררים את inflight ומודיעים לצ'אט ולכל מי שחיכה"""
+    save_job_status(job_id, chat_id, agent_type, "failed")
+    inflight.release(redis_client, agent_type, task, job_id)
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.smembers(inflight.waiters_key(job_id))
+    pipe.delete(inflight.waiters_key(job_id))
+    waiters = pipe.execute()[0]
+    for chat in {str(chat_id), *waiters}:
+        redis_client.xadd(OUTBOX_STREAM, {
+            "chat_id":     chat,
+            "text":        f"❌ לא הצלחתי להפעיל את {agent_type} — נסה לשלוח את הבקשה שוב בעוד רגע.",
+            "parse_mode":  "",
+            "enqueued_at": f"{time.time():.6f}",
+            "trace_id":    job_id,
+            "role":        agent_type
+        }, maxlen=OUTBOX_MAXLEN, approximate=True)
+
+
+def job_alive(job_id: str, job: dict) -> bool:
+    """האם ה-Job של job:{id} עוד קיים ב-Kubernetes ולא הסתיים"""
+    name = f"agent-{job['chat_id']}-{job['agent_type']}-{job_id}"
+    try:
+        status = k8s.read_namespaced_job(name, "default").status
+    except client.exceptions.ApiException as e:
+        return e.status != 404
+    except Exception:
+        return True   # בלי תשובה מ-Kubernetes — לא מפספסים איחוד בגלל תקלה זמנית
+    return not job_finished(status)
+
+
+job_scheduler = JobScheduler(redis_client, k8s, k8s_core, create_agent_job, on_error=job_launch_failed)
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message.text
     chat_id = update.message.chat_id
+    metrics.MESSAGES.inc()
+    # ה-trace ID הוא גם ה-JOB_ID של הסוכן
+    trace_id = uuid.uuid4().hex[:5]
+    tracer.start_trace(trace_id)
     save_context(chat_id, "user", message)
+
+    start      = time.time()
     agent_type = decide_agent(message)
-    await update.message.reply_text(f"⚙️ מעביר למומחה {agent_type}... אני עובד על זה, תכף חוזר!")
-    create_agent_job(message, agent_type, chat_id)
+    end        = time.time()
+    tracer.record(trace_id, agent_type, "groq_routing", start, end)
+    metrics.ROUTING_SECONDS.observe(end - start)
+
+    # אותה משימה כבר רצה — מצטרפים אליה במקום לפתוח Job נוסף
+    running_job = inflight.attach(redis_client, agent_type, message, chat_id, alive=job_alive)
+    if running_job:
+        metrics.JOBS_COALESCED.labels(role=agent_type).inc()
+        logger.info(f"בקשה זהה ל-{agent_type} כבר רצה | trace={running_job}")
+        await update.message.reply_text(f"🔁 {agent_type} כבר עובד בדיוק על זה — התוצאה תגיע גם אליך כשיסיים.")
+        return
+
+    with tracer.span(trace_id, agent_type, "ack_reply"):
+        await update.message.reply_text(f"⚙️ מעביר למומחה {agent_type}... אני עובד על זה, תכף חוזר!")
+    inflight.register(redis_client, agent_type, message, trace_id)
+    # create_agent_job מעדכן ל-running ברגע שה-Job נוצר
+    save_job_status(trace_id, chat_id, agent_type, "queued")
+    with tracer.span(trace_id, agent_type, "job_create"):
+        position = await job_scheduler.submit(message, agent_type, chat_id, trace_id)
+    if position:
+        await update.message.reply_text(f"⏳ ה-cluster עמוס — המשימה בתור (מקום {position}) ותתחיל ברגע שיתפנה מקום.")
+
+
+async def handle_cache(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/cache — hit/miss של ה-LLM cache של הסוכנים"""
+    stats   = redis_client.hgetall("llmcache:stats")
+    hits    = int(stats.get("hits", 0))
+    misses  = int(stats.get("misses", 0))
+    total   = hits + misses
+    rate    = hits / total * 100 if total else 0
+    entries = redis_client.zcard("llmcache:lru")
+    await update.message.reply_text(
+        f"🧠 LLM cache:\nhits: {hits} | misses: {misses} | hit rate: {rate:.1f}%\n"
+        f"entries: {entries} | evictions: {stats.get('evictions', 0)}"
+    )
+
+
+async def handle_latency(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/latency — סיכום p50/p95 לכל שלב ולכל סוכן"""
+    await update.message.reply_text(format_summary(tracer.summarize()))
+
+
+async def start_background_tasks(app: Application):
+    """מפעיל ברקע את שירות השליחה שהסוכנים כותבים אליו, את תור ה-Jobs ואת איחוד ה-sweeps"""
+    async_redis = aioredis.Redis(host="redis-service", port=6379, decode_responses=True)
+    dispatcher  = OutboxDispatcher(app.bot, async_redis, tracer)
+    app.bot_data["outbox_task"]    = asyncio.create_task(dispatcher.run())
+    app.bot_data["scheduler_task"] = asyncio.create_task(job_scheduler.run())
+    app.bot_data["sweep_task"]     = asyncio.create_task(SweepMerger(async_redis).run())
 
 
 def main():
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
-    app.add_handler(MessageHandler(filters.TEXT, handle_message))
+    metrics.start_metrics_server(METRICS_PORT, redis_client)
+    app = Application.builder().token(TELEGRAM_TOKEN).post_init(start_background_tasks).build()
+    app.add_handler(CommandHandler("latency", handle_latency))
+    app.add_handler(CommandHandler("cache", handle_cache))
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     logger.info("המוח המרכזי עלה ומאזין...")
     app.run_polling()
 
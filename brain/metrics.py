@@ -0,0 +1,114 @@
+"""
+מטריקות Prometheus ל-Brain — כולל מטריקות שהסוכנים צברו ב-Redis.
+
+ה-Brain רושם את המטריקות שלו ישירות (prometheus_client), ואת מה
+שהסוכנים שלחו ל-metrics:counters / metrics:histograms (ראה agent/metrics.py)
+הוא קורא בכל scrape דרך AgentMetricsCollector.
+"""
+import logging
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, HistogramMetricFamily
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_KEY   = "metrics:counters"
+HISTOGRAMS_KEY = "metrics:histograms"
+
+MESSAGES = Counter("openclaw_messages", "הודעות Telegram שהתקבלו")
+ROUTING_SECONDS = Histogram("openclaw_routing_seconds", "זמן ניתוב ב-decide_agent")
+JOBS_CREATED = Counter("openclaw_jobs_created", "Jobs שנוצרו לפי סוכן", ["role"])
+JOBS_COALESCED = Counter("openclaw_jobs_coalesced", "בקשות שצורפו ל-Job זהה שכבר רץ", ["role"])
+JOB_CREATE_ERRORS = Counter("openclaw_job_create_errors", "כשלונות ביצירת Job", ["role"])
+GROQ_SECONDS = Histogram("openclaw_brain_groq_seconds", "latency של קריאות Groq ב-Brain", ["stage"])
+GROQ_TOKENS = Counter("openclaw_brain_groq_tokens", "טוקנים של Groq ב-Brain", ["stage", "kind"])
+OUTBOX_SENT = Counter("openclaw_outbox_sent", "הודעות Telegram שנשלחו מה-outbox")
+OUTBOX_COALESCED = Counter("openclaw_outbox_coalesced", "הודעות שאוחדו לתוך הודעה קודמת")
+OUTBOX_RETRIES = Counter("openclaw_outbox_retries", "ניסיונות חוזרים בשליחה", ["reason"])
+OUTBOX_DROPPED = Counter("openclaw_outbox_dropped", "הודעות שנזרקו — שגיאה קבועה או אחרי כל הניסיונות")
+OUTBOX_DELIVERY_SECONDS = Histogram(
+    "openclaw_outbox_delivery_seconds", "זמן מכניסה ל-outbox ועד שליחה",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120)
+)
+
+SCHEDULER_QUEUE_DEPTH = Gauge("openclaw_scheduler_queue_depth", "Jobs שמחכים בתור לפי סוכן", ["role"])
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "openclaw_scheduler_wait_seconds", "זמן המתנה בתור עד שה-Job נוצר", ["role"],
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600)
+)
+
+SWEEPS_COMPLETED = Counter("openclaw_sweeps_completed", "sweeps שאוחדו ודווחו", ["status"])
+SWEEP_SECONDS = Histogram(
+    "openclaw_sweep_seconds", "זמן מהשקת sweep ועד הדוח",
+    buckets=(30, 60, 120, 300, 600, 900, 1200, 1800, 3600)
+)
+
+
+def parse_labels(label_str: str) -> dict:
+    if not label_str:
+        return {}
+    return dict(pair.split("=", 1) for pair in label_str.split(","))
+
+
+class AgentMetricsCollector:
+    """חושף את המטריקות שהסוכנים צברו ב-Redis בפורמט Prometheus"""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def collect(self):
+        try:
+            counters   = self.redis.hgetall(COUNTERS_KEY)
+            histograms = self.redis.hgetall(HISTOGRAMS_KEY)
+        except Exception as e:
+            logger.warning(f"קריאת מטריקות סוכנים מ-Redis נכשלה: {e}")
+            return
+
+        yield from self.counter_families(counters)
+        yield from self.histogram_families(histograms)
+
+    def counter_families(self, counters: dict):
+        families = {}
+        for field, value in counters.items():
+            name, label_str = field.split("|", 1)
+            labels = parse_labels(label_str)
+            family = families.get(name)
+            if family is None:
+                family = families[name] = CounterMetricFamily(
+                    f"openclaw_agent_{name}", f"agent counter {name}", labels=sorted(labels)
+                )
+            family.add_metric([labels[k] for k in sorted(labels)], float(value))
+        return families.values()
+
+    def histogram_families(self, histograms: dict):
+        # series: (name, label_str) → {"buckets": {le: count}, "sum": x, "count": n}
+        series = {}
+        for field, value in histograms.items():
+            name, label_str, part = field.rsplit("|", 2)
+            entry = series.setdefault((name, label_str), {"buckets": {}, "sum": 0.0})
+            if part == "sum":
+                entry["sum"] = float(value)
+            elif part != "count":
+                entry["buckets"][part] = float(value)
+
+        families = {}
+        for (name, label_str), entry in series.items():
+            labels = parse_labels(label_str)
+            family = families.get(name)
+            if family is None:
+                family = families[name] = HistogramMetricFamily(
+                    f"openclaw_agent_{name}", f"agent histogram {name}", labels=sorted(labels)
+                )
+            bounds = sorted((float(le), le) for le in entry["buckets"] if le != "+Inf")
+            cumulative, buckets = 0.0, []
+            for _, le in bounds:
+                cumulative += entry["buckets"][le]
+                buckets.append((le, cumulative))
+            buckets.append(("+Inf", cumulative + entry["buckets"].get("+Inf", 0.0)))
+            family.add_metric([labels[k] for k in sorted(labels)], buckets, entry["sum"])
+        return families.values()
+
+
+def start_metrics_server(port: int, redis_client):
+    REGISTRY.register(AgentMetricsCollector(redis_client))
+    start_http_server(port)
+    logger.info(f"Prometheus metrics על פורט {port}")
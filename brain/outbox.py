@@ -0,0 +1,225 @@
+"""
+שירות שליחה יוצא ל-Telegram — הסוכנים כותבים ל-Redis stream וה-Brain שולח.
+
+- הודעות רצופות לאותו צ'אט (עם אותו parse_mode) מאוחדות להודעה אחת
+- scheduler שומר על מגבלות ה-flood של Telegram: הודעה לשנייה לכל צ'אט ו-~30 לשנייה בסה"כ
+- על 429 (RetryAfter) ההודעה נשארת בתור עד שמותר לשלוח שוב, ושום דבר לא נזרק
+- הודעה מאושרת (XACK) רק אחרי שנשלחה, כך שאחרי קריסה היא נשלחת מחדש
+- BadRequest / Forbidden (צ'אט לא קיים, הבוט נחסם) הם קבועים — ההודעה נזרקת בלי ניסיון חוזר
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_STREAM   = "outbox"
+OUTBOX_GROUP    = "outbox-senders"
+OUTBOX_CONSUMER = "brain"
+OUTBOX_MAXLEN   = 100000
+
+MAX_MESSAGE_LEN   = 4096
+PER_CHAT_INTERVAL = 1.0   # שניות בין הודעות לאותו צ'אט
+GLOBAL_RATE       = 25    # הודעות לשנייה — קצת מתחת ל-30 של Telegram
+MAX_ATTEMPTS      = 5
+
+
+def split_text(text: str, limit: int = MAX_MESSAGE_LEN) -> list:
+    """מפצל טקסט ארוך לחלקים של עד limit תווים, עדיף על גבול שורה"""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    chunks.append(text)
+    return chunks
+
+
+def entry_ids(entry_id: str, fields: dict) -> list:
+    """ה-id של הרשומה ועוד ids של הודעות שכבר אוחדו לתוכה בניסיון קודם"""
+    merged = fields.get("merged_ids")
+    return [entry_id] + (merged.split(",") if merged else [])
+
+
+def coalesce(pending: deque) -> tuple:
+    """
+    לוקח מתחילת התור של צ'אט את ההודעות הרצופות שאפשר לאחד.
+    מחזיר (ids, text, parse_mode, first_entry)
+    """
+    entry_id, fields = pending.popleft()
+    ids        = entry_ids(entry_id, fields)
+    parse_mode = fields.get("parse_mode") or None
+    parts      = [fields["text"]]
+    length     = len(fields["text"])
+    first      = fields
+
+    while pending:
+        next_id, next_fields = pending[0]
+        if (next_fields.get("parse_mode") or None) != parse_mode:
+            break
+        if length + 2 + len(next_fields["text"]) > MAX_MESSAGE_LEN:
+            break
+        pending.popleft()
+        ids.extend(entry_ids(next_id, next_fields))
+        parts.append(next_fields["text"])
+        length += 2 + len(next_fields["text"])
+
+    return ids, "\n\n".join(parts), parse_mode, first
+
+
+class OutboxDispatcher:
+    def __init__(self, bot, redis_client, tracer=None):
+        self.bot          = bot
+        self.redis        = redis_client   # redis.asyncio
+        self.tracer       = tracer
+        self.pending      = {}             # chat_id → deque[(entry_id, fields)]
+        self.next_allowed = {}             # chat_id → epoch seconds
+        self.attempts     = {}             # entry_id → ניסיונות שנכשלו
+        self.tokens       = float(GLOBAL_RATE)
+        self.refilled_at  = time.monotonic()
+
+    async def ensure_group(self):
+        try:
+            await self.redis.xgroup_create(OUTBOX_STREAM, OUTBOX_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def enqueue_local(self, entries: list):
+        for entry_id, fields in entries:
+            self.pending.setdefault(fields["chat_id"], deque()).append((entry_id, fields))
+
+    async def read(self, stream_id: str, block_ms: int = None) -> str:
+        """קורא עד 200 רשומות. מחזיר את ה-id האחרון שנקרא, או None אם לא היה כלום"""
+        response = await self.redis.xreadgroup(
+            OUTBOX_GROUP, OUTBOX_CONSUMER, {OUTBOX_STREAM: stream_id}, count=200, block=block_ms
+        )
+        last_id = None
+        for _, entries in response or []:
+            if not entries:
+                continue
+            last_id = entries[-1][0]
+            # רשומה שנקראה ונמחקה מה-stream (maxlen) חוזרת בלי שדות — אין מה לשלוח
+            trimmed = [entry_id for entry_id, fields in entries if not fields]
+            if trimmed:
+                await self.redis.xack(OUTBOX_STREAM, OUTBOX_GROUP, *trimmed)
+            self.enqueue_local([(entry_id, fields) for entry_id, fields in entries if fields])
+        return last_id
+
+    def take_global_token(self) -> bool:
+        now = time.monotonic()
+        self.tokens      = min(GLOBAL_RATE, self.tokens + (now - self.refilled_at) * GLOBAL_RATE)
+        self.refilled_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def ready_chats(self) -> list:
+        """צ'אטים שיש להם הודעות ומותר לשלוח להם עכשיו — הוותיק קודם"""
+        now   = time.time()
+        ready = [chat for chat, queue in self.pending.items()
+                 if queue and self.next_allowed.get(chat, 0) <= now]
+        ready.sort(key=lambda chat: self.pending[chat][0][0])
+        return ready
+
+    def next_wakeup_ms(self) -> int:
+        waiting = [self.next_allowed.get(chat, 0) for chat, queue in self.pending.items() if queue]
+        if not waiting:
+            return 1000
+        return max(1, min(1000, int((min(waiting) - time.time()) * 1000)))
+
+    async def deliver(self, chat_id: str):
+        queue = self.pending[chat_id]
+        ids, text, parse_mode, first = coalesce(queue)
+        # חלקים שכבר נשלחו לא נשלחים שוב אם יש 429 באמצע
+        remaining = split_text(text)
+        try:
+            while remaining:
+                try:
+                    await self.bot.send_message(chat_id=chat_id, text=remaining[0], parse_mode=parse_mode)
+                except BadRequest as e:
+                    # בדרך כלל Markdown שבור — שולחים כטקסט רגיל במקום לאבד את ההודעה
+                    if parse_mode is None:
+                        raise
+                    logger.warning(f"שליחה עם {parse_mode} נכשלה ({e}), שולח כטקסט רגיל")
+                    await self.bot.send_message(chat_id=chat_id, text=remaining[0])
+                remaining.pop(0)
+        except RetryAfter as e:
+            metrics.OUTBOX_RETRIES.labels(reason="429").inc()
+            self.next_allowed[chat_id] = time.time() + float(e.retry_after)
+            self.requeue(queue, ids, "\n".join(remaining), parse_mode, first)
+            return
+        except (BadRequest, Forbidden) as e:
+            # ניסיון חוזר לא יעזור, ורק יעכב את שאר התור של הצ'אט
+            logger.error(f"הודעה ל-{chat_id} נדחתה, מוותר: {e}")
+            await self.drop(chat_id, ids)
+            return
+        except TelegramError as e:
+            attempts = self.attempts.get(ids[0], 0) + 1
+            if attempts < MAX_ATTEMPTS:
+                metrics.OUTBOX_RETRIES.labels(reason="error").inc()
+                self.attempts[ids[0]] = attempts
+                self.next_allowed[chat_id] = time.time() + 2 ** attempts
+                self.requeue(queue, ids, "\n".join(remaining), parse_mode, first)
+                return
+            logger.error(f"הודעה ל-{chat_id} נכשלה {attempts} פעמים, מוותר: {e}")
+            await self.drop(chat_id, ids)
+            return
+
+        await self.ack(chat_id, ids)
+
+        now = time.time()
+        metrics.OUTBOX_SENT.inc()
+        metrics.OUTBOX_COALESCED.inc(len(ids) - 1)
+        enqueued_at = float(first.get("enqueued_at", now))
+        metrics.OUTBOX_DELIVERY_SECONDS.observe(now - enqueued_at)
+        if self.tracer and first.get("trace_id"):
+            # ה-tracer עובד על Redis הסינכרוני — לא חוסמים את לולאת השליחה
+            await asyncio.to_thread(self.tracer.record, first["trace_id"], first.get("role", "unknown"),
+                                    "telegram_delivery", enqueued_at, now)
+
+    async def ack(self, chat_id: str, ids: list):
+        await self.redis.xack(OUTBOX_STREAM, OUTBOX_GROUP, *ids)
+        for entry_id in ids:
+            self.attempts.pop(entry_id, None)
+        self.next_allowed[chat_id] = time.time() + PER_CHAT_INTERVAL
+
+    async def drop(self, chat_id: str, ids: list):
+        """מאשר הודעה שלא תישלח — כדי שלא תחזור אחרי ריסטארט"""
+        metrics.OUTBOX_DROPPED.inc()
+        await self.ack(chat_id, ids)
+
+    def requeue(self, queue: deque, ids: list, text: str, parse_mode: str, first: dict):
+        """מחזיר את ההודעה המאוחדת לראש התור — תחת ה-id הראשון, עם כל ה-ids לאישור"""
+        fields = {**first, "text": text, "parse_mode": parse_mode or "", "merged_ids": ",".join(ids[1:])}
+        queue.appendleft((ids[0], fields))
+
+    async def run(self):
+        await self.ensure_group()
+        # הודעות שנקראו ולא אושרו לפני ריסטארט — בעמודים של 200, עד שהרשימה נגמרת
+        last_id = "0"
+        while last_id:
+            last_id = await self.read(last_id)
+        logger.info("Outbox dispatcher עלה")
+
+        while True:
+            try:
+                await self.read(">", block_ms=self.next_wakeup_ms())
+                for chat_id in self.ready_chats():
+                    if not self.take_global_token():
+                        await asyncio.sleep(1 / GLOBAL_RATE)
+                        break
+                    await self.deliver(chat_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"שגיאה ב-outbox dispatcher: {e}", exc_info=True)
+                await asyncio.sleep(1)
@@ -0,0 +1,236 @@
+"""
+תזמון Jobs של סוכנים לפי עדיפות — כדי שעסקה לא תחכה מאחורי backtest.
+
+כל role מקבל פרופיל: עדיפות, כמה Jobs במקביל מותר לו, משאבים ו-PriorityClass.
+בקשות נכנסות לתור ב-Redis (ZSET לפי עדיפות ואז זמן), ובכל סבב מפעילים
+מהתור את מה שנכנס גם במגבלת ה-role וגם במקום שנשאר ב-ResourceQuota.
+roles בעדיפות נמוכה משאירים תמיד מקום ל-trader אחד, כך שעסקה יוצאת מיד
+גם כשה-cluster עמוס.
+"""
+import json
+import time
+import asyncio
+import logging
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_KEY = "scheduler:queue"
+JOBS_KEY  = "scheduler:jobs"
+
+SCHEDULE_INTERVAL = 2.0   # שניות בין סבבים כשיש תור
+PRIORITY_STEP     = 10 ** 12   # score = priority * PRIORITY_STEP + זמן הכניסה
+
+ROLE_PROFILES = {
+    "trader": {
+        "priority": 0, "max_concurrent": 3, "priority_class": "openclaw-trader",
+        "requests": {"memory": "256Mi", "cpu": "250m"},
+        "limits":   {"memory": "512Mi", "cpu": "500m"}
+    },
+    "scanner": {
+        "priority": 1, "max_concurrent": 1, "priority_class": "openclaw-scanner",
+        "requests": {"memory": "256Mi", "cpu": "250m"},
+        "limits":   {"memory": "512Mi", "cpu": "500m"}
+    },
+    "analyst": {
+        "priority": 2, "max_concurrent": 4, "priority_class": "openclaw-analyst",
+        "requests": {"memory": "128Mi", "cpu": "100m"},
+        "limits":   {"memory": "256Mi", "cpu": "500m"}
+    },
+    "backtest": {
+        "priority": 3, "max_concurrent": 1, "priority_class": "openclaw-batch",
+        "service_account": "backtest-sa",   # משיק את ה-Indexed Job של sweep
+        "requests": {"memory": "512Mi", "cpu": "500m"},
+        "limits":   {"memory": "1Gi",   "cpu": "1"}
+    },
+    "researcher": {
+        "priority": 4, "max_concurrent": 2, "priority_class": "openclaw-research",
+        "requests": {"memory": "128Mi", "cpu": "100m"},
+        "limits":   {"memory": "256Mi", "cpu": "250m"}
+    }
+}
+# coder / summarizer רצים כמו researcher
+ROLE_PROFILES["coder"]      = ROLE_PROFILES["researcher"]
+ROLE_PROFILES["summarizer"] = ROLE_PROFILES["researcher"]
+
+
+def profile_for(role: str) -> dict:
+    return ROLE_PROFILES.get(role, ROLE_PROFILES["researcher"])
+
+
+def parse_cpu(value: str) -> float:
+    """"250m" → 250, "1" → 1000 (millicores)"""
+    value = str(value)
+    if value.endswith("m"):
+        return float(value[:-1])
+    return float(value) * 1000
+
+
+MEMORY_UNITS = {"Ki": 2 ** 10, "Mi": 2 ** 20, "Gi": 2 ** 30, "K": 10 ** 3, "M": 10 ** 6, "G": 10 ** 9}
+
+
+def parse_memory(value: str) -> float:
+    """"256Mi" → bytes"""
+    value = str(value)
+    for unit, factor in MEMORY_UNITS.items():
+        if value.endswith(unit):
+            return float(value[:-len(unit)]) * factor
+    return float(value)
+
+
+# כל מה ש-openclaw-quota אוכף — המפתחות כמו ב-ResourceQuota, עם ה-parser של כל אחד
+QUOTA_RESOURCES = {
+    "requests.cpu":     parse_cpu,
+    "requests.memory":  parse_memory,
+    "limits.cpu":       parse_cpu,
+    "limits.memory":    parse_memory,
+    "pods":             float,
+    "count/jobs.batch": float
+}
+
+
+def demand(profile: dict, pods: int = 1) -> dict:
+    """מה Job של הפרופיל צורך מה-quota — pods הוא מספר ה-pods שרצים במקביל"""
+    return {
+        "requests.cpu":     parse_cpu(profile["requests"]["cpu"]) * pods,
+        "requests.memory":  parse_memory(profile["requests"]["memory"]) * pods,
+        "limits.cpu":       parse_cpu(profile["limits"]["cpu"]) * pods,
+        "limits.memory":    parse_memory(profile["limits"]["memory"]) * pods,
+        "pods":             pods,
+        "count/jobs.batch": 1
+    }
+
+
+# המקום ש-roles אחרים חייבים להשאיר פנוי — Job אחד של trader
+TRADER_RESERVE = demand(ROLE_PROFILES["trader"])
+
+
+def fits(headroom: dict, need: dict, reserve: dict = None) -> bool:
+    for resource, amount in need.items():
+        if resource not in headroom:
+            continue
+        if headroom[resource] - amount < (reserve or {}).get(resource, 0):
+            return False
+    return True
+
+
+def job_finished(status) -> bool:
+    """
+    האם ה-Job הסתיים — לפי condition סופי (Complete / Failed). status.failed סופר גם
+    pods שנכשלו כשה-Job עוד מנסה שוב תחת backoffLimit, אז הוא לא סימן לסיום
+    """
+    conditions = (status.conditions if status else None) or []
+    return any(c.type in ("Complete", "Failed") and c.status == "True" for c in conditions)
+
+
+class JobScheduler:
+    """
+    launch(task, role, chat_id, job_id) — יוצר את ה-Job בפועל (create_agent_job),
+    on_error(task, role, chat_id, job_id) — נקרא כשה-launch נכשל (ה-Job יצא מהתור),
+    batch_api / core_api — ה-clients של Kubernetes, לקריאת Jobs פעילים ו-ResourceQuota.
+    """
+
+    def __init__(self, redis_client, batch_api, core_api, launch, on_error=None,
+                 namespace: str = "default", quota_name: str = "openclaw-quota"):
+        self.redis      = redis_client
+        self.batch      = batch_api
+        self.core       = core_api
+        self.launch     = launch
+        self.on_error   = on_error
+        self.namespace  = namespace
+        self.quota_name = quota_name
+        self.lock       = asyncio.Lock()
+
+    async def submit(self, task: str, role: str, chat_id: int, job_id: str) -> int:
+        """
+        מכניס לתור ומנסה להפעיל מיד. מחזיר 0 אם ה-Job יצא לדרך,
+        אחרת את המקום בתור.
+        """
+        profile = profile_for(role)
+        job     = {"task": task, "role": role, "chat_id": chat_id, "enqueued_at": time.time()}
+        pipe    = self.redis.pipeline(transaction=False)
+        pipe.hset(JOBS_KEY, job_id, json.dumps(job))
+        pipe.zadd(QUEUE_KEY, {job_id: profile["priority"] * PRIORITY_STEP + job["enqueued_at"]})
+        pipe.execute()
+
+        await self.dispatch()
+        rank = self.redis.zrank(QUEUE_KEY, job_id)
+        return 0 if rank is None else rank + 1
+
+    def running_by_role(self) -> dict:
+        """Jobs של סוכנים שעוד לא הסתיימו, לפי ה-label role"""
+        jobs    = self.batch.list_namespaced_job(self.namespace, label_selector="app=openclaw-agent")
+        running = {}
+        for job in jobs.items:
+            if job_finished(job.status):
+                continue
+            role = (job.metadata.labels or {}).get("role", "unknown")
+            running[role] = running.get(role, 0) + 1
+        return running
+
+    def headroom(self) -> dict:
+        """כמה נשאר ב-ResourceQuota. בלי גישה ל-quota — רק מגבלות ה-role חלות"""
+        try:
+            quota = self.core.read_namespaced_resource_quota(self.quota_name, self.namespace)
+        except Exception as e:
+            logger.warning(f"קריאת ResourceQuota נכשלה ({e}), מתזמן רק לפי מגבלות ה-role")
+            return {}
+        hard, used = quota.status.hard or {}, quota.status.used or {}
+        return {resource: parse(hard[resource]) - parse(used.get(resource, "0"))
+                for resource, parse in QUOTA_RESOURCES.items() if resource in hard}
+
+    async def dispatch(self):
+        """סבב אחד: מפעיל מהתור, לפי עדיפות, כל מה שיש לו מקום"""
+        async with self.lock:
+            queued = self.redis.zrange(QUEUE_KEY, 0, -1)
+            if not queued:
+                self.update_depth([])
+                return
+            running  = await asyncio.to_thread(self.running_by_role)
+            headroom = await asyncio.to_thread(self.headroom)
+            payloads = self.redis.hmget(JOBS_KEY, queued)
+
+            waiting = []
+            for job_id, payload in zip(queued, payloads):
+                if payload is None:
+                    self.redis.zrem(QUEUE_KEY, job_id)
+                    continue
+                job     = json.loads(payload)
+                role    = job["role"]
+                profile = profile_for(role)
+                need    = demand(profile)
+                reserve = None if role == "trader" else TRADER_RESERVE
+                if running.get(role, 0) >= profile["max_concurrent"] or not fits(headroom, need, reserve):
+                    waiting.append(role)
+                    continue
+
+                self.redis.zrem(QUEUE_KEY, job_id)
+                self.redis.hdel(JOBS_KEY, job_id)
+                try:
+                    await asyncio.to_thread(self.launch, job["task"], role, job["chat_id"], job_id)
+                except Exception as e:
+                    logger.error(f"הפעלת Job {job_id} ({role}) נכשלה: {e}")
+                    if self.on_error:
+                        await asyncio.to_thread(self.on_error, job["task"], role, job["chat_id"], job_id)
+                    continue
+                metrics.SCHEDULER_WAIT_SECONDS.labels(role=role).observe(time.time() - job["enqueued_at"])
+                running[role] = running.get(role, 0) + 1
+                for resource in headroom:
+                    headroom[resource] -= need.get(resource, 0)
+
+            self.update_depth(waiting)
+
+    def update_depth(self, waiting: list):
+        for role in set(ROLE_PROFILES) | set(waiting):
+            metrics.SCHEDULER_QUEUE_DEPTH.labels(role=role).set(waiting.count(role))
+
+    async def run(self):
+        """לולאה ברקע — כל עוד יש תור, מנסה שוב כל SCHEDULE_INTERVAL שניות"""
+        logger.info("Job scheduler פעיל")
+        while True:
+            await asyncio.sleep(SCHEDULE_INTERVAL)
+            try:
+                await self.dispatch()
+            except Exception as e:
+                logger.error(f"סבב תזמון נכשל: {e}")
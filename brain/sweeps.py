@@ -0,0 +1,109 @@
+"""
+איחוד תוצאות של sweeps — ה-shards (agent/sweep.py) כותבים כל אחד את התוצאות
+שלו ל-sweep:{id}:results, וה-Brain בודק כל SWEEP_POLL_INTERVAL שניות את
+ה-sweeps הפעילים. כשכל ה-shards סיימו (או שעבר ה-deadline — ואז מדווחים על
+מה שיש), מדרגים את כל הקונפיגורציות ושולחים את הטובות ל-Telegram דרך ה-outbox.
+"""
+import json
+import time
+import asyncio
+import logging
+
+import metrics
+from outbox import OUTBOX_STREAM, OUTBOX_MAXLEN
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_KEY = "sweeps:active"
+
+SWEEP_POLL_INTERVAL = 5.0
+TOP_CONFIGS         = 5
+
+
+def sweep_key(sweep_id: str, part: str = None) -> str:
+    return f"sweep:{sweep_id}:{part}" if part else f"sweep:{sweep_id}"
+
+
+def merge(shard_results: dict, configs: list) -> list:
+    """
+    {shard: json של [{"i", "return", "drawdown", ...}]} → שורה לכל קונפיגורציה שהצליחה,
+    מהתשואה הגבוהה לנמוכה (ב-drawdown קטן יותר בשוויון)
+    """
+    rows = []
+    for raw in shard_results.values():
+        for row in json.loads(raw):
+            if "error" in row:
+                continue
+            rows.append({**row, "params": configs[row["i"]]})
+    rows.sort(key=lambda row: (-row["return"], row["drawdown"]))
+    return rows
+
+
+def report(meta: dict, rows: list, shards_done: int) -> str:
+    shards = int(meta["shards"])
+    lines  = [
+        f"🧪 *תוצאות Sweep* — {meta['start_date']} → {meta['end_date']}",
+        f"{len(rows)}/{len(json.loads(meta['configs']))} קונפיגורציות, {shards_done}/{shards} shards"
+        f" ב-{time.time() - float(meta['created_at']):.0f} שניות"
+    ]
+    if shards_done < shards:
+        lines.append("⚠️ חלק מה-shards לא סיימו בזמן — התוצאות חלקיות")
+    if not rows:
+        lines.append("\n❌ אף קונפיגורציה לא ביצעה עסקאות")
+        return "\n".join(lines)
+
+    lines.append("")
+    for rank, row in enumerate(rows[:TOP_CONFIGS], 1):
+        params = " ".join(f"{name}={value}" for name, value in row["params"].items())
+        lines.append(
+            f"{rank}. *{row['return']:+.1f}%* | DD -{row['drawdown']}% | {row['trades']} עסקאות | Win {row['win_rate']}%\n"
+            f"   `{params}`"
+        )
+    return "\n".join(lines)
+
+
+class SweepMerger:
+    def __init__(self, redis_client):
+        self.redis = redis_client   # redis.asyncio
+
+    async def check(self, sweep_id: str):
+        meta = await self.redis.hgetall(sweep_key(sweep_id))
+        if not meta:
+            await self.redis.srem(ACTIVE_KEY, sweep_id)
+            return
+
+        shard_results = await self.redis.hgetall(sweep_key(sweep_id, "results"))
+        if len(shard_results) < int(meta["shards"]) and time.time() < float(meta["deadline"]):
+            return
+        # srem הוא ה-claim — רק מי שהוציא את ה-sweep מהסט מדווח עליו
+        if not await self.redis.srem(ACTIVE_KEY, sweep_id):
+            return
+
+        rows   = merge(shard_results, json.loads(meta["configs"]))
+        status = "done" if len(shard_results) >= int(meta["shards"]) else "partial"
+        await self.redis.xadd(OUTBOX_STREAM, {
+            "chat_id":     meta["chat_id"],
+            "text":        report(meta, rows, len(shard_results)),
+            "parse_mode":  "Markdown",
+            "enqueued_at": f"{time.time():.6f}",
+            "trace_id":    sweep_id,
+            "role":        "sweep"
+        }, maxlen=OUTBOX_MAXLEN, approximate=True)
+        await self.redis.hset(sweep_key(sweep_id), mapping={
+            "status": status,
+            "top":    json.dumps(rows[:TOP_CONFIGS])
+        })
+        metrics.SWEEPS_COMPLETED.labels(status=status).inc()
+        metrics.SWEEP_SECONDS.observe(time.time() - float(meta["created_at"]))
+        logger.info(f"Sweep {sweep_id} הושלם: {len(rows)} קונפיגורציות מ-{len(shard_results)} shards")
+
+    async def run(self):
+        """לולאה ברקע — בודקת את כל ה-sweeps הפעילים כל SWEEP_POLL_INTERVAL שניות"""
+        logger.info("Sweep merger פעיל")
+        while True:
+            await asyncio.sleep(SWEEP_POLL_INTERVAL)
+            try:
+                for sweep_id in await self.redis.smembers(ACTIVE_KEY):
+                    await self.check(sweep_id)
+            except Exception as e:
+                logger.error(f"בדיקת sweeps נכשלה: {e}")
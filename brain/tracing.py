@@ -0,0 +1,92 @@
+"""
+מעקב זמנים (tracing) ב-Brain — פותח trace לכל הודעה ומסכם p50/p95 לכל שלב.
+
+ה-trace ID הוא ה-JOB_ID שעובר לסוכן, והסוכן כותב את ה-spans שלו
+לאותו stream (ראה agent/tracing.py).
+"""
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACE_STREAM  = "traces"
+TRACE_MAXLEN  = 100000
+TRACE_TTL     = 3600
+SUMMARY_COUNT = 20000
+
+
+class Tracer:
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def start_trace(self, trace_id: str) -> float:
+        """מסמן את תחילת ה-trace — הסוכן מחשב ממנו end_to_end"""
+        now = time.time()
+        key = f"trace:{trace_id}"
+        self.redis.hset(key, mapping={"start": f"{now:.6f}"})
+        self.redis.expire(key, TRACE_TTL)
+        return now
+
+    def mark(self, trace_id: str, field: str, ts: float = None):
+        """שומר חותמת זמן על ה-trace (למשל job_created, שממנה נמדד pod_startup)"""
+        self.redis.hset(f"trace:{trace_id}", field, f"{ts or time.time():.6f}")
+
+    def record(self, trace_id: str, role: str, stage: str, start: float, end: float):
+        try:
+            self.redis.xadd(TRACE_STREAM, {
+                "trace_id":    trace_id,
+                "role":        role,
+                "stage":       stage,
+                "start":       f"{start:.6f}",
+                "duration_ms": f"{(end - start) * 1000:.3f}"
+            }, maxlen=TRACE_MAXLEN, approximate=True)
+        except Exception as e:
+            logger.warning(f"כתיבת span נכשלה: {e}")
+
+    @contextmanager
+    def span(self, trace_id: str, role: str, stage: str):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(trace_id, role, stage, start, time.time())
+
+    def summarize(self, count: int = SUMMARY_COUNT) -> dict:
+        """מחזיר {role: {stage: {"p50", "p95", "n"}}} מתוך ה-spans האחרונים"""
+        entries   = self.redis.xrevrange(TRACE_STREAM, count=count)
+        durations = {}
+        for _, fields in entries:
+            key = (fields.get("role", "unknown"), fields.get("stage", "unknown"))
+            durations.setdefault(key, []).append(float(fields.get("duration_ms", 0)))
+
+        summary = {}
+        for (role, stage), values in durations.items():
+            values.sort()
+            summary.setdefault(role, {})[stage] = {
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "n":   len(values)
+            }
+        return summary
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """nearest-rank על רשימה ממוינת"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def format_summary(summary: dict) -> str:
+    if not summary:
+        return "📭 אין עדיין נתוני latency."
+    lines = ["⏱️ Latency לפי שלב (p50 / p95):\n"]
+    for role in sorted(summary):
+        lines.append(f"[{role}]")
+        stages = sorted(summary[role].items(), key=lambda item: item[1]["p95"], reverse=True)
+        for stage, stats in stages:
+            lines.append(f"  {stage}: {stats['p50']:.0f}ms / {stats['p95']:.0f}ms (n={stats['n']})")
+        lines.append("")
+    return "\n".join(lines)